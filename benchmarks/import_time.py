@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Name: statement run in a fresh interpreter
+TARGETS = {
+    'package': 'import src.osm_osw_reformatter',
+    'normalizers': 'import src.osm_osw_reformatter.serializer.osw.osw_normalizer',
+    'osm2osw': 'from src.osm_osw_reformatter.osm2osw.osm2osw import OSM2OSW',
+    'osw2osm': 'from src.osm_osw_reformatter.osw2osm.osw2osm import OSW2OSM',
+    'osm2osw_first_use': 'from src.osm_osw_reformatter.serializer.osm.osm_graph import OSMGraph',
+    'osw2osm_first_use': 'import ogr2osm; from src.osm_osw_reformatter.serializer.osm.osm_normalizer import OSMNormalizer',
+}
+
+# Heavy dependencies reported as loaded or not per target
+HEAVY_MODULES = ('osmium', 'networkx', 'shapely', 'pyproj', 'numpy', 'ogr2osm', 'osgeo')
+
+
+def _run(statement: str) -> dict:
+    code = (
+        'import sys, time, json\n'
+        'start = time.perf_counter()\n'
+        f'{statement}\n'
+        'elapsed = time.perf_counter() - start\n'
+        f'print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n'
+    )
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    process_seconds = time.perf_counter() - start
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_seconds'] = process_seconds
+    return result
+
+
+def measure(targets=None, repeat: int = 5) -> dict:
+    '''Imports every target in `repeat` fresh interpreters and reports the
+    median import time, the median interpreter wall time and which heavy
+    dependencies were loaded.
+
+    '''
+    targets = targets or list(TARGETS)
+    baseline = statistics.median(_run('pass')['process_seconds'] for _ in range(repeat))
+    results = {}
+    for name in targets:
+        runs = [_run(TARGETS[name]) for _ in range(repeat)]
+        results[name] = {
+            'import_seconds': statistics.median(run['seconds'] for run in runs),
+            'process_seconds': statistics.median(run['process_seconds'] for run in runs) - baseline,
+            'loaded': runs[0]['loaded']
+        }
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'repeat': repeat,
+        'interpreter_seconds': baseline,
+        'results': results
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the cold start import time of the package')
+    parser.add_argument('--targets', nargs='+', choices=list(TARGETS), default=None)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='benchmark-imports.json', help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    report = measure(args.targets, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, result in report['results'].items():
+        print(f'{name:<20} {result["import_seconds"] * 1000:>8.1f} ms  loads {", ".join(result["loaded"]) or "-"}')
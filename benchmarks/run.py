@@ -0,0 +1,265 @@
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import asyncio
+import zipfile
+import platform
+import argparse
+import tempfile
+import traceback
+import multiprocessing
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.synthetic import generate  # noqa: E402
+from src.osm_osw_reformatter.version import __version__  # noqa: E402
+from src.osm_osw_reformatter.helpers.hooks import PipelineHook  # noqa: E402
+from src.osm_osw_reformatter.helpers.metrics import peak_rss  # noqa: E402
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DIRECTIONS = ('osm2osw', 'osw2osm')
+
+
+def reset_peak_rss() -> None:
+    '''Resets the peak RSS of the process where the kernel allows it, so
+    every stage reports its own peak.
+
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+class StageTimer:
+    def __init__(self) -> None:
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        gc.collect()
+        reset_peak_rss()
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.stages[name] = {
+                'wall': time.perf_counter() - start,
+                'cpu': time.process_time() - start_cpu,
+                'peak_rss': peak_rss()
+            }
+
+    def summary(self, entities: int) -> dict:
+        wall = sum(stage['wall'] for stage in self.stages.values())
+        return {
+            'stages': self.stages,
+            'wall': wall,
+            'throughput': entities / wall if wall else None,
+            'peak_rss': max((stage['peak_rss'] for stage in self.stages.values()), default=None)
+        }
+
+
+class StageRSSHook(PipelineHook):
+    '''Gives the stages of a conversion their own peak RSS, as StageTimer
+    does for the stages timed here.
+
+    '''
+
+    def stage_start(self, metrics, stage: str) -> None:
+        gc.collect()
+        reset_peak_rss()
+
+
+async def _osm2osw(osm_file: str, workdir: str, timer: StageTimer, entity_types=None, tiles=None, processes=None):
+    from src.osm_osw_reformatter.helpers.osw import OSWHelper
+
+    entity_types = OSWHelper.select_entity_types(entity_types)
+    if tiles:
+        # Split, tile processes and stitching; peak RSS is the parent's
+        with timer.stage('tiled'):
+            OG = await OSWHelper.get_tiled_osm_graph(osm_file, workdir, tiles, processes, entity_types=entity_types)
+        with timer.stage('to_geojson'):
+            return await OSWHelper.write_og(workdir, 'bench', OG, entity_types=entity_types)
+    with timer.stage('parse'):
+        OG = await OSWHelper.get_osm_graph(osm_file, entity_types=entity_types)
+    with timer.stage('simplify'):
+        await OSWHelper.simplify_og(OG)
+    with timer.stage('construct_geometries'):
+        await OSWHelper.construct_geometries(OG)
+    with timer.stage('to_geojson'):
+        return await OSWHelper.write_og(workdir, 'bench', OG, entity_types=entity_types)
+
+
+def _osw2osm(zip_file: str, workdir: str, timer: StageTimer):
+    from src.osm_osw_reformatter.osw2osm.osw2osm import OSW2OSM
+
+    # OSW2OSM times its own stages
+    result = OSW2OSM(zip_file_path=zip_file, workdir=workdir, prefix='bench', hooks=[StageRSSHook()]).convert()
+    timer.stages.update(result.metrics['stages'])
+    if not result.status:
+        raise RuntimeError(result.error)
+
+
+def _run_size(nodes: int, seed: int, workdir: str, directions, buildings: int = 0, entity_types=None, tiles=None,
+              processes=None) -> list:
+    '''Benchmarks one input size. Runs in its own process, so that peak RSS
+    is not inherited from a larger size.
+
+    '''
+    os.makedirs(workdir, exist_ok=True)
+    osm_file = str(Path(workdir, f'grid-{nodes}.osm.pbf'))
+    start = time.perf_counter()
+    grid = generate(osm_file, nodes, seed, buildings)
+    generate_time = time.perf_counter() - start
+
+    results = []
+    base = {
+        'size': nodes,
+        'nodes': grid.n_nodes,
+        'ways': grid.n_ways,
+        'buildings': grid.n_buildings,
+        'input_bytes': os.path.getsize(osm_file),
+        'generate_wall': generate_time
+    }
+
+    geojson_files = None
+    if 'osm2osw' in directions or 'osw2osm' in directions:
+        timer = StageTimer()
+        result = {**base, 'direction': 'osm2osw', 'status': True, 'error': None}
+        try:
+            geojson_files = asyncio.run(_osm2osw(osm_file, workdir, timer, entity_types, tiles, processes))
+        except Exception as error:
+            traceback.print_exc()
+            result.update(status=False, error=str(error))
+        result.update(timer.summary(grid.n_nodes))
+        if 'osm2osw' in directions:
+            results.append(result)
+
+    if 'osw2osm' in directions and geojson_files:
+        zip_file = str(Path(workdir, f'grid-{nodes}.zip'))
+        with zipfile.ZipFile(zip_file, 'w') as zf:
+            for file in geojson_files:
+                zf.write(file, os.path.basename(file))
+                os.remove(file)
+        timer = StageTimer()
+        result = {**base, 'direction': 'osw2osm', 'status': True, 'error': None,
+                  'input_bytes': os.path.getsize(zip_file)}
+        try:
+            _osw2osm(zip_file, workdir, timer)
+        except Exception as error:
+            result.update(status=False, error=str(error))
+        result.update(timer.summary(grid.n_nodes))
+        results.append(result)
+
+    return results
+
+
+def run(sizes, output: str, workdir: str = None, seed: int = 0, directions=DIRECTIONS, keep: bool = False,
+        buildings: int = 0, entity_types=None, tiles=None, processes=None) -> dict:
+    '''Runs the benchmarks for every size and writes the results to output
+    as JSON. `buildings` footprints per block and `entity_types` including
+    zones and polygons benchmark area extraction. `tiles` runs OSM to OSW
+    in tiled mode on `processes` processes.
+
+    '''
+    own_workdir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='osw-bench-')
+    report = {
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'seed': seed,
+        'entity_types': list(entity_types) if entity_types else None,
+        'tiles': tiles,
+        'processes': processes,
+        'results': []
+    }
+    ctx = multiprocessing.get_context('spawn')
+    try:
+        for size in sizes:
+            print(f'Benchmarking {size} nodes...')
+            size_dir = str(Path(workdir, str(size)))
+            # Unlike Pool workers, executor processes may start the tile processes
+            with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+                results = pool.submit(_run_size, size, seed, size_dir, tuple(directions), buildings, entity_types,
+                                      tiles, processes).result()
+            for result in results:
+                print(f'  {result["direction"]}: {result["wall"]:.2f}s, {result["peak_rss"] / 1024 ** 2:.0f} MiB peak'
+                      f'{"" if result["status"] else " (failed: " + str(result["error"]) + ")"}')
+            report['results'].extend(results)
+            if not keep:
+                shutil.rmtree(size_dir, ignore_errors=True)
+    finally:
+        if own_workdir and not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def _ratio(new, old):
+    return new / old if new is not None and old else None
+
+
+def compare(baseline: str, current: str) -> list:
+    '''Wall time and peak RSS ratios of current over baseline, per size,
+    direction and stage. A ratio is None where the baseline has no
+    measurement.
+
+    '''
+    with open(baseline) as f:
+        before = {(r['size'], r['direction']): r for r in json.load(f)['results']}
+    with open(current) as f:
+        after = {(r['size'], r['direction']): r for r in json.load(f)['results']}
+
+    rows = []
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        for stage in [stage for stage in new['stages'] if stage in old['stages']]:
+            rows.append({
+                'size': key[0],
+                'direction': key[1],
+                'stage': stage,
+                'wall': _ratio(new['stages'][stage]['wall'], old['stages'][stage]['wall']),
+                'peak_rss': _ratio(new['stages'][stage]['peak_rss'], old['stages'][stage]['peak_rss'])
+            })
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark OSM to OSW and OSW to OSM conversions')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Approximate number of nodes per synthetic input, 10k to 10M')
+    parser.add_argument('--directions', nargs='+', choices=DIRECTIONS, default=list(DIRECTIONS))
+    parser.add_argument('--output', default='benchmark.json', help='JSON file to write the results to')
+    parser.add_argument('--workdir', default=None, help='Directory for inputs and outputs, a temporary one by default')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true', help='Keep generated inputs and outputs')
+    parser.add_argument('--compare', metavar='BASELINE', default=None,
+                        help='Print ratios of the new results over an earlier results file')
+    parser.add_argument('--buildings', type=int, default=0, help='Building footprints per block')
+    parser.add_argument('--entity-types', nargs='+', default=None,
+                        help='OSW entity types to produce, add zones and polygons to benchmark areas')
+    parser.add_argument('--tiles', type=int, default=None, help='Convert OSM to OSW in this many parallel tiles')
+    parser.add_argument('--processes', type=int, default=None, help='Processes converting tiles')
+    args = parser.parse_args()
+
+    run(args.sizes, args.output, args.workdir, args.seed, args.directions, args.keep, args.buildings,
+        args.entity_types, args.tiles, args.processes)
+    if args.compare:
+        for row in compare(args.compare, args.output):
+            wall, rss = (f'x{row[field]:.2f}' if row[field] is not None else 'n/a' for field in ('wall', 'peak_rss'))
+            print(f'{row["size"]:>10} {row["direction"]:<8} {row["stage"]:<22} wall {wall} peak rss {rss}')
@@ -0,0 +1,211 @@
+import math
+import random
+import argparse
+import osmium
+
+# South west corner of the generated grid, somewhere in Seattle
+ORIGIN = (-122.35, 47.60)
+# Block size in degrees, roughly 100 m in both directions at that latitude
+BLOCK_LON = 0.0013
+BLOCK_LAT = 0.0009
+# Shape nodes between two corners of a sidewalk
+SHAPE_NODES = 2
+# Every CROSSING_EVERY-th column of the grid has crossings instead of sidewalks
+# on every other row, with lowered kerbs at both ends
+CROSSING_EVERY = 4
+# Every FENCE_EVERY-th block gets a fence line
+FENCE_EVERY = 10
+FENCE_NODES = 3
+# Corners of a building footprint, its way closes the ring
+BUILDING_NODES = 4
+
+SIDEWALK_TAGS = {'highway': 'footway', 'footway': 'sidewalk', 'surface': 'concrete'}
+CROSSING_TAGS = {'highway': 'footway', 'footway': 'crossing', 'crossing': 'marked'}
+KERB_TAGS = {'barrier': 'kerb', 'kerb': 'lowered', 'tactile_paving': 'yes'}
+POLE_TAGS = {'power': 'pole'}
+FENCE_TAGS = {'barrier': 'fence'}
+BUILDING_TAGS = {'building': 'yes'}
+
+
+class SyntheticGrid:
+    '''Deterministic grid of sidewalks and crossings.
+
+    Corners of `rows` x `cols` blocks are joined by sidewalk ways with
+    SHAPE_NODES shape nodes each. Some vertical ways are crossings with
+    kerbs on their corners, every block gets a power pole and every
+    FENCE_EVERY-th block a fence. With `buildings`, every block also gets
+    that many building footprints, for building-dense cities. Ids are
+    derived from grid positions, so nodes and ways are written in id order
+    without keeping the grid in memory.
+
+    '''
+
+    def __init__(self, rows: int, cols: int, seed: int = 0, buildings: int = 0) -> None:
+        self.rows = rows
+        self.cols = cols
+        self.seed = seed
+        self.buildings = buildings
+        self.n_corners = rows * cols
+        self.n_horizontal = rows * (cols - 1)
+        self.n_vertical = (rows - 1) * cols
+        self.n_blocks = (rows - 1) * (cols - 1)
+        self.n_fences = (self.n_blocks + FENCE_EVERY - 1) // FENCE_EVERY
+
+        self._shape_base = self.n_corners + 1
+        self._pole_base = self._shape_base + (self.n_horizontal + self.n_vertical) * SHAPE_NODES
+        self._fence_base = self._pole_base + self.n_blocks
+        self._building_base = self._fence_base + self.n_fences * FENCE_NODES
+        self.n_buildings = self.n_blocks * buildings
+
+    @classmethod
+    def for_nodes(cls, nodes: int, seed: int = 0, buildings: int = 0):
+        '''Square grid with approximately `nodes` nodes.'''
+        per_corner = 1 + 2 * SHAPE_NODES + 1 + FENCE_NODES / FENCE_EVERY + buildings * BUILDING_NODES
+        side = max(2, int(round(math.sqrt(nodes / per_corner))))
+        return cls(side, side, seed, buildings)
+
+    @property
+    def n_nodes(self) -> int:
+        return self._building_base - 1 + self.n_buildings * BUILDING_NODES
+
+    @property
+    def n_ways(self) -> int:
+        return self.n_horizontal + self.n_vertical + self.n_fences + self.n_buildings
+
+    @property
+    def bbox(self):
+        return (
+            ORIGIN[0], ORIGIN[1],
+            ORIGIN[0] + (self.cols - 1) * BLOCK_LON, ORIGIN[1] + (self.rows - 1) * BLOCK_LAT
+        )
+
+    def corner_id(self, r: int, c: int) -> int:
+        return 1 + r * self.cols + c
+
+    def corner_location(self, r: int, c: int):
+        return ORIGIN[0] + c * BLOCK_LON, ORIGIN[1] + r * BLOCK_LAT
+
+    @staticmethod
+    def is_crossing(r: int, c: int) -> bool:
+        return c % CROSSING_EVERY == 0 and r % 2 == 0
+
+    def _edges(self):
+        # (way id, first corner, last corner, tags) of every sidewalk and crossing
+        way_id = 1
+        for r in range(self.rows):
+            for c in range(self.cols - 1):
+                yield way_id, (r, c), (r, c + 1), SIDEWALK_TAGS
+                way_id += 1
+        for r in range(self.rows - 1):
+            for c in range(self.cols):
+                yield way_id, (r, c), (r + 1, c), CROSSING_TAGS if self.is_crossing(r, c) else SIDEWALK_TAGS
+                way_id += 1
+
+    def _fence_blocks(self):
+        for q in range(0, self.n_blocks, FENCE_EVERY):
+            yield q // FENCE_EVERY, divmod(q, self.cols - 1)
+
+    def _building_corners(self, q: int, b: int):
+        # Footprints in a row across the upper half of block q
+        r, c = divmod(q, self.cols - 1)
+        lon, lat = self.corner_location(r, c)
+        width = BLOCK_LON * 0.8 / self.buildings
+        west = lon + BLOCK_LON * 0.1 + b * width
+        east = west + width * 0.8
+        south = lat + BLOCK_LAT * 0.6
+        north = lat + BLOCK_LAT * 0.9
+        return [(west, south), (east, south), (east, north), (west, north)]
+
+    def write(self, path: str) -> None:
+        header = osmium.io.Header()
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        header.add_box(osmium.osm.Box(osmium.osm.Location(min_lon, min_lat), osmium.osm.Location(max_lon, max_lat)))
+        header.set('generator', 'osm-osw-reformatter benchmarks')
+
+        rng = random.Random(self.seed)
+        writer = osmium.SimpleWriter(str(path), 4 * 1024 * 1024, header)
+        try:
+            for r in range(self.rows):
+                for c in range(self.cols):
+                    kerb = c % CROSSING_EVERY == 0 and (self.is_crossing(r, c) or (r > 0 and self.is_crossing(r - 1, c)))
+                    writer.add_node(osmium.osm.mutable.Node(
+                        id=self.corner_id(r, c), location=self.corner_location(r, c), tags=KERB_TAGS if kerb else {}
+                    ))
+
+            node_id = self._shape_base
+            for _, start, end, _ in self._edges():
+                lon0, lat0 = self.corner_location(*start)
+                lon1, lat1 = self.corner_location(*end)
+                for t in range(1, SHAPE_NODES + 1):
+                    f = t / (SHAPE_NODES + 1)
+                    lon = lon0 + (lon1 - lon0) * f + rng.uniform(-1e-5, 1e-5)
+                    lat = lat0 + (lat1 - lat0) * f + rng.uniform(-1e-5, 1e-5)
+                    writer.add_node(osmium.osm.mutable.Node(id=node_id, location=(lon, lat)))
+                    node_id += 1
+
+            for q in range(self.n_blocks):
+                r, c = divmod(q, self.cols - 1)
+                lon, lat = self.corner_location(r, c)
+                writer.add_node(osmium.osm.mutable.Node(
+                    id=self._pole_base + q, location=(lon + BLOCK_LON * 0.1, lat + BLOCK_LAT * 0.1), tags=POLE_TAGS
+                ))
+
+            for f, (r, c) in self._fence_blocks():
+                lon, lat = self.corner_location(r, c)
+                for t in range(FENCE_NODES):
+                    writer.add_node(osmium.osm.mutable.Node(
+                        id=self._fence_base + f * FENCE_NODES + t,
+                        location=(lon + BLOCK_LON * (0.2 + 0.3 * t), lat + BLOCK_LAT * 0.5)
+                    ))
+
+            node_id = self._building_base
+            for q in range(self.n_blocks):
+                for b in range(self.buildings):
+                    for location in self._building_corners(q, b):
+                        writer.add_node(osmium.osm.mutable.Node(id=node_id, location=location))
+                        node_id += 1
+
+            shape_id = self._shape_base
+            for way_id, start, end, tags in self._edges():
+                nodes = [self.corner_id(*start)]
+                nodes.extend(range(shape_id, shape_id + SHAPE_NODES))
+                nodes.append(self.corner_id(*end))
+                shape_id += SHAPE_NODES
+                writer.add_way(osmium.osm.mutable.Way(id=way_id, nodes=nodes, tags=tags))
+
+            way_id = self.n_horizontal + self.n_vertical + 1
+            for f, _ in self._fence_blocks():
+                first = self._fence_base + f * FENCE_NODES
+                writer.add_way(osmium.osm.mutable.Way(
+                    id=way_id + f, nodes=list(range(first, first + FENCE_NODES)), tags=FENCE_TAGS
+                ))
+
+            way_id += self.n_fences
+            for i in range(self.n_buildings):
+                first = self._building_base + i * BUILDING_NODES
+                writer.add_way(osmium.osm.mutable.Way(
+                    id=way_id + i, nodes=list(range(first, first + BUILDING_NODES)) + [first], tags=BUILDING_TAGS
+                ))
+        finally:
+            writer.close()
+
+
+def generate(path: str, nodes: int, seed: int = 0, buildings: int = 0) -> SyntheticGrid:
+    '''Writes a synthetic grid with approximately `nodes` nodes to path. The
+    format follows the extension, e.g. `.osm.pbf` or `.osm`.
+
+    '''
+    grid = SyntheticGrid.for_nodes(nodes, seed, buildings)
+    grid.write(path)
+    return grid
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic sidewalk and crossing grid')
+    parser.add_argument('output', help='Output file, e.g. grid.osm.pbf')
+    parser.add_argument('--nodes', type=int, default=10000, help='Approximate number of nodes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--buildings', type=int, default=0, help='Building footprints per block')
+    args = parser.parse_args()
+    grid = generate(args.output, args.nodes, args.seed, args.buildings)
+    print(f'Wrote {grid.n_nodes} nodes and {grid.n_ways} ways to {args.output}')
@@ -1,8 +1,10 @@
 import os
+import asyncio
 from pathlib import Path
-from .osm2osw.osm2osw import OSM2OSW
-from .osw2osm.osw2osm import OSW2OSM
+from .helpers.cache import ConversionCache, DEFAULT_CACHE_SIZE
+from .helpers.metrics import Metrics
 from .helpers.response import Response
+from .serializer.osm.osm_geojson import DEFAULT_PRECISION
 from .version import __version__
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -10,8 +12,23 @@ ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 DOWNLOAD_FOLDER = f'{Path.cwd()}/tmp'
 
 
+def __getattr__(name):
+    # The converters pull in osmium, networkx, shapely, pyproj and GDAL, so
+    # they are only imported when first used
+    if name == 'OSM2OSW':
+        from .osm2osw.osm2osw import OSM2OSW
+        return OSM2OSW
+    if name == 'OSW2OSM':
+        from .osw2osm.osw2osm import OSW2OSM
+        return OSW2OSM
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 class Formatter:
-    def __init__(self, workdir=DOWNLOAD_FOLDER, file_path=None, prefix='final'):
+    def __init__(self, workdir=DOWNLOAD_FOLDER, file_path=None, prefix='final', cache_dir=None,
+                 cache_size=DEFAULT_CACHE_SIZE, node_cache=False, node_cache_dir=None, hooks=None, entity_types=None,
+                 tiles=None, processes=None, boundary=None, clip=False, precision=DEFAULT_PRECISION,
+                 spatial_order=None):
         is_exists = os.path.exists(workdir)
         if not is_exists:
             os.makedirs(workdir)
@@ -19,19 +36,69 @@ class Formatter:
         self.file_path = file_path
         self.generated_files = []
         self.prefix = prefix
+        # Conversion results are reused across runs when a cache directory is given
+        self.cache = ConversionCache(cache_dir, max_bytes=cache_size) if cache_dir else None
+        self.node_cache = node_cache
+        self.node_cache_dir = node_cache_dir
+        self.hooks = hooks
+        # OSW entity types osm2osw produces, all by default
+        self.entity_types = entity_types
+        # Tiled parallel osm2osw, see OSM2OSW
+        self.tiles = tiles
+        self.processes = processes
+        # Area of interest of osm2osw, see OSM2OSW
+        self.boundary = boundary
+        self.clip = clip
+        # Coordinate decimals and order of osm2osw output features, see OSM2OSW
+        self.precision = precision
+        self.spatial_order = spatial_order
 
     async def osm2osw(self) -> Response:
-        convert = OSM2OSW(osm_file=self.file_path, workdir=self.workdir, prefix=self.prefix)
+        from .osm2osw.osm2osw import OSM2OSW
+        convert = OSM2OSW(osm_file=self.file_path, workdir=self.workdir, prefix=self.prefix,
+                          node_cache=self.node_cache, node_cache_dir=self.node_cache_dir, hooks=self.hooks,
+                          entity_types=self.entity_types, tiles=self.tiles, processes=self.processes,
+                          boundary=self.boundary, clip=self.clip, precision=self.precision,
+                          spatial_order=self.spatial_order)
+        cache_key = None
+        if self.cache and os.path.exists(self.file_path):
+            loop = asyncio.get_event_loop()
+            cache_key = await loop.run_in_executor(None, self.cache.key, self.file_path, 'osm2osw', convert.options)
+            cached_files = await loop.run_in_executor(None, self.cache.get, cache_key, self.workdir,
+                                                      convert.filename)
+            if cached_files is not None:
+                self.generated_files = cached_files
+                return Response(status=True, generated_files=cached_files, metrics=Formatter._cache_hit_metrics())
+
         result = await convert.convert()
         self.generated_files = result.generated_files
+        if cache_key and result.status:
+            # Copying the files and taking the lock would block the event loop
+            await loop.run_in_executor(None, self.cache.put, cache_key, result.generated_files, convert.filename)
         return result
 
     def osw2osm(self) -> Response:
-        convert = OSW2OSM(zip_file_path=self.file_path, workdir=self.workdir, prefix=self.prefix)
+        from .osw2osm.osw2osm import OSW2OSM
+        convert = OSW2OSM(zip_file_path=self.file_path, workdir=self.workdir, prefix=self.prefix, hooks=self.hooks)
+        cache_key = None
+        if self.cache and os.path.exists(self.file_path):
+            cache_key = self.cache.key(self.file_path, 'osw2osm', convert.options)
+            cached_files = self.cache.get(cache_key, self.workdir, self.prefix)
+            if cached_files is not None:
+                self.generated_files = cached_files
+                return Response(status=True, generated_files=cached_files[0], metrics=Formatter._cache_hit_metrics())
+
         result = convert.convert()
         self.generated_files = [result.generated_files]
+        if cache_key and result.status:
+            self.cache.put(cache_key, self.generated_files, self.prefix)
         return result
 
+    @staticmethod
+    def _cache_hit_metrics() -> dict:
+        # No stage ran, the files came from the cache
+        return {**Metrics().to_dict(), 'cache_hit': True}
+
     def cleanup(self) -> None:
         for file in self.generated_files:
             if os.path.exists(file):
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import functools
+from pathlib import Path
+from contextlib import contextmanager
+from typing import List, Optional
+from ..version import __version__
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - fcntl is not available on Windows
+    fcntl = None
+
+# 10 GiB
+DEFAULT_CACHE_SIZE = 10 * 1024 ** 3
+MANIFEST_FILE = 'manifest.json'
+
+
+def file_digest(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    '''Returns the sha256 hex digest of the file content. Digests are
+    memoized per path, size and modification time, so the result cache, the
+    checkpoints and the node location cache hash an input only once.
+
+    '''
+    stat = os.stat(file_path)
+    return _file_digest(os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, chunk_size)
+
+
+@functools.lru_cache(maxsize=64)
+def _file_digest(file_path: str, size: int, mtime_ns: int, chunk_size: int) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src: str, dst: str, link: bool = True) -> None:
+    '''Hard links src to dst, falling back to a copy across file systems.
+    An existing dst is replaced atomically.
+
+    '''
+    tmp = f'{dst}.{uuid.uuid4().hex}.tmp'
+    try:
+        if link:
+            try:
+                os.link(src, tmp)
+            except OSError:
+                shutil.copy2(src, tmp)
+        else:
+            shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class ConversionCache:
+    '''On-disk cache of conversion outputs, keyed by the input content hash,
+    the library version and the conversion options.
+
+    Entries live in `<cache_dir>/entries/<key>/` and are published with an
+    atomic rename, so concurrent processes never see a partial entry. Lookups
+    hold a shared lock on `<cache_dir>/.lock`, publishing and eviction hold an
+    exclusive one. Entries are evicted least recently used first once the
+    cache grows over `max_bytes`.
+
+    Cached files are handed out as hard links when `link` is set, so callers
+    must replace rather than modify generated files in place.
+
+    '''
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_CACHE_SIZE, link: bool = True) -> None:
+        self.cache_dir = str(cache_dir)
+        self.entries_dir = os.path.join(self.cache_dir, 'entries')
+        self.max_bytes = max_bytes
+        self.link = link
+        os.makedirs(self.entries_dir, exist_ok=True)
+        self._lock_path = os.path.join(self.cache_dir, '.lock')
+
+    @staticmethod
+    def key(file_path: str, direction: str, options: Optional[dict] = None) -> str:
+        payload = json.dumps({
+            'input': file_digest(file_path),
+            'version': __version__,
+            'direction': direction,
+            'options': options or {}
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        with open(self._lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, key: str, workdir: str, stem: str) -> Optional[List[str]]:
+        '''Materializes a cached entry into workdir, naming every file
+        `<stem>.<cached name>`. Returns None on a miss.
+
+        '''
+        entry_dir = os.path.join(self.entries_dir, key)
+        with self._locked(exclusive=False):
+            manifest_path = os.path.join(entry_dir, MANIFEST_FILE)
+            if not os.path.exists(manifest_path):
+                return None
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+
+            generated_files = []
+            try:
+                for name in manifest['files']:
+                    output_path = str(Path(workdir, f'{stem}.{name}'))
+                    link_or_copy(os.path.join(entry_dir, name), output_path, self.link)
+                    generated_files.append(output_path)
+            except OSError:
+                for file in generated_files:
+                    os.remove(file)
+                return None
+
+            # The manifest mtime is the LRU timestamp
+            os.utime(manifest_path)
+
+        return generated_files
+
+    def put(self, key: str, files: List[str], stem: str) -> None:
+        '''Stores generated files under key. Every file name must start with
+        `<stem>.`, which is stripped so that hits can be renamed for another
+        input file or prefix.
+
+        '''
+        prefix = f'{stem}.'
+        names = []
+        for file in files:
+            name = os.path.basename(file)
+            if not name.startswith(prefix):
+                raise ValueError(f'{file} does not start with {prefix}')
+            names.append(name[len(prefix):])
+
+        tmp_dir = os.path.join(self.cache_dir, f'tmp-{uuid.uuid4().hex}')
+        os.makedirs(tmp_dir)
+        try:
+            size = 0
+            for file, name in zip(files, names):
+                link_or_copy(file, os.path.join(tmp_dir, name), self.link)
+                size += os.path.getsize(file)
+            with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+                json.dump({'files': names, 'size': size, 'created': time.time()}, f)
+
+            with self._locked(exclusive=True):
+                entry_dir = os.path.join(self.entries_dir, key)
+                if not os.path.exists(entry_dir):
+                    os.rename(tmp_dir, entry_dir)
+                self._evict()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def evict(self) -> None:
+        with self._locked(exclusive=True):
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        for key in os.listdir(self.entries_dir):
+            manifest_path = os.path.join(self.entries_dir, key, MANIFEST_FILE)
+            try:
+                with open(manifest_path) as f:
+                    size = json.load(f)['size']
+                entries.append((os.path.getmtime(manifest_path), size, key))
+            except (OSError, ValueError, KeyError):
+                # Corrupt entry, drop it
+                entries.append((0, 0, key))
+                continue
+            total += size
+
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes and size > 0:
+                break
+            shutil.rmtree(os.path.join(self.entries_dir, key), ignore_errors=True)
+            total -= size
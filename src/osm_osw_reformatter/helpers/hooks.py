@@ -0,0 +1,164 @@
+import os
+import time
+import pstats
+import cProfile
+import tracemalloc
+from typing import Callable, Iterable, Optional
+
+# osmium handler callbacks CallbackTimingHook can wrap
+HANDLER_CALLBACKS = ('node', 'way', 'relation', 'area')
+
+
+class PipelineHook:
+    '''Base class of hooks called around pipeline stages.
+
+    Hooks are registered through the `hooks` argument of Formatter, OSM2OSW
+    and OSW2OSM and run in the thread executing the stage. `stages` limits a
+    hook to the named stages, all stages by default. Without registered
+    hooks none of these methods is called.
+
+    '''
+
+    def __init__(self, stages: Optional[Iterable[str]] = None) -> None:
+        self.stages = set(stages) if stages is not None else None
+
+    def wants(self, stage: str) -> bool:
+        return self.stages is None or stage in self.stages
+
+    def stage_start(self, metrics, stage: str) -> None:
+        pass
+
+    def stage_end(self, metrics, stage: str, record: dict) -> None:
+        pass
+
+    def wrap_handler(self, stage: str, handler) -> None:
+        '''Called with every osmium handler before it is applied.'''
+        pass
+
+
+class SpanHook(PipelineHook):
+    '''Emits a start and an end event per stage to `emit`. End events carry
+    the stage timings and the entity counts so far.
+
+    '''
+
+    def __init__(self, emit: Callable[[dict], None], stages: Optional[Iterable[str]] = None) -> None:
+        super().__init__(stages)
+        self.emit = emit
+
+    def stage_start(self, metrics, stage: str) -> None:
+        self.emit({'event': 'start', 'stage': stage, 'time': time.time()})
+
+    def stage_end(self, metrics, stage: str, record: dict) -> None:
+        self.emit({
+            'event': 'end',
+            'stage': stage,
+            'time': time.time(),
+            **record,
+            'counts': {'in': dict(metrics.counts_in), 'out': dict(metrics.counts_out)}
+        })
+
+
+class CProfileHook(PipelineHook):
+    '''Profiles the chosen stages with cProfile. Stats are kept in
+    `profiles` and, with `output_dir`, dumped to `<stage>.prof`.
+
+    '''
+
+    def __init__(self, stages: Optional[Iterable[str]] = None, output_dir: Optional[str] = None) -> None:
+        super().__init__(stages)
+        self.output_dir = output_dir
+        self.profiles = {}
+        self._active = {}
+
+    def stage_start(self, metrics, stage: str) -> None:
+        profile = cProfile.Profile()
+        self._active[stage] = profile
+        profile.enable()
+
+    def stage_end(self, metrics, stage: str, record: dict) -> None:
+        profile = self._active.pop(stage)
+        profile.disable()
+        self.profiles[stage] = pstats.Stats(profile)
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+            profile.dump_stats(os.path.join(self.output_dir, f'{stage}.prof'))
+
+
+class TracemallocHook(PipelineHook):
+    '''Traces Python allocations of the chosen stages. For every stage
+    `results` holds the traced peak in bytes and the `top` allocating
+    source lines.
+
+    '''
+
+    def __init__(self, stages: Optional[Iterable[str]] = None, top: int = 10, frames: int = 1) -> None:
+        super().__init__(stages)
+        self.top = top
+        self.frames = frames
+        self.results = {}
+        self._started = {}
+
+    def stage_start(self, metrics, stage: str) -> None:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(self.frames)
+        else:
+            tracemalloc.reset_peak()
+        self._started[stage] = started
+
+    def stage_end(self, metrics, stage: str, record: dict) -> None:
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        if self._started.pop(stage):
+            tracemalloc.stop()
+        self.results[stage] = {
+            'peak': peak,
+            'top': [str(stat) for stat in snapshot.statistics('lineno')[:self.top]]
+        }
+
+
+class CallbackTimingHook(PipelineHook):
+    '''Samples the duration of every `sample_every`-th call of the osmium
+    handler callbacks into power of two histograms.
+
+    `results[stage][callback]` holds the number of calls, the number and
+    total seconds of sampled calls and a histogram mapping the upper bound
+    of each bucket in microseconds to its number of samples.
+
+    '''
+
+    def __init__(self, stages: Optional[Iterable[str]] = None, sample_every: int = 100) -> None:
+        super().__init__(stages)
+        self.sample_every = sample_every
+        self.results = {}
+
+    def wrap_handler(self, stage: str, handler) -> None:
+        for name in HANDLER_CALLBACKS:
+            callback = getattr(handler, name, None)
+            if callback is not None:
+                result = {'calls': 0, 'sampled': 0, 'total': 0.0, 'histogram': {}}
+                self.results.setdefault(stage, {})[name] = result
+                # Instance attributes shadow the class methods osmium calls
+                setattr(handler, name, self._wrap(callback, result))
+
+    def _wrap(self, callback, result: dict):
+        sample_every = self.sample_every
+        histogram = result['histogram']
+        perf_counter_ns = time.perf_counter_ns
+
+        def timed(obj):
+            result['calls'] += 1
+            if result['calls'] % sample_every:
+                return callback(obj)
+            start = perf_counter_ns()
+            try:
+                return callback(obj)
+            finally:
+                elapsed = perf_counter_ns() - start
+                result['sampled'] += 1
+                result['total'] += elapsed / 1e9
+                bucket = 1 << max(elapsed // 1000, 1).bit_length()
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+
+        return timed
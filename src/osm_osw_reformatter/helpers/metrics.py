@@ -0,0 +1,106 @@
+import sys
+import time
+from typing import List, Optional
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - resource is not available on Windows
+    resource = None
+
+
+def peak_rss() -> Optional[int]:
+    '''Peak resident set size of the process in bytes. Read from VmHWM where
+    /proc has it, as that one can be reset between stages.
+
+    '''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class Metrics:
+    '''Wall and CPU time per pipeline stage plus entity counts in and out.
+
+    Only a few clock reads per stage and one counter per entity are taken,
+    so metrics are always collected. CPU time is that of the whole process,
+    as stages run in executor threads. Peak RSS is the process high water
+    mark at the end of each stage.
+
+    '''
+
+    def __init__(self, hooks: Optional[List] = None) -> None:
+        self.stages = {}
+        self.counts_in = {}
+        self.counts_out = {}
+        # PipelineHooks, see helpers.hooks
+        self.hooks = list(hooks) if hooks else []
+
+    @contextmanager
+    def stage(self, name: str):
+        hooks = [hook for hook in self.hooks if hook.wants(name)] if self.hooks else None
+        if hooks:
+            for hook in hooks:
+                hook.stage_start(self, name)
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield self
+        finally:
+            record = {
+                'wall': time.perf_counter() - start,
+                'cpu': time.process_time() - start_cpu,
+                'peak_rss': peak_rss()
+            }
+            self.stages[name] = record
+            if hooks:
+                for hook in reversed(hooks):
+                    hook.stage_end(self, name, record)
+
+    def wrap_handler(self, name: str, handler) -> None:
+        '''Lets the hooks of stage `name` instrument an osmium handler.'''
+        if self.hooks:
+            for hook in self.hooks:
+                if hook.wants(name):
+                    hook.wrap_handler(name, handler)
+
+    def count_in(self, entity_type: str, count: int) -> None:
+        self.counts_in[entity_type] = self.counts_in.get(entity_type, 0) + count
+
+    def count_out(self, entity_type: str, count: int) -> None:
+        self.counts_out[entity_type] = self.counts_out.get(entity_type, 0) + count
+
+    def to_dict(self) -> dict:
+        return {
+            'stages': self.stages,
+            'wall': sum(stage['wall'] for stage in self.stages.values()),
+            'cpu': sum(stage['cpu'] for stage in self.stages.values()),
+            'peak_rss': peak_rss(),
+            'counts': {'in': self.counts_in, 'out': self.counts_out}
+        }
+
+    @staticmethod
+    def stage_of(metrics, name: str):
+        '''metrics.stage(name), or a no-op context when metrics is None.'''
+        return metrics.stage(name) if metrics is not None else nullcontext()
+
+    @staticmethod
+    def timed(metrics, name: str, func, *args, **kwargs):
+        '''Wraps func to run as stage `name`, for use with run_in_executor so
+        that the stage and its hooks run in the thread doing the work.
+
+        '''
+        def run():
+            with Metrics.stage_of(metrics, name):
+                return func(*args, **kwargs)
+
+        return run
@@ -1,15 +1,23 @@
 import gc
+import io
 import os
 import json
+import shutil
 import zipfile
 import asyncio
-from typing import List
+import tempfile
+from typing import List, Optional, TYPE_CHECKING
 from pathlib import Path
-from ...serializer.osm.osm_graph import OSMGraph
-from ...serializer.counters import WayCounter, NodeCounter, PointCounter, LineCounter, ZoneCounter, PolygonCounter
-from ...serializer.osw.osw_normalizer import OSWWayNormalizer, OSWNodeNormalizer, OSWPointNormalizer, OSWLineNormalizer, \
+from ..metrics import Metrics
+from ...serializer.pbf_estimator import estimate_pbf, PbfEstimate
+from ...serializer.osm.osm_geojson import DEFAULT_PRECISION
+from ...serializer.osw.osw_normalizer import OSW_ENTITY_TYPES, DEFAULT_ENTITY_TYPES, OSWWayNormalizer, OSWNodeNormalizer, OSWPointNormalizer, OSWLineNormalizer, \
     OSWZoneNormalizer, OSWPolygonNormalizer
 
+# osmium, networkx, shapely and pyproj are imported at first use, so that
+# importing the package or converting OSW to OSM does not load them
+if TYPE_CHECKING:
+    from ...serializer.counters import EntityCounts
 
 class OSWHelper:
     @staticmethod
@@ -42,8 +50,26 @@ class OSWHelper:
         normalizer = OSWPolygonNormalizer(tags)
         return normalizer.filter()
 
+    @staticmethod
+    def select_entity_types(entity_types=None) -> tuple:
+        '''Validates a choice of OSW entity types, all but zones and
+        polygons by default.
+
+        '''
+        if entity_types is None:
+            return DEFAULT_ENTITY_TYPES
+        if isinstance(entity_types, str):
+            entity_types = [entity_types]
+        unknown = set(entity_types) - set(OSW_ENTITY_TYPES)
+        if unknown:
+            raise ValueError(f'Unknown OSW entity types {sorted(unknown)}, expected some of {list(OSW_ENTITY_TYPES)}')
+        if not entity_types:
+            raise ValueError('No OSW entity type selected')
+        return tuple(entity_type for entity_type in OSW_ENTITY_TYPES if entity_type in entity_types)
+
     @staticmethod
     async def count_ways(osm_file_path: str):
+        from ...serializer.counters import WayCounter
         loop = asyncio.get_event_loop()
         way_counter = WayCounter()
         await loop.run_in_executor(None, way_counter.apply_file, osm_file_path)
@@ -51,6 +77,7 @@ class OSWHelper:
 
     @staticmethod
     async def count_nodes(osm_file_path: str):
+        from ...serializer.counters import NodeCounter
         loop = asyncio.get_event_loop()
         node_counter = NodeCounter()
         await loop.run_in_executor(None, node_counter.apply_file, osm_file_path)
@@ -58,6 +85,7 @@ class OSWHelper:
 
     @staticmethod
     async def count_points(osm_file_path: str):
+        from ...serializer.counters import PointCounter
         loop = asyncio.get_event_loop()
         point_counter = PointCounter()
         await loop.run_in_executor(None, point_counter.apply_file, osm_file_path)
@@ -65,6 +93,7 @@ class OSWHelper:
 
     @staticmethod
     async def count_lines(osm_file_path: str):
+        from ...serializer.counters import LineCounter
         loop = asyncio.get_event_loop()
         line_counter = LineCounter()
         await loop.run_in_executor(None, line_counter.apply_file, osm_file_path)
@@ -72,6 +101,7 @@ class OSWHelper:
 
     @staticmethod
     async def count_zones(osm_file_path: str):
+        from ...serializer.counters import ZoneCounter
         loop = asyncio.get_event_loop()
         zone_counter = ZoneCounter()
         await loop.run_in_executor(None, zone_counter.apply_file, osm_file_path)
@@ -79,6 +109,7 @@ class OSWHelper:
 
     @staticmethod
     async def count_polygons(osm_file_path: str):
+        from ...serializer.counters import PolygonCounter
         loop = asyncio.get_event_loop()
         polygon_counter = PolygonCounter()
         await loop.run_in_executor(None, polygon_counter.apply_file, osm_file_path)
@@ -92,7 +123,28 @@ class OSWHelper:
         return counter.count
 
     @staticmethod
-    async def get_osm_graph(osm_file_path: str):
+    async def count_all_entities(osm_file_path: str) -> 'EntityCounts':
+        from ...serializer.counters import EntityCounter
+        loop = asyncio.get_event_loop()
+        counter = EntityCounter(
+            OSWHelper.osw_way_filter,
+            OSWHelper.osw_node_filter,
+            OSWHelper.osw_point_filter,
+            OSWHelper.osw_line_filter,
+            OSWHelper.osw_zone_filter,
+            OSWHelper.osw_polygon_filter
+        )
+        await loop.run_in_executor(None, counter.apply_file, osm_file_path)
+        return counter.counts
+
+    @staticmethod
+    def estimate_size(osm_file_path: str) -> PbfEstimate:
+        return estimate_pbf(osm_file_path)
+
+    @staticmethod
+    async def get_osm_graph(osm_file_path: str, node_cache_dir: Optional[str] = None, metrics: Optional[Metrics] = None,
+                            entity_types: Optional[tuple] = None, boundary=None):
+        from ...serializer.osm.osm_graph import OSMGraph
         loop = asyncio.get_event_loop()
         OG = await loop.run_in_executor(
             None,
@@ -103,41 +155,156 @@ class OSWHelper:
             OSWHelper.osw_point_filter,
             OSWHelper.osw_line_filter,
             OSWHelper.osw_zone_filter,
-            OSWHelper.osw_polygon_filter
+            OSWHelper.osw_polygon_filter,
+            None,
+            node_cache_dir,
+            metrics,
+            entity_types,
+            boundary
+        )
+
+        gc.collect()
+
+        return OG
+
+    @staticmethod
+    async def get_tiled_osm_graph(osm_file_path: str, workdir: str, tiles: int, processes: Optional[int] = None,
+                                  node_cache_dir: Optional[str] = None, metrics: Optional[Metrics] = None,
+                                  entity_types: Optional[tuple] = None, boundary=None):
+        '''Parses, simplifies and builds the geometries of an OSM file in
+        `tiles` spatial tiles converted by `processes` processes, then
+        stitches the tiles into one graph. See serializer.osm.osm_tiles.
+
+        '''
+        from ...serializer.osm.osm_tiles import split_tiles, tile_pool, convert_tile, stitch_tiles
+        loop = asyncio.get_event_loop()
+        tile_dir = tempfile.mkdtemp(prefix='tiles-', dir=workdir)
+        try:
+            grid, tile_files = await loop.run_in_executor(None, Metrics.timed(
+                metrics, 'split', split_tiles, osm_file_path, tile_dir, tiles, OSWHelper.osw_way_filter,
+                OSWHelper.osw_point_filter, OSWHelper.osw_line_filter, node_cache_dir, metrics, entity_types, boundary
+            ))
+            filters = (OSWHelper.osw_way_filter, OSWHelper.osw_node_filter, OSWHelper.osw_point_filter,
+                       OSWHelper.osw_line_filter)
+            with Metrics.stage_of(metrics, 'tiles'):
+                with tile_pool(grid, processes or min(len(tile_files), os.cpu_count() or 1) or 1) as pool:
+                    results = await asyncio.gather(*[
+                        loop.run_in_executor(pool, convert_tile, path, tile, filters, entity_types, boundary)
+                        for tile, path in tile_files.items()
+                    ])
+        finally:
+            shutil.rmtree(tile_dir, ignore_errors=True)
+        OG = await loop.run_in_executor(None, Metrics.timed(metrics, 'stitch', stitch_tiles, results))
+        del results
+        gc.collect()
+
+        return OG
+
+    @staticmethod
+    async def get_osm_graph_from_buffer(buffer: bytes, file_format: Optional[str] = None,
+                                        metrics: Optional[Metrics] = None, entity_types: Optional[tuple] = None,
+                                        boundary=None):
+        from ...serializer.osm.osm_graph import OSMGraph
+        loop = asyncio.get_event_loop()
+        OG = await loop.run_in_executor(
+            None,
+            OSMGraph.from_osm_buffer,
+            buffer,
+            file_format,
+            OSWHelper.osw_way_filter,
+            OSWHelper.osw_node_filter,
+            OSWHelper.osw_point_filter,
+            OSWHelper.osw_line_filter,
+            OSWHelper.osw_zone_filter,
+            OSWHelper.osw_polygon_filter,
+            None,
+            metrics,
+            entity_types,
+            boundary
         )
 
         gc.collect()
 
         return OG
 
+    @staticmethod
+    async def save_checkpoint(og, path, stage: str, key: str, metrics: Optional[Metrics] = None):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, Metrics.timed(metrics, f'checkpoint_{stage}', og.to_checkpoint, path, stage,
+                                                       key=key))
+
+    @staticmethod
+    async def load_checkpoint(path, metrics: Optional[Metrics] = None):
+        from ...serializer.osm.osm_graph import OSMGraph
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, Metrics.timed(metrics, 'load_checkpoint', OSMGraph.from_checkpoint,
+                                                              path))
+
+    @staticmethod
+    def read_checkpoint_meta(path) -> dict:
+        from ...serializer.osm.osm_graph import OSMGraph
+        return OSMGraph.checkpoint_meta(path)
+
+    @staticmethod
+    def _osw_members(names: List[str]) -> dict:
+        optional_files = ['nodes', 'edges', 'points', 'lines', 'zones', 'polygons']
+        members = {}
+
+        for optional_file in optional_files:
+            for name in names:
+                if '__MACOSX' in name:
+                    continue
+                if optional_file.lower() in name.lower():
+                    members[optional_file] = name
+        return members
+
     @staticmethod
     def unzip(zip_file: str, output: str):
         with zipfile.ZipFile(zip_file, 'r') as zip_ref:
             zip_ref.extractall(output)
             extracted_files = zip_ref.namelist()
-            optional_files = ['nodes', 'edges', 'points', 'lines', 'zones', 'polygons']
-            file_locations = {}
-
-            for optional_file in optional_files:
-                for extracted_file in extracted_files:
-                    if '__MACOSX' in extracted_file:
-                        continue
-                    if optional_file.lower() in extracted_file.lower():
-                        file_locations[optional_file] = f'{output}/{extracted_file}'
+            file_locations = {
+                optional_file: f'{output}/{extracted_file}'
+                for optional_file, extracted_file in OSWHelper._osw_members(extracted_files).items()
+            }
 
             gc.collect()
             return file_locations
 
     @staticmethod
-    def merge(osm_files: object, output: str, prefix: str):
+    def read_zip(zip_file) -> dict:
+        '''Reads the OSW files of a zip, given as bytes or a file-like
+        object, into feature collections by file type without extracting it.
+
+        '''
+        if isinstance(zip_file, (bytes, bytearray, memoryview)):
+            zip_file = io.BytesIO(zip_file)
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            return {
+                optional_file: json.loads(zip_ref.read(member))
+                for optional_file, member in OSWHelper._osw_members(zip_ref.namelist()).items()
+            }
+
+    @staticmethod
+    def merge_collections(collections: dict, metrics: Optional[Metrics] = None) -> dict:
         fc = {'type': 'FeatureCollection', 'features': []}
+        for file, region_fc in collections.items():
+            fc['features'].extend(region_fc['features'])
+            if metrics is not None:
+                metrics.count_in(file, len(region_fc['features']))
+        return fc
+
+    @staticmethod
+    def merge(osm_files: object, output: str, prefix: str, metrics: Optional[Metrics] = None):
+        collections = {}
         for file, location in osm_files.items():
             geojson_path = Path(location)
             if geojson_path.exists():
                 with open(geojson_path) as f:
-                    region_fc = json.load(f)
-                    fc['features'] = fc['features'] + region_fc['features']
+                    collections[file] = json.load(f)
                 os.remove(geojson_path)
+        fc = OSWHelper.merge_collections(collections, metrics)
+        del collections
         output_path = Path(output, f'{prefix}.graph.all.geojson')
         with open(output_path, 'w') as f:
             json.dump(fc, f)
@@ -148,17 +315,33 @@ class OSWHelper:
         return str(output_path)
 
     @classmethod
-    async def simplify_og(cls, og):
+    async def simplify_og(cls, og, metrics: Optional[Metrics] = None):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, Metrics.timed(metrics, 'simplify', og.simplify))
+
+    @classmethod
+    async def construct_geometries(cls, og, metrics: Optional[Metrics] = None):
         loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, og.simplify)
+        await loop.run_in_executor(None, Metrics.timed(metrics, 'construct_geometries', og.construct_geometries))
 
     @classmethod
-    async def construct_geometries(cls, og):
+    async def og_to_feature_collections(cls, og, metrics: Optional[Metrics] = None,
+                                        entity_types: Optional[tuple] = None,
+                                        precision: Optional[int] = None, order: Optional[str] = None) -> dict:
         loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, og.construct_geometries)
+        collections = await loop.run_in_executor(None, Metrics.timed(metrics, 'write', og.to_feature_collections,
+                                                                     entity_types, precision, order))
+        if metrics is not None:
+            for entity_type, fc in collections.items():
+                metrics.count_out(entity_type, len(fc['features']))
+        del og
+        gc.collect()
+        return collections
 
     @classmethod
-    async def write_og(cls, workdir: str, filename: str, og) -> List[str]:
+    async def write_og(cls, workdir: str, filename: str, og, metrics: Optional[Metrics] = None,
+                       entity_types: Optional[tuple] = None,
+                       precision: Optional[int] = DEFAULT_PRECISION, order: Optional[str] = None) -> List[str]:
         loop = asyncio.get_event_loop()
         points_path = Path(workdir, f'{filename}.graph.points.geojson')
         nodes_path = Path(workdir, f'{filename}.graph.nodes.geojson')
@@ -166,12 +349,19 @@ class OSWHelper:
         lines_path = Path(workdir, f'{filename}.graph.lines.geojson')
         zones_path = Path(workdir, f'{filename}.graph.zones.geojson')
         polygons_path = Path(workdir, f'{filename}.graph.polygons.geojson')
-        await loop.run_in_executor(None, og.to_geojson, nodes_path, edges_path, points_path, lines_path, zones_path,
-                                   polygons_path)
-        # for the fi
-        pot_gen_files = [str(nodes_path), str(edges_path), str(points_path), str(lines_path), str(zones_path),
-                         str(polygons_path)]
-        generated_files = [file for file in pot_gen_files if os.path.exists(file)]
+        counts = await loop.run_in_executor(None, Metrics.timed(metrics, 'write', og.to_geojson, nodes_path, edges_path,
+                                                                points_path, lines_path, zones_path, polygons_path,
+                                                                entity_types=entity_types, precision=precision,
+                                                                order=order))
+        if metrics is not None:
+            for entity_type, count in counts.items():
+                metrics.count_out(entity_type, count)
+        # Only files written now are reported; files of other entity types,
+        # or of ones without features, may be left from an earlier run and
+        # are not touched
+        paths = {'nodes': nodes_path, 'edges': edges_path, 'points': points_path, 'lines': lines_path,
+                 'zones': zones_path, 'polygons': polygons_path}
+        generated_files = [str(path) for entity_type, path in paths.items() if counts.get(entity_type, 0) > 0]
         del og
         gc.collect()
         return generated_files
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List, Union, Optional
+from typing import Dict, List, Union, Optional
 
 
 @dataclass
@@ -7,3 +7,8 @@ class Response:
     status: bool
     generated_files: Optional[Union[str, List[str]]] = None
     error: str = None
+    # Per-stage wall/CPU time, peak RSS and entity counts, see helpers.metrics
+    metrics: Optional[dict] = None
+    # Results of the in-memory conversions: OSW feature collections by file
+    # type, or OSM XML bytes
+    output: Optional[Union[Dict[str, dict], bytes]] = None
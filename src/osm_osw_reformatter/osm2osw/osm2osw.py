@@ -3,44 +3,201 @@ import os
 import asyncio
 import traceback
 from pathlib import Path
+from typing import Optional
 from ..helpers.osw import OSWHelper
+from ..helpers.cache import ConversionCache
+from ..helpers.metrics import Metrics
 from ..helpers.response import Response
+from ..serializer.osm.osm_geojson import DEFAULT_PRECISION
+
+# Pipeline stages after which the graph can be checkpointed, in order
+CHECKPOINT_STAGES = ('parse', 'simplify')
 
 
 class OSM2OSW:
-    def __init__(self, prefix: str, osm_file=None, workdir=None):
+    def __init__(self, prefix: str, osm_file=None, workdir=None, checkpoint_dir=None, node_cache=False,
+                 node_cache_dir=None, hooks=None, entity_types=None, tiles=None, processes=None, boundary=None,
+                 clip=False, precision=DEFAULT_PRECISION, spatial_order=None):
         self.osm_file_path = str(Path(osm_file))
         filename = os.path.basename(osm_file).replace('.pbf', '').replace('.xml', '').replace('.osm', '')
         self.workdir = workdir
         self.filename = f'{prefix + "." if prefix else ""}{filename}'
         self.generated_files = []
+        # Graph checkpoints let a failed job resume after the last completed stage
+        self.checkpoint_dir = checkpoint_dir
+        self._checkpoint_key = None
+        # Node location index file shared by the parser passes and later runs,
+        # stored next to the input unless node_cache_dir is given
+        self.node_cache_dir = None
+        if node_cache:
+            self.node_cache_dir = node_cache_dir or os.path.dirname(os.path.abspath(self.osm_file_path))
+        # Profiling and tracing hooks around the stages, see helpers.hooks
+        self.hooks = hooks or []
+        # OSW entity types to produce, passes only needed by others are skipped
+        self.entity_types = OSWHelper.select_entity_types(entity_types)
+        # Area of interest, a bbox or GeoJSON polygon; ways crossing it are
+        # kept whole or clipped
+        self.boundary = OSM2OSW._boundary(boundary, clip)
+        # Decimals of the output coordinates, None for full float precision
+        self.precision = precision
+        # Curve output features are sorted along, 'hilbert' or 'z', or None
+        # for parse order
+        self.spatial_order = OSM2OSW._spatial_order(spatial_order)
+        # Tiled mode: the input is split into tiles converted in parallel
+        # processes, see serializer.osm.osm_tiles
+        self.tiles = tiles
+        self.processes = processes
+        if tiles is not None:
+            if tiles < 1:
+                raise ValueError('tiles must be at least 1')
+            if set(self.entity_types) & {'zones', 'polygons'}:
+                raise ValueError('Tiled conversion does not produce zones and polygons')
+            if checkpoint_dir:
+                raise ValueError('Tiled conversion does not write checkpoints')
+
+    @property
+    def options(self) -> dict:
+        '''Options that change the output, for cache keys.'''
+        options = self.graph_options
+        if self.precision != DEFAULT_PRECISION:
+            options['precision'] = self.precision
+        if self.spatial_order is not None:
+            options['spatial_order'] = self.spatial_order
+        return options
+
+    @property
+    def graph_options(self) -> dict:
+        '''Options that change the graph, for checkpoint keys.'''
+        options = {}
+        if self.entity_types != OSWHelper.select_entity_types():
+            options['entity_types'] = list(self.entity_types)
+        if self.boundary is not None:
+            options['boundary'] = self.boundary.to_option()
+        return options
+
+    @staticmethod
+    def _boundary(boundary, clip: bool):
+        if boundary is None:
+            return None
+        from ..serializer.osm.osm_boundary import Boundary
+        return Boundary.from_input(boundary, clip)
+
+    @staticmethod
+    def _spatial_order(spatial_order):
+        if spatial_order is None:
+            return None
+        from ..serializer.osm.osm_order import check_spatial_order
+        check_spatial_order(spatial_order)
+        return spatial_order
+
+    def checkpoint_path(self, stage: str) -> Path:
+        return Path(self.checkpoint_dir, f'{self.filename}.{stage}.ckpt.npz')
+
+    def _latest_checkpoint(self):
+        if self._checkpoint_key is None:
+            # Only options that change the graph belong in the key, so
+            # output-only changes can resume from the checkpoints.
+            self._checkpoint_key = ConversionCache.key(self.osm_file_path, 'osm2osw', self.graph_options)
+        for stage in reversed(CHECKPOINT_STAGES):
+            path = self.checkpoint_path(stage)
+            if path.exists() and OSWHelper.read_checkpoint_meta(path).get('key') == self._checkpoint_key:
+                return stage, path
+        return None, None
 
     async def convert(self) -> Response:
+        metrics = Metrics(self.hooks)
         try:
             print('Creating networks from region extracts...')
-            tasks = [OSWHelper.get_osm_graph(self.osm_file_path)]
-            osm_graph_results = await asyncio.gather(*tasks)
-            osm_graph_results = list(osm_graph_results)
-            OG = osm_graph_results[0]
+            OG = None
+            stage = None
+            if self.checkpoint_dir:
+                os.makedirs(self.checkpoint_dir, exist_ok=True)
+                stage, path = self._latest_checkpoint()
+                if stage:
+                    print(f'Resuming from {stage} checkpoint...')
+                    OG = await OSWHelper.load_checkpoint(path, metrics)
+
+            if self.tiles is not None:
+                OG = await OSWHelper.get_tiled_osm_graph(self.osm_file_path, self.workdir, self.tiles, self.processes,
+                                                         self.node_cache_dir, metrics, self.entity_types,
+                                                         self.boundary)
+                # Tiles come back simplified and with their geometries
+                stage = 'construct_geometries'
+
+            if OG is None:
+                tasks = [OSWHelper.get_osm_graph(self.osm_file_path, self.node_cache_dir, metrics, self.entity_types,
+                                                 self.boundary)]
+                osm_graph_results = await asyncio.gather(*tasks)
+                osm_graph_results = list(osm_graph_results)
+                OG = osm_graph_results[0]
+                del tasks
+                del osm_graph_results
+                await self._checkpoint(OG, 'parse', metrics)
 
-            await OSWHelper.simplify_og(OG)
-            await OSWHelper.construct_geometries(OG)
+            if stage not in ('simplify', 'construct_geometries'):
+                await OSWHelper.simplify_og(OG, metrics)
+                await self._checkpoint(OG, 'simplify', metrics)
+
+            if stage != 'construct_geometries':
+                await OSWHelper.construct_geometries(OG, metrics)
 
             # for OG in osm_graph_results:
-            generated_files = await OSWHelper.write_og(self.workdir, self.filename, OG)
+            generated_files = await OSWHelper.write_og(self.workdir, self.filename, OG, metrics, self.entity_types,
+                                                     self.precision, self.spatial_order)
 
             print(f'Created OSW files!')
             self.generated_files = generated_files
 
-            del tasks
-            del osm_graph_results
             del OG
             del generated_files
-            resp = Response(status=True, generated_files=self.generated_files)
+            resp = Response(status=True, generated_files=self.generated_files, metrics=metrics.to_dict())
+        except Exception as error:
+            traceback.print_exc()
+            print(error)
+            resp = Response(status=False, error=str(error), metrics=metrics.to_dict())
+        finally:
+            gc.collect()
+        return resp
+
+    @staticmethod
+    async def convert_bytes(osm_data, file_format: Optional[str] = None, hooks=None, entity_types=None, boundary=None,
+                            clip: bool = False, precision: Optional[int] = DEFAULT_PRECISION,
+                            spatial_order: Optional[str] = None) -> Response:
+        '''Converts OSM data, given as PBF or XML bytes or a file-like object,
+        without touching the disk. Response.output holds the OSW feature
+        collections by file type; empty ones are left out, like the files
+        convert() skips. Coordinates are rounded to precision decimals
+        unless it is None, and features sorted along spatial_order, as in
+        the files.
+
+        Every call builds its own graph, so calls may run concurrently from
+        several threads, each with its own event loop.
+
+        '''
+        metrics = Metrics(hooks)
+        try:
+            entity_types = OSWHelper.select_entity_types(entity_types)
+            boundary = OSM2OSW._boundary(boundary, clip)
+            spatial_order = OSM2OSW._spatial_order(spatial_order)
+            if hasattr(osm_data, 'read'):
+                osm_data = osm_data.read()
+            OG = await OSWHelper.get_osm_graph_from_buffer(osm_data, file_format, metrics, entity_types, boundary)
+            del osm_data
+            await OSWHelper.simplify_og(OG, metrics)
+            await OSWHelper.construct_geometries(OG, metrics)
+            collections = await OSWHelper.og_to_feature_collections(OG, metrics, entity_types, precision,
+                                                                  spatial_order)
+            del OG
+            output = {name: fc for name, fc in collections.items() if fc['features']}
+            resp = Response(status=True, output=output, metrics=metrics.to_dict())
         except Exception as error:
             traceback.print_exc()
             print(error)
-            resp = Response(status=False, error=str(error))
+            resp = Response(status=False, error=str(error), metrics=metrics.to_dict())
         finally:
             gc.collect()
         return resp
+
+    async def _checkpoint(self, OG, stage: str, metrics: Metrics) -> None:
+        if self.checkpoint_dir:
+            await OSWHelper.save_checkpoint(OG, self.checkpoint_path(stage), stage, self._checkpoint_key, metrics)
@@ -1,37 +1,68 @@
+import os
 import gc
-import ogr2osm
+import json
+import uuid
 from pathlib import Path
 from ..helpers.osw import OSWHelper
+from ..helpers.metrics import Metrics
 from ..helpers.response import Response
-from ..serializer.osm.osm_normalizer import OSMNormalizer
 
 
 class OSW2OSM:
-    def __init__(self, zip_file_path: str, workdir: str, prefix: str):
+    def __init__(self, zip_file_path: str, workdir: str, prefix: str, hooks=None):
         self.zip_path = str(Path(zip_file_path))
         self.workdir = workdir
         self.prefix = prefix
+        # Profiling and tracing hooks around the stages, see helpers.hooks
+        self.hooks = hooks or []
+
+    @property
+    def options(self) -> dict:
+        '''Options that change the output, for cache keys. The conversion
+        has none yet.
+
+        '''
+        return {}
 
     def convert(self) -> Response:
+        metrics = Metrics(self.hooks)
+        tmp_file = None
         try:
-            unzipped_files = OSWHelper.unzip(self.zip_path, self.workdir)
-            input_file = OSWHelper.merge(osm_files=unzipped_files, output=self.workdir, prefix=self.prefix)
+            # ogr2osm loads GDAL, so it is only imported when converting
+            import ogr2osm
+            from ..serializer.osm.osm_normalizer import OSMNormalizer
+
+            with metrics.stage('unzip'):
+                unzipped_files = OSWHelper.unzip(self.zip_path, self.workdir)
+            with metrics.stage('merge'):
+                input_file = OSWHelper.merge(osm_files=unzipped_files, output=self.workdir, prefix=self.prefix,
+                                             metrics=metrics)
             output_file = Path(self.workdir, f'{self.prefix}.graph.osm.xml')
+            # Written under a temporary name and renamed over output_file, which
+            # may be a hard link to a result cache entry
+            tmp_file = f'{output_file}.{uuid.uuid4().hex}.tmp'
 
-            # Create the translation object.
-            translation_object = OSMNormalizer()
+            from ..serializer.osm.ogr_memory import OGR2OSM_LOCK
+            with OGR2OSM_LOCK:
+                with metrics.stage('ogr2osm_process'):
+                    # Create the translation object.
+                    translation_object = OSMNormalizer()
 
-            # Create the ogr datasource
-            datasource = ogr2osm.OgrDatasource(translation_object)
-            datasource.open_datasource(input_file)
+                    # Create the ogr datasource
+                    datasource = ogr2osm.OgrDatasource(translation_object)
+                    datasource.open_datasource(input_file)
 
-            # Instantiate the ogr to osm converter class ogr2osm. OsmData and start the conversion process
-            osm_data = ogr2osm.OsmData(translation_object)
-            osm_data.process(datasource)
+                    # Instantiate the ogr to osm converter class ogr2osm. OsmData and start the conversion process
+                    osm_data = ogr2osm.OsmData(translation_object)
+                    osm_data.process(datasource)
 
-            # Instantiate either ogr2osm.OsmDataWriter or ogr2osm.PbfDataWriter
-            data_writer = ogr2osm.OsmDataWriter(output_file, suppress_empty_tags=True)
-            osm_data.output(data_writer)
+                with metrics.stage('write'):
+                    # Instantiate either ogr2osm.OsmDataWriter or ogr2osm.PbfDataWriter
+                    data_writer = ogr2osm.OsmDataWriter(tmp_file, suppress_empty_tags=True)
+                    osm_data.output(data_writer)
+                    os.replace(tmp_file, output_file)
+            for entity_type, count in translation_object.counts.items():
+                metrics.count_out(entity_type, count)
 
             del translation_object
             del datasource
@@ -39,10 +70,60 @@ class OSW2OSM:
             del data_writer
             # Delete merge file
             Path(input_file).unlink()
-            resp = Response(status=True, generated_files=str(output_file))
+            resp = Response(status=True, generated_files=str(output_file), metrics=metrics.to_dict())
+        except Exception as error:
+            print(error)
+            resp = Response(status=False, error=str(error), metrics=metrics.to_dict())
+        finally:
+            if tmp_file and os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            gc.collect()
+        return resp
+
+    @staticmethod
+    def convert_bytes(zip_file, hooks=None) -> Response:
+        '''Converts an OSW zip, given as bytes or a file-like object, without
+        touching the disk. Response.output holds the OSM XML as bytes.
+
+        Safe to call from several threads, the ogr2osm step is serialized.
+
+        '''
+        metrics = Metrics(hooks)
+        try:
+            from ..serializer.osm.osm_normalizer import OSMNormalizer
+            from ..serializer.osm.ogr_memory import OGR2OSM_LOCK, GeoJSONDatasource, StringDataWriter
+            import ogr2osm
+
+            with metrics.stage('unzip'):
+                collections = OSWHelper.read_zip(zip_file)
+            with metrics.stage('merge'):
+                geojson = json.dumps(OSWHelper.merge_collections(collections, metrics))
+                del collections
+
+            with OGR2OSM_LOCK:
+                with metrics.stage('ogr2osm_process'):
+                    translation_object = OSMNormalizer()
+                    datasource = GeoJSONDatasource(translation_object)
+                    datasource.open_geojson(geojson)
+                    del geojson
+                    osm_data = ogr2osm.OsmData(translation_object)
+                    osm_data.process(datasource)
+
+                with metrics.stage('write'):
+                    data_writer = StringDataWriter(suppress_empty_tags=True)
+                    osm_data.output(data_writer)
+            for entity_type, count in translation_object.counts.items():
+                metrics.count_out(entity_type, count)
+
+            output = data_writer.value.encode('utf-8')
+            del translation_object
+            del datasource
+            del osm_data
+            del data_writer
+            resp = Response(status=True, output=output, metrics=metrics.to_dict())
         except Exception as error:
             print(error)
-            resp = Response(status=False, error=str(error))
+            resp = Response(status=False, error=str(error), metrics=metrics.to_dict())
         finally:
             gc.collect()
         return resp
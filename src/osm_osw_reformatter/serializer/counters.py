@@ -1,4 +1,8 @@
 import osmium
+from typing import Dict
+from dataclasses import dataclass, field
+from .osw.osw_normalizer import OSWWayNormalizer, OSWNodeNormalizer, OSWPointNormalizer, OSWLineNormalizer, \
+    OSWZoneNormalizer, OSWPolygonNormalizer
 
 
 class WayCounter(osmium.SimpleHandler):
@@ -52,4 +56,97 @@ class LineCounter(osmium.SimpleHandler):
         self.count = 0
 
     def way(self, n):
-        self.count += 1
\ No newline at end of file
+        self.count += 1
+
+
+# Keyed like the OSW entity types and the metrics counts
+ENTITY_TYPES = ('edges', 'nodes', 'points', 'lines', 'zones', 'polygons')
+
+
+@dataclass
+class EntityCounts:
+    raw: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(ENTITY_TYPES, 0))
+    osw: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(ENTITY_TYPES, 0))
+
+
+class EntityCounter(osmium.SimpleHandler):
+    '''Counts every entity type in a single pass, both raw and passing the
+    OSW filters.
+
+    Raw node and point counts are all nodes, raw edge and line counts are all
+    ways. Zones and polygons are counted without assembling areas: raw
+    counts are closed ways and multipolygon relations, which is what osmium
+    would try to assemble. OSW node counts include kerbs that may not end up
+    on the network, so they are an upper bound.
+
+    '''
+
+    AREA_RELATION_TYPES = ('multipolygon', 'boundary')
+
+    def __init__(self, way_filter=OSWWayNormalizer.osw_way_filter, node_filter=OSWNodeNormalizer.osw_node_filter,
+                 point_filter=OSWPointNormalizer.osw_point_filter, line_filter=OSWLineNormalizer.osw_line_filter,
+                 zone_filter=OSWZoneNormalizer.osw_zone_filter,
+                 polygon_filter=OSWPolygonNormalizer.osw_polygon_filter):
+        super().__init__()
+        self.counts = EntityCounts()
+        self.way_filter = way_filter
+        self.node_filter = node_filter
+        self.point_filter = point_filter
+        self.line_filter = line_filter
+        self.zone_filter = zone_filter
+        self.polygon_filter = polygon_filter
+
+    def node(self, n) -> None:
+        raw = self.counts.raw
+        raw['nodes'] += 1
+        raw['points'] += 1
+
+        # None of the OSW filters accepts an untagged node
+        tags = n.tags
+        if len(tags) == 0:
+            return
+
+        osw = self.counts.osw
+        if self.node_filter(tags):
+            osw['nodes'] += 1
+        if self.point_filter(tags):
+            osw['points'] += 1
+
+    def way(self, w) -> None:
+        raw = self.counts.raw
+        raw['edges'] += 1
+        raw['lines'] += 1
+
+        tags = w.tags
+        is_area = len(w.nodes) >= 4 and w.is_closed() and tags.get('area', '') != 'no'
+        if is_area:
+            raw['zones'] += 1
+            raw['polygons'] += 1
+
+        if len(tags) == 0:
+            return
+
+        osw = self.counts.osw
+        if self.way_filter(tags) and tags.get('area', '') != 'yes':
+            osw['edges'] += 1
+        if self.line_filter(tags):
+            osw['lines'] += 1
+        if is_area:
+            self._count_area(tags)
+
+    def relation(self, r) -> None:
+        tags = r.tags
+        if tags.get('type', '') not in self.AREA_RELATION_TYPES:
+            return
+
+        raw = self.counts.raw
+        raw['zones'] += 1
+        raw['polygons'] += 1
+        self._count_area(tags)
+
+    def _count_area(self, tags) -> None:
+        osw = self.counts.osw
+        if self.zone_filter(tags):
+            osw['zones'] += 1
+        if self.polygon_filter(tags):
+            osw['polygons'] += 1
@@ -0,0 +1,40 @@
+import io
+import threading
+import ogr2osm
+from osgeo import gdalconst, ogr
+
+# ogr2osm numbers OSM elements with a class level counter (OsmId), so only
+# one conversion may run at a time per process
+OGR2OSM_LOCK = threading.Lock()
+
+
+class GeoJSONDatasource(ogr2osm.OgrDatasource):
+    '''OgrDatasource reading a GeoJSON document from a string instead of a
+    file.
+
+    '''
+
+    def open_geojson(self, geojson: str) -> None:
+        # Same in-memory copy open_datasource makes of files
+        source = ogr.Open(geojson, gdalconst.GA_ReadOnly)
+        self.datasource = ogr.GetDriverByName('Memory').CopyDataSource(source, 'memoryCopy')
+
+
+class StringDataWriter(ogr2osm.OsmDataWriter):
+    '''OsmDataWriter collecting the OSM XML in memory. `value` holds the
+    document once written.
+
+    '''
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(None, **kwargs)
+        self.value = None
+
+    def open(self) -> None:
+        self.f = io.StringIO()
+
+    def close(self) -> None:
+        if self.f:
+            self.value = self.f.getvalue()
+            self.f.close()
+            self.f = None
@@ -0,0 +1,145 @@
+import json
+from pathlib import Path
+from typing import List
+import numpy as np
+import shapely
+from shapely.geometry import LineString, MultiPolygon, Polygon, box, shape
+from shapely.ops import unary_union
+
+# Cells per side of the grid a boundary indexes its bounds with
+GRID_CELLS = 64
+_OUTSIDE, _INSIDE, _CROSSED = 0, 1, 2
+
+
+class Boundary:
+    '''Area of interest of a conversion, a bbox or a GeoJSON (multi)polygon.
+
+    Parsers reject nodes and ways without any node inside the boundary.
+    Ways crossing it are kept whole, or cut at it with clip: network ways
+    keep the segments between nodes inside, as edges need OSM nodes at
+    both ends, while lines and polygons are cut at the outline. Zones are
+    made of OSM nodes too, so with clip only zones entirely inside are
+    kept. Locations on the outline count as inside.
+
+    Locations are looked up in a grid over the bounds first: cells entirely
+    inside or outside answer without touching the geometry, and only cells
+    the outline crosses run the prepared point in polygon test.
+
+    '''
+
+    def __init__(self, geometry, clip: bool = False) -> None:
+        if not isinstance(geometry, (Polygon, MultiPolygon)) or geometry.is_empty or geometry.area == 0:
+            raise ValueError('Boundary must be a bbox or a non-empty Polygon or MultiPolygon')
+        self.geometry = geometry
+        self.clip = bool(clip)
+        self.is_box = geometry.equals(box(*geometry.bounds))
+        shapely.prepare(self.geometry)
+        self._index()
+
+    def __reduce__(self):
+        # The prepared geometry and grid are rebuilt, not pickled
+        return Boundary, (self.geometry, self.clip)
+
+    @classmethod
+    def from_input(cls, boundary, clip: bool = False) -> 'Boundary':
+        '''Boundary from a (min lon, min lat, max lon, max lat) bbox, a
+        GeoJSON geometry, Feature or FeatureCollection as a dict, or the
+        path of a GeoJSON file.
+
+        '''
+        if isinstance(boundary, Boundary):
+            return boundary if boundary.clip == clip else cls(boundary.geometry, clip)
+        if isinstance(boundary, (str, Path)):
+            with open(boundary) as f:
+                boundary = json.load(f)
+        if isinstance(boundary, dict):
+            if boundary.get('type') == 'FeatureCollection':
+                geometry = unary_union([shape(feature['geometry']) for feature in boundary.get('features', [])])
+            elif boundary.get('type') == 'Feature':
+                geometry = shape(boundary['geometry'])
+            else:
+                geometry = shape(boundary)
+            return cls(geometry, clip)
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(value) for value in boundary)
+        except (TypeError, ValueError):
+            raise ValueError(f'Unsupported boundary {boundary!r}, expected a bbox or a GeoJSON polygon')
+        if min_lon >= max_lon or min_lat >= max_lat:
+            raise ValueError(f'Empty bbox {boundary!r}')
+        return cls(box(min_lon, min_lat, max_lon, max_lat), clip)
+
+    def to_option(self) -> dict:
+        '''JSON description, for cache and checkpoint keys.'''
+        return {'geometry': self.geometry.wkt, 'clip': self.clip}
+
+    def _index(self) -> None:
+        self.min_lon, self.min_lat, self.max_lon, self.max_lat = self.geometry.bounds
+        self._cell_lon = (self.max_lon - self.min_lon) / GRID_CELLS
+        self._cell_lat = (self.max_lat - self.min_lat) / GRID_CELLS
+        if self.is_box:
+            self._cells = np.full((GRID_CELLS, GRID_CELLS), _INSIDE, dtype=np.int8)
+            return
+        lons = self.min_lon + np.arange(GRID_CELLS) * self._cell_lon
+        lats = self.min_lat + np.arange(GRID_CELLS) * self._cell_lat
+        x0, y0 = np.meshgrid(lons, lats, indexing='ij')
+        cells = shapely.box(x0, y0, x0 + self._cell_lon, y0 + self._cell_lat)
+        self._cells = np.where(
+            shapely.covers(self.geometry, cells), _INSIDE,
+            np.where(shapely.intersects(self.geometry, cells), _CROSSED, _OUTSIDE)
+        ).astype(np.int8)
+
+    def contains(self, lon: float, lat: float) -> bool:
+        if not (self.min_lon <= lon <= self.max_lon and self.min_lat <= lat <= self.max_lat):
+            return False
+        i = min(int((lon - self.min_lon) / self._cell_lon), GRID_CELLS - 1)
+        j = min(int((lat - self.min_lat) / self._cell_lat), GRID_CELLS - 1)
+        cell = self._cells[i, j]
+        if cell != _CROSSED:
+            return cell == _INSIDE
+        return bool(shapely.intersects_xy(self.geometry, lon, lat))
+
+    def contains_nodes(self, nodes) -> List[bool]:
+        '''Whether each osmium node ref is inside, False without a valid
+        location.
+
+        '''
+        return [u.location.valid() and self.contains(u.lon, u.lat) for u in nodes]
+
+    def keeps_nodes(self, nodes) -> bool:
+        '''Whether a feature made of these OSM nodes is kept: with any node
+        inside, or all of them with clip.
+
+        '''
+        inside = self.contains_nodes(nodes)
+        return all(inside) if self.clip else any(inside)
+
+    def clip_line(self, coords: np.ndarray) -> List[np.ndarray]:
+        '''Parts of a line, as coordinate arrays, that are kept.'''
+        inside = [self.contains(lon, lat) for lon, lat in coords]
+        if not any(inside):
+            return []
+        if not self.clip or (all(inside) and self.is_box):
+            return [coords]
+        parts = LineString(coords).intersection(self.geometry)
+        return [np.asarray(part.coords, dtype=np.float64) for part in getattr(parts, 'geoms', [parts])
+                if isinstance(part, LineString) and not part.is_empty]
+
+    def clip_polygon(self, exterior: np.ndarray, interiors: List[np.ndarray]) -> List[tuple]:
+        '''Parts of a polygon, as (exterior, interiors) coordinate arrays,
+        that are kept.
+
+        '''
+        inside = [self.contains(lon, lat) for lon, lat in exterior]
+        if not any(inside):
+            return []
+        if not self.clip or (all(inside) and self.is_box):
+            return [(exterior, interiors)]
+        polygon = Polygon(exterior, interiors)
+        if not polygon.is_valid:
+            polygon = shapely.make_valid(polygon)
+        parts = polygon.intersection(self.geometry)
+        return [
+            (np.asarray(part.exterior.coords, dtype=np.float64),
+             [np.asarray(ring.coords, dtype=np.float64) for ring in part.interiors])
+            for part in getattr(parts, 'geoms', [parts]) if isinstance(part, Polygon) and not part.is_empty
+        ]
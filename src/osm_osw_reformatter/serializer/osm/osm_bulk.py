@@ -0,0 +1,120 @@
+from itertools import chain
+from typing import Iterable, List
+from contextlib import contextmanager
+import gc
+import networkx as nx
+
+
+@contextmanager
+def gc_paused():
+    '''Pauses garbage collection while building many acyclic containers,
+    which would otherwise trigger collections that scan the whole graph
+    again and again.
+
+    '''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def add_edges_in_bulk(G: nx.MultiDiGraph, u, v, data: List[dict]) -> None:
+    '''Adds edges (u[i], v[i]) with data[i] as their attribute dict to G,
+    with the nodes and keys G.add_edges_from would give them, without its
+    per-edge overhead.
+
+    '''
+    if not data:
+        return
+    # Nodes in the order of their first edge
+    G.add_nodes_from(dict.fromkeys(chain.from_iterable(zip(u, v))))
+
+    succ = G._succ
+    pred = G._pred
+    with gc_paused():
+        for a, b, d in zip(u, v, data):
+            keydict = succ[a].get(b)
+            if keydict is None:
+                # The same key dict is shared by both directions, as in
+                # add_edge
+                keydict = succ[a][b] = pred[b][a] = {}
+            # The lowest unused key, as in new_edge_key
+            key = len(keydict)
+            while key in keydict:
+                key += 1
+            keydict[key] = d
+    _clear_cache(G)
+
+
+def remove_edges_in_bulk(G: nx.MultiDiGraph, edges: Iterable[tuple]) -> None:
+    '''Removes one edge, the last one added, between every (u, v) pair of
+    edges from G, skipping missing ones, like G.remove_edges_from.
+
+    '''
+    succ = G._succ
+    pred = G._pred
+    for a, b in edges:
+        keydict = succ.get(a, {}).get(b)
+        if keydict is None:
+            continue
+        keydict.popitem()
+        if not keydict:
+            del succ[a][b]
+            del pred[b][a]
+    _clear_cache(G)
+
+
+def _clear_cache(G: nx.MultiDiGraph) -> None:
+    # Converted graphs cached by networkx 3.3+ are stale after G is changed
+    cache = getattr(G, '__networkx_cache__', None)
+    if cache:
+        cache.clear()
+
+
+def merge_chains(ways: Iterable[List[tuple]]) -> List[tuple]:
+    '''Chains of neighboring nodes simplify removes, from the removable
+    nodes of every way, as (node_in, node, node_out, segment). A chain is
+    (u, v, nodes, ndref): its first edge (u, v) is extended by ndref, the
+    node_out of each of its nodes, and the edges from its nodes are removed.
+
+    '''
+    with gc_paused():
+        return [chain for node_data in ways for chain in _way_chains(node_data)]
+
+
+def _way_chains(node_data: List[tuple]) -> List[tuple]:
+    # NOTE: an otherwise unconnected circular path would be removed, as all
+    # nodes are degree 2 and on the same way. This path is pointless for a
+    # network, but is something to keep in mind for any downstream
+    # analysis.
+
+    # Sort by segment number
+    sorted_node_data = list(sorted(node_data, key=lambda x: x[3]))
+
+    # First node matches last node_out?
+    is_circular = sorted_node_data[0][1] == sorted_node_data[-1][2]
+
+    # Split into lists of neighboring nodes
+    neighbors_list = []
+
+    neighbors = [sorted_node_data.pop(0)]
+    for node_in, node, node_out, segment_n in sorted_node_data:
+        if (segment_n - neighbors[-1][3]) != 1:
+            # Not neighbors!
+            neighbors_list.append(neighbors)
+            neighbors = [(node_in, node, node_out, segment_n)]
+        else:
+            # Neighbors!
+            neighbors.append((node_in, node, node_out, segment_n))
+    neighbors_list.append(neighbors)
+
+    # Detect neighbors in circular ways which are not completely disjoint from other ways
+    if is_circular and len(neighbors_list) > 1:
+        # Combine first and last neighbor lists
+        neighbors_list[-1].extend(neighbors_list.pop(0))
+
+    return [(neighbors[0][0], neighbors[0][1], [d[1] for d in neighbors], [d[2] for d in neighbors])
+            for neighbors in neighbors_list]
@@ -0,0 +1,284 @@
+import os
+import json
+import uuid
+from typing import Optional, Tuple
+import numpy as np
+import networkx as nx
+from .osm_features import FeatureStore, feature_stores
+from .osm_coordinates import NodeCoordinates
+from ...version import __version__
+
+CHECKPOINT_FORMAT = 3
+
+# Edge columns stored as arrays, flagged per edge in `edge_flags`
+HAS_OSM_ID = 1
+HAS_SEGMENT = 2
+HAS_NDREF = 4
+
+
+class _TagTable:
+    '''Deduplicates attribute dicts, which are mostly shared by all segments
+    of a way.
+
+    '''
+
+    def __init__(self) -> None:
+        self.index = {}
+        self.values = []
+
+    def add(self, d: dict) -> int:
+        if not d:
+            return -1
+        key = json.dumps(d, default=_jsonable)
+        idx = self.index.get(key)
+        if idx is None:
+            idx = len(self.values)
+            self.index[key] = idx
+            self.values.append(key)
+        return idx
+
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _offsets(lengths) -> np.ndarray:
+    return np.concatenate(([0], np.cumsum(lengths, dtype=np.int64))).astype(np.int64)
+
+
+def _store_arrays(name: str, store: FeatureStore, tags: _TagTable) -> dict:
+    '''Columns of a feature store. The coordinate rings of every feature,
+    ndref first for lines and polygons and then indref, are concatenated,
+    as are the node ids of zone outlines.
+
+    '''
+    feature_rings = []
+    for i in range(len(store)):
+        rings = [] if name == 'zones' or not store.ndref else [store.ndref[i]]
+        feature_rings.append(rings + (store.indref[i] if store.indref else []))
+    rings = [ring for rings in feature_rings for ring in rings]
+    refs = store.ndref if name == 'zones' else []
+    return {
+        f'{name}_ids': _encode(store.ids),
+        f'{name}_tags': np.array([tags.add(d) for d in store.tags], dtype=np.int32),
+        f'{name}_x': np.array(store.x, dtype=np.int32),
+        f'{name}_y': np.array(store.y, dtype=np.int32),
+        f'{name}_coords': np.concatenate(rings).reshape(-1, 2) if rings else np.empty((0, 2), dtype=np.int32),
+        f'{name}_ring_offsets': _offsets([len(ring) for ring in rings]),
+        f'{name}_feature_rings': _offsets([len(rings) for rings in feature_rings]),
+        f'{name}_refs': np.array([int(ref) for ndref in refs for ref in ndref], dtype=np.int64),
+        f'{name}_ref_offsets': _offsets([len(ndref) for ndref in refs])
+    }
+
+
+def _read_store(data, name: str, tag_table: list) -> FeatureStore:
+    coords = data[f'{name}_coords']
+    ring_offsets = data[f'{name}_ring_offsets'].tolist()
+    rings = [coords[start:end].copy() for start, end in zip(ring_offsets[:-1], ring_offsets[1:])]
+    feature_rings = data[f'{name}_feature_rings'].tolist()
+    refs = data[f'{name}_refs'].tolist()
+    ref_offsets = data[f'{name}_ref_offsets'].tolist()
+    x = data[f'{name}_x'].tolist()
+    y = data[f'{name}_y'].tolist()
+
+    store = FeatureStore(name)
+    for i, (_id, t) in enumerate(zip(_decode(data[f'{name}_ids']), data[f'{name}_tags'].tolist())):
+        tags = {**tag_table[t]} if t >= 0 else {}
+        feature = rings[feature_rings[i]:feature_rings[i + 1]]
+        if name == 'points':
+            store.add(_id, tags, x=x[i], y=y[i])
+        elif name == 'lines':
+            store.add(_id, tags, ndref=feature[0])
+        elif name == 'zones':
+            ndref = [str(ref) for ref in refs[ref_offsets[i]:ref_offsets[i + 1]]]
+            store.add(_id, tags, ndref=ndref, indref=feature)
+        else:
+            store.add(_id, tags, ndref=feature[0], indref=feature[1:])
+    return store
+
+
+def _encode(obj) -> np.ndarray:
+    return np.frombuffer(json.dumps(obj).encode('utf-8'), dtype=np.uint8)
+
+
+def _decode(arr: np.ndarray):
+    return json.loads(arr.tobytes().decode('utf-8'))
+
+
+def write_checkpoint(G: nx.MultiDiGraph, path: str, meta: dict, features: Optional[dict] = None,
+                     coordinates: Optional[NodeCoordinates] = None) -> None:
+    '''Writes the graph, its node coordinates and its feature stores, before
+    geometries are built, as flat arrays plus a deduplicated tag table.
+
+    Integer node ids and coordinates, edge endpoints, way ids, segment
+    numbers and node references are stored as arrays, as are the fixed-point
+    node locations and the locations and rings of features. Any other
+    attribute goes through the tag table as JSON. The file is written to a
+    temporary name first, so an interrupted write never leaves a truncated
+    checkpoint. The library version is stored next to the format, as parser
+    changes between versions would make an old graph stale.
+
+    '''
+    tags = _TagTable()
+
+    n_nodes = G.number_of_nodes()
+    node_ids = np.zeros(n_nodes, dtype=np.int64)
+    node_str = np.full(n_nodes, -1, dtype=np.int32)
+    node_lon = np.full(n_nodes, np.nan)
+    node_lat = np.full(n_nodes, np.nan)
+    node_tags = np.empty(n_nodes, dtype=np.int32)
+    str_ids = []
+    for i, (n, d) in enumerate(G.nodes(data=True)):
+        if isinstance(n, int):
+            node_ids[i] = n
+        else:
+            node_str[i] = len(str_ids)
+            str_ids.append(n)
+        d = dict(d)
+        if 'lon' in d and 'lat' in d:
+            node_lon[i] = d.pop('lon')
+            node_lat[i] = d.pop('lat')
+        node_tags[i] = tags.add(d)
+
+    n_edges = G.number_of_edges()
+    edge_u = np.empty(n_edges, dtype=np.int64)
+    edge_v = np.empty(n_edges, dtype=np.int64)
+    edge_key = np.empty(n_edges, dtype=np.int32)
+    edge_flags = np.zeros(n_edges, dtype=np.uint8)
+    edge_osm_id = np.zeros(n_edges, dtype=np.int64)
+    edge_segment = np.zeros(n_edges, dtype=np.int32)
+    edge_tags = np.empty(n_edges, dtype=np.int32)
+    ndref_offsets = np.zeros(n_edges + 1, dtype=np.int64)
+    ndref = []
+    for i, (u, v, k, d) in enumerate(G.edges(keys=True, data=True)):
+        edge_u[i] = u
+        edge_v[i] = v
+        edge_key[i] = k
+        d = dict(d)
+        flags = 0
+        if isinstance(d.get('osm_id'), int):
+            edge_osm_id[i] = d.pop('osm_id')
+            flags |= HAS_OSM_ID
+        if isinstance(d.get('segment'), int):
+            edge_segment[i] = d.pop('segment')
+            flags |= HAS_SEGMENT
+        if isinstance(d.get('ndref'), list) and all(isinstance(ref, int) for ref in d['ndref']):
+            ndref.extend(d.pop('ndref'))
+            flags |= HAS_NDREF
+        ndref_offsets[i + 1] = len(ndref)
+        edge_flags[i] = flags
+        edge_tags[i] = tags.add(d)
+
+    store_arrays = {}
+    for name, store in (features or {}).items():
+        store_arrays.update(_store_arrays(name, store, tags))
+    coord_ids, coord_x, coord_y = (coordinates or NodeCoordinates()).arrays()
+
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                meta=_encode({**meta, 'format': CHECKPOINT_FORMAT, 'version': __version__}),
+                tag_table=_encode(tags.values),
+                str_ids=_encode(str_ids),
+                node_ids=node_ids,
+                node_str=node_str,
+                node_lon=node_lon,
+                node_lat=node_lat,
+                node_tags=node_tags,
+                edge_u=edge_u,
+                edge_v=edge_v,
+                edge_key=edge_key,
+                edge_flags=edge_flags,
+                edge_osm_id=edge_osm_id,
+                edge_segment=edge_segment,
+                edge_tags=edge_tags,
+                ndref=np.array(ndref, dtype=np.int64),
+                ndref_offsets=ndref_offsets,
+                coord_ids=coord_ids,
+                coord_x=coord_x,
+                coord_y=coord_y,
+                feature_stores=_encode(list(features or {})),
+                **store_arrays
+            )
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _supported(meta: dict) -> bool:
+    return meta.get('format') == CHECKPOINT_FORMAT and meta.get('version') == __version__
+
+
+def read_checkpoint_meta(path: str) -> dict:
+    '''Metadata of a checkpoint, empty for checkpoints of another format or
+    library version, which read_checkpoint won't load.
+
+    '''
+    with np.load(path) as data:
+        meta = _decode(data['meta'])
+    return meta if _supported(meta) else {}
+
+
+def read_checkpoint(path: str) -> Tuple[nx.MultiDiGraph, dict, NodeCoordinates]:
+    '''The graph, the feature stores by entity type and the node
+    coordinates.
+
+    '''
+    with np.load(path) as data:
+        meta = _decode(data['meta'])
+        if not _supported(meta):
+            raise ValueError(f'Unsupported checkpoint format or version in {path}')
+        tag_table = [json.loads(value) for value in _decode(data['tag_table'])]
+        str_ids = _decode(data['str_ids'])
+
+        G = nx.MultiDiGraph()
+
+        node_ids = data['node_ids'].tolist()
+        node_str = data['node_str'].tolist()
+        node_lon = data['node_lon'].tolist()
+        node_lat = data['node_lat'].tolist()
+        node_tags = data['node_tags'].tolist()
+        nodes = []
+        for n, s, lon, lat, t in zip(node_ids, node_str, node_lon, node_lat, node_tags):
+            d = {**tag_table[t]} if t >= 0 else {}
+            if lon == lon:
+                d['lon'] = lon
+                d['lat'] = lat
+            if s >= 0:
+                nodes.append((str_ids[s], d))
+            else:
+                nodes.append((n, d))
+        G.add_nodes_from(nodes)
+
+        edge_flags = data['edge_flags'].tolist()
+        edge_osm_id = data['edge_osm_id'].tolist()
+        edge_segment = data['edge_segment'].tolist()
+        edge_tags = data['edge_tags'].tolist()
+        ndref = data['ndref'].tolist()
+        ndref_offsets = data['ndref_offsets'].tolist()
+        edges = []
+        for i, (u, v, k) in enumerate(zip(data['edge_u'].tolist(), data['edge_v'].tolist(),
+                                          data['edge_key'].tolist())):
+            t = edge_tags[i]
+            d = {**tag_table[t]} if t >= 0 else {}
+            flags = edge_flags[i]
+            if flags & HAS_OSM_ID:
+                d['osm_id'] = edge_osm_id[i]
+            if flags & HAS_SEGMENT:
+                d['segment'] = edge_segment[i]
+            if flags & HAS_NDREF:
+                d['ndref'] = ndref[ndref_offsets[i]:ndref_offsets[i + 1]]
+            edges.append((u, v, k, d))
+        G.add_edges_from(edges)
+
+        features = feature_stores()
+        for name in _decode(data['feature_stores']):
+            features[name] = _read_store(data, name, tag_table)
+        coordinates = NodeCoordinates.from_arrays(data['coord_ids'], data['coord_x'], data['coord_y'])
+
+    return G, features, coordinates
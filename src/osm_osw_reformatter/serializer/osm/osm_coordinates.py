@@ -0,0 +1,100 @@
+from array import array
+from typing import Iterable
+import numpy as np
+
+# OSM stores locations as integers in units of 1e-7 degree
+COORDINATE_PRECISION = 10000000
+
+
+def to_degrees(fixed) -> np.ndarray:
+    '''Float degrees of fixed-point coordinates, equal to what osmium
+    returns for the same location.
+
+    '''
+    return np.asarray(fixed, dtype=np.float64) / COORDINATE_PRECISION
+
+
+def to_fixed(degrees) -> np.ndarray:
+    return np.rint(np.asarray(degrees, dtype=np.float64) * COORDINATE_PRECISION).astype(np.int32)
+
+
+class NodeCoordinates:
+    '''Locations of network nodes as fixed-point x and y at OSM precision,
+    in arrays sorted by node id: 16 bytes a node, where lon and lat floats
+    in the node attribute dict take about 100.
+
+    Parsers add locations one at a time; they are sorted into the arrays
+    at the next lookup, and a node added twice keeps its first location.
+
+    '''
+
+    def __init__(self) -> None:
+        self._ids = np.empty(0, dtype=np.int64)
+        self._x = np.empty(0, dtype=np.int32)
+        self._y = np.empty(0, dtype=np.int32)
+        self._pending_ids = array('q')
+        self._pending_x = array('i')
+        self._pending_y = array('i')
+
+    @classmethod
+    def from_arrays(cls, ids, x, y) -> 'NodeCoordinates':
+        coordinates = cls()
+        coordinates._append(ids, x, y)
+        return coordinates
+
+    def add(self, ref: int, x: int, y: int) -> None:
+        self._pending_ids.append(ref)
+        self._pending_x.append(x)
+        self._pending_y.append(y)
+
+    def extend(self, other: 'NodeCoordinates') -> None:
+        self._append(*other.arrays())
+
+    def _append(self, ids, x, y) -> None:
+        self._pending_ids.frombytes(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+        self._pending_x.frombytes(np.ascontiguousarray(x, dtype=np.int32).tobytes())
+        self._pending_y.frombytes(np.ascontiguousarray(y, dtype=np.int32).tobytes())
+
+    def arrays(self) -> tuple:
+        '''Sorted node ids and their x and y.'''
+        if self._pending_ids:
+            ids = np.concatenate((self._ids, np.frombuffer(self._pending_ids, dtype=np.int64)))
+            x = np.concatenate((self._x, np.frombuffer(self._pending_x, dtype=np.int32)))
+            y = np.concatenate((self._y, np.frombuffer(self._pending_y, dtype=np.int32)))
+            self._ids, first = np.unique(ids, return_index=True)
+            self._x = x[first]
+            self._y = y[first]
+            self._pending_ids = array('q')
+            self._pending_x = array('i')
+            self._pending_y = array('i')
+        return self._ids, self._x, self._y
+
+    def __len__(self) -> int:
+        return len(self.arrays()[0])
+
+    def _rows(self, refs) -> tuple:
+        ids = self.arrays()[0]
+        refs = np.asarray(refs)
+        if refs.dtype.kind not in 'iu' or len(ids) == 0:
+            # Ids of graphs built by hand may be anything
+            return np.zeros(len(refs), dtype=np.int64), np.zeros(len(refs), dtype=bool)
+        rows = np.minimum(np.searchsorted(ids, refs), len(ids) - 1)
+        return rows, ids[rows] == refs
+
+    def degrees(self, refs: Iterable[int]) -> np.ndarray:
+        '''(n, 2) float longitudes and latitudes of nodes, NaN for nodes
+        without a location.
+
+        '''
+        refs = list(refs)
+        rows, found = self._rows(refs)
+        coords = np.full((len(refs), 2), np.nan)
+        coords[found, 0] = to_degrees(self._x[rows[found]])
+        coords[found, 1] = to_degrees(self._y[rows[found]])
+        return coords
+
+    def subset(self, refs: Iterable[int]) -> 'NodeCoordinates':
+        '''Locations of the given nodes only.'''
+        rows, found = self._rows(list(refs))
+        rows = rows[found]
+        return NodeCoordinates.from_arrays(self._ids[rows], self._x[rows], self._y[rows])
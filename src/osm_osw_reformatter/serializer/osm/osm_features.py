@@ -0,0 +1,80 @@
+from array import array
+from itertools import compress
+from typing import Dict, Iterable, Optional
+from .osm_coordinates import to_degrees
+
+# OSW entity types kept outside the network graph, in output order
+FEATURE_ENTITY_TYPES = ('points', 'lines', 'zones', 'polygons')
+
+
+class FeatureStore:
+    '''Features of one OSW entity type outside the pedestrian network:
+    points, lines, zones or polygons. They are kept column by column beside
+    the network graph, so that network stages never scan them.
+
+    Every feature has an OSW id, without the prefix graph node ids would
+    need, and its normalized tags. Coordinates are fixed-point integers at
+    OSM precision (see osm_coordinates): point locations in x and y arrays,
+    and an (n, 2) int32 array per ring of lines and polygons in ndref and
+    indref. Zone outlines are the ids, as strings, of the network nodes
+    they are made of. construct_geometries fills geometry, with LazyGeometry
+    values, and drops ndref and indref.
+
+    '''
+
+    LIST_COLUMNS = ('ids', 'tags', 'ndref', 'indref', 'geometry')
+
+    def __init__(self, entity_type: str) -> None:
+        self.entity_type = entity_type
+        self.ids = []
+        self.tags = []
+        self.x = array('i')
+        self.y = array('i')
+        self.ndref = []
+        self.indref = []
+        self.geometry = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, _id: str, tags: dict, x: Optional[int] = None, y: Optional[int] = None, ndref=None,
+            indref=None) -> None:
+        self.ids.append(_id)
+        self.tags.append(tags)
+        if x is not None:
+            self.x.append(x)
+            self.y.append(y)
+        if ndref is not None:
+            self.ndref.append(ndref)
+        if indref is not None:
+            self.indref.append(indref)
+
+    def location(self, i: int) -> tuple:
+        '''Longitude and latitude of a point, or of the first node of a line
+        or polygon.
+
+        '''
+        x, y = (self.x[i], self.y[i]) if self.x else self.ndref[i][0]
+        return float(to_degrees(x)), float(to_degrees(y))
+
+    def select(self, keep: Iterable[bool]) -> 'FeatureStore':
+        '''New store of the features flagged in keep.'''
+        keep = list(keep)
+        store = FeatureStore(self.entity_type)
+        for column in self.LIST_COLUMNS:
+            values = getattr(self, column)
+            if values:
+                setattr(store, column, list(compress(values, keep)))
+        store.x = array('i', compress(self.x, keep))
+        store.y = array('i', compress(self.y, keep))
+        return store
+
+    def extend(self, other: 'FeatureStore') -> None:
+        for column in self.LIST_COLUMNS:
+            getattr(self, column).extend(getattr(other, column))
+        self.x.extend(other.x)
+        self.y.extend(other.y)
+
+
+def feature_stores() -> Dict[str, FeatureStore]:
+    return {name: FeatureStore(name) for name in FEATURE_ENTITY_TYPES}
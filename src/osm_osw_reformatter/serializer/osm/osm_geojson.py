@@ -0,0 +1,36 @@
+import json
+from typing import IO
+
+# Decimals of output coordinates by default: OSM's own precision, see
+# osm_coordinates
+DEFAULT_PRECISION = 7
+
+# Features encoded per json.dumps call by dump_feature_collection
+FEATURE_CHUNK_SIZE = 1000
+
+
+def dump_feature_collection(fc: dict, f: IO[str], chunk_size: int = FEATURE_CHUNK_SIZE) -> None:
+    '''Writes a GeoJSON feature collection to the text file f, the same text
+    json.dump(fc, f) writes.
+
+    json.dump goes through the pure Python encoder to stream its output;
+    here the features are encoded chunk_size at a time with json.dumps,
+    which uses the C encoder, and only one chunk is held as a string.
+
+    '''
+    f.write('{')
+    separator = ''
+    for key, value in fc.items():
+        f.write(f'{separator}{json.dumps(key)}: ')
+        separator = ', '
+        if key != 'features' or not isinstance(value, list):
+            f.write(json.dumps(value))
+            continue
+        f.write('[')
+        for start in range(0, len(value), chunk_size):
+            if start:
+                f.write(', ')
+            # Drop the brackets around the chunk
+            f.write(json.dumps(value[start:start + chunk_size])[1:-1])
+        f.write(']')
+    f.write('}')
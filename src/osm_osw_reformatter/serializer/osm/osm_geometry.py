@@ -0,0 +1,88 @@
+import math
+from typing import Optional, Sequence
+import numpy as np
+from shapely.geometry import LineString, Point, Polygon
+
+
+class LazyGeometry:
+    '''Geometry of a feature kept as float degree coordinates: a (lon, lat)
+    pair for points, an (n, 2) array for line strings and a list of such
+    rings for polygons.
+
+    GeoJSON output and lengths read the coordinates directly. It has a
+    __geo_interface__, so shapely's mapping and shape take it like a shapely
+    geometry, and to_shape makes the shapely geometry itself when asked,
+    e.g. by OSMGraph.get_graph.
+
+    '''
+
+    __slots__ = ('type', 'coordinates')
+
+    def __init__(self, type: str, coordinates) -> None:
+        self.type = type
+        self.coordinates = coordinates
+
+    @classmethod
+    def point(cls, lon: float, lat: float) -> 'LazyGeometry':
+        return cls('Point', (lon, lat))
+
+    @classmethod
+    def line_string(cls, coords: np.ndarray) -> 'LazyGeometry':
+        return cls('LineString', coords)
+
+    @classmethod
+    def polygon(cls, exterior: np.ndarray, interiors: Sequence[np.ndarray] = ()) -> 'LazyGeometry':
+        # Rings are closed, as shapely closes them
+        return cls('Polygon', [_closed(ring) for ring in (exterior, *interiors)])
+
+    def __repr__(self) -> str:
+        return f'LazyGeometry({self.type!r}, {self.coordinates!r})'
+
+    @property
+    def __geo_interface__(self) -> dict:
+        return self.geojson()
+
+    def geojson(self, precision: Optional[int] = None) -> dict:
+        '''GeoJSON geometry, with coordinates rounded to precision decimals
+        unless it is None.
+
+        '''
+        if self.type == 'Point':
+            coordinates = list(round_coordinates(self.coordinates, precision))
+        elif self.type == 'LineString':
+            coordinates = round_coordinates(self.coordinates, precision).tolist()
+        else:
+            coordinates = [round_coordinates(ring, precision).tolist() for ring in self.coordinates]
+        return {'type': self.type, 'coordinates': coordinates}
+
+    def to_shape(self):
+        if self.type == 'Point':
+            return Point(*self.coordinates)
+        if self.type == 'LineString':
+            return LineString(self.coordinates)
+        return Polygon(self.coordinates[0], self.coordinates[1:])
+
+
+def round_coordinates(coordinates, precision: Optional[int]):
+    '''Coordinates rounded to precision decimals: an array, or a number or
+    nested sequences of numbers such as shapely's mapping gives. Arrays and
+    numbers round the same way, half to even at the last decimal, so a node
+    and the edge ends at it stay equal.
+
+    '''
+    if precision is None:
+        return coordinates
+    scale = 10.0 ** precision
+    if isinstance(coordinates, np.ndarray):
+        return np.rint(coordinates * scale) / scale
+    if isinstance(coordinates, (int, float)):
+        return round(coordinates * scale) / scale if math.isfinite(coordinates) else coordinates
+    return [round_coordinates(c, precision) for c in coordinates]
+
+
+def _closed(ring: np.ndarray) -> np.ndarray:
+    ring = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+    if len(ring) and not np.array_equal(ring[0], ring[-1]):
+        ring = np.vstack((ring, ring[:1]))
+    return ring
+
@@ -1,29 +1,66 @@
-from typing import List, Optional
+from array import array
+from typing import Iterable, List, Optional
+import os
 import json
+import uuid
+import functools
 import pyproj
 import osmium
+import numpy as np
 import networkx as nx
-from shapely.geometry import LineString, Point, Polygon, mapping, shape
-from ..osw.osw_normalizer import OSW_SCHEMA_ID, OSWPointNormalizer, OSWWayNormalizer, OSWNodeNormalizer, OSWLineNormalizer, OSWZoneNormalizer, OSWPolygonNormalizer
+from shapely.geometry import mapping, shape
+from .osm_locations import NodeLocationCache
+from .osm_bulk import gc_paused, add_edges_in_bulk, remove_edges_in_bulk, merge_chains
+from .osm_boundary import Boundary
+from .osm_features import FeatureStore, feature_stores
+from .osm_coordinates import COORDINATE_PRECISION, NodeCoordinates, to_degrees, to_fixed
+from .osm_geometry import LazyGeometry, round_coordinates
+from .osm_geojson import DEFAULT_PRECISION, dump_feature_collection
+from .osm_order import check_spatial_order, spatial_order
+from ...helpers.metrics import Metrics
+from .osm_checkpoint import write_checkpoint, read_checkpoint, read_checkpoint_meta
+from ..osw.osw_normalizer import OSW_SCHEMA_ID, OSW_ENTITY_TYPES, DEFAULT_ENTITY_TYPES, OSWPointNormalizer, OSWWayNormalizer, OSWNodeNormalizer, OSWLineNormalizer, OSWZoneNormalizer, OSWPolygonNormalizer
+
+# Kind of network node, recorded by the parsers and from_geojson under KIND
+# so that later stages don't classify tags again. Plain way nodes have none;
+# graphs built by hand must record it the same way.
+KIND = '_kind'
+KIND_KERB = 1
 
 
 class OSMWayParser(osmium.SimpleHandler):
-    def __init__(self, way_filter: Optional[callable], progressbar: Optional[callable] = None) -> None:
+    def __init__(self, way_filter: Optional[callable], progressbar: Optional[callable] = None,
+                 boundary: Optional[Boundary] = None) -> None:
         osmium.SimpleHandler.__init__(self)
         self.G = nx.MultiDiGraph()
+        self.coordinates = NodeCoordinates()
+        # Segments are buffered during the pass and added to G in bulk by
+        # build_graph
+        self._u = array('q')
+        self._v = array('q')
+        self._edge_data = []
         if way_filter is None:
             self.way_filter = lambda w: True
         else:
             self.way_filter = way_filter
         self.progressbar = progressbar
+        self.boundary = boundary
+        self.count = 0
 
     def way(self, w) -> None:
+        self.count += 1
         if self.progressbar:
             self.progressbar.update(1)
 
         if not self.way_filter(w.tags):
             return
 
+        inside = None
+        if self.boundary is not None:
+            inside = self.boundary.contains_nodes(w.nodes)
+            if not any(inside):
+                return
+
         d = {'osm_id': int(w.id)}
 
         tags = dict(w.tags)
@@ -34,32 +71,50 @@ class OSMWayParser(osmium.SimpleHandler):
 
         d2 = {**d, **OSWWayNormalizer(tags).normalize()}
 
-        for i in range(len(w.nodes) - 1):
-            u = w.nodes[i]
-            v = w.nodes[i + 1]
+        nodes = w.nodes
+        coordinates = self.coordinates
+        # Index of the last node whose location was recorded, so nodes shared
+        # by consecutive segments are recorded once
+        added = -1
+        for i in range(len(nodes) - 1):
+            u = nodes[i]
+            v = nodes[i + 1]
 
             if not u.location.valid() or not v.location.valid():
                 continue
-            # NOTE: why are the coordinates floats? Wouldn't fix
-            # precision be better?
+            if inside is not None and self.boundary.clip and not (inside[i] and inside[i + 1]):
+                continue
             u_ref = int(u.ref)
-            u_lon = float(u.lon)
-            u_lat = float(u.lat)
             v_ref = int(v.ref)
-            v_lon = float(v.lon)
-            v_lat = float(v.lat)
+            # Locations are kept at OSM's own fixed precision, see
+            # NodeCoordinates
+            if added != i:
+                coordinates.add(u_ref, u.x, u.y)
+            coordinates.add(v_ref, v.x, v.y)
+            added = i + 1
 
             d3 = {**d2}
             d3['segment'] = i
             d3['ndref'] = [u_ref, v_ref]
-            self.G.add_edges_from([(u_ref, v_ref, d3)])
-            self.G.add_node(u_ref, lon=u_lon, lat=u_lat)
-            self.G.add_node(v_ref, lon=v_lon, lat=v_lat)
+            self._u.append(u_ref)
+            self._v.append(v_ref)
+            self._edge_data.append(d3)
             del u
             del v
 
         del w
 
+    def build_graph(self) -> nx.MultiDiGraph:
+        '''Adds the buffered segments to G, in the order they were parsed,
+        and returns it.
+
+        '''
+        add_edges_in_bulk(self.G, self._u, self._v, self._edge_data)
+        self._u = array('q')
+        self._v = array('q')
+        self._edge_data = []
+        return self.G
+
 
 class OSMNodeParser(osmium.SimpleHandler):
     def __init__(self, G: nx.MultiDiGraph, node_filter: Optional[callable] = None,
@@ -77,8 +132,10 @@ class OSMNodeParser(osmium.SimpleHandler):
         else:
             self.node_filter = node_filter
         self.progressbar = progressbar
+        self.count = 0
 
     def node(self, n) -> None:
+        self.count += 1
         if self.progressbar:
             self.progressbar.update(1)
 
@@ -93,26 +150,35 @@ class OSMNodeParser(osmium.SimpleHandler):
         tags = dict(n.tags)
 
         d2 = {**d, **OSWNodeNormalizer(tags).normalize()}
+        d2[KIND] = KIND_KERB
 
         self.G.add_node(n.id, **d2)
 
 
 class OSMPointParser(osmium.SimpleHandler):
     def __init__(self, G: nx.MultiDiGraph, point_filter: Optional[callable] = None,
-                 progressbar: Optional[callable] = None) -> None:
+                 progressbar: Optional[callable] = None, boundary: Optional[Boundary] = None,
+                 store: Optional[FeatureStore] = None) -> None:
         """
 
         :param G: MultiDiGraph that already has ways inserted as edges.
         :type G: nx.MultiDiGraph
+        :param store: FeatureStore the points are added to, a new one by
+            default. Points are not added to G.
+        :type store: FeatureStore
 
         """
         osmium.SimpleHandler.__init__(self)
         self.G = G
+        self.store = FeatureStore('points') if store is None else store
         if point_filter is None:
             self.point_filter = lambda w: True
         else:
             self.point_filter = point_filter
         self.progressbar = progressbar
+        self.boundary = boundary
+        # Nodes made into points
+        self.count = 0
 
     def node(self, n) -> None:
         if self.progressbar:
@@ -121,30 +187,42 @@ class OSMPointParser(osmium.SimpleHandler):
         if not self.point_filter(n.tags):
             return
 
+        if self.boundary is not None and not (n.location.valid() and self.boundary.contains(n.location.lon,
+                                                                                            n.location.lat)):
+            return
+
         d = {}
 
         tags = dict(n.tags)
 
         d2 = {**d, **OSWPointNormalizer(tags).normalize()}
 
-        self.G.add_node("p" + str(n.id), lon=n.location.lon, lat=n.location.lat, **d2)
+        self.store.add(str(n.id), d2, x=n.location.x, y=n.location.y)
+        self.count += 1
 
 
 class OSMLineParser(osmium.SimpleHandler):
-    def __init__(self, G, line_filter=None, progressbar=None):
+    def __init__(self, G, line_filter=None, progressbar=None, boundary=None, store=None):
         """
 
         :param G: MultiDiGraph that already has ways inserted as edges.
         :type G: nx.MultiDiGraph
+        :param store: FeatureStore the lines are added to, a new one by
+            default. Lines are not added to G.
+        :type store: FeatureStore
 
         """
         osmium.SimpleHandler.__init__(self)
         self.G = G
+        self.store = FeatureStore('lines') if store is None else store
         if line_filter is None:
             self.line_filter = lambda w: True
         else:
             self.line_filter = line_filter
         self.progressbar = progressbar
+        self.boundary = boundary
+        # Ways made into lines
+        self.count = 0
 
     def way(self, w):
         if self.progressbar:
@@ -153,43 +231,52 @@ class OSMLineParser(osmium.SimpleHandler):
         if not self.line_filter(w.tags):
             return
 
+        parts = [coordinate_array(w.nodes)]
+        if self.boundary is not None:
+            parts = [to_fixed(part) for part in self.boundary.clip_line(to_degrees(parts[0]))]
+            if not parts:
+                return
+
         d = {}
         tags = dict(w.tags)
 
         d2 = {**d, **OSWLineNormalizer(tags).normalize()}
 
-        ndref = []
-        for i in range(len(w.nodes)):
-            u = w.nodes[i]
-
-            u_lon = float(u.lon)
-            u_lat = float(u.lat)
-
-            ndref.append([u_lon, u_lat])
-            del u
-        
-        d3 = {**d2}
-        d3["ndref"] = ndref
-        self.G.add_node("l" + str(w.id), **d3)
+        # Parts of a line cut by the boundary are numbered like zones
+        for i, ndref in enumerate(parts):
+            self.store.add(str(w.id) + (str(i) if i > 0 else ""), {**d2}, ndref=ndref)
+        self.count += 1
 
         del w
 
 
 class OSMZoneParser(osmium.SimpleHandler):
-    def __init__(self, G, zone_filter=None, progressbar=None):
+    def __init__(self, G, zone_filter=None, progressbar=None, boundary=None, coordinates=None, store=None):
         """
 
-        :param G: MultiDiGraph that already has ways inserted as edges.
+        :param G: MultiDiGraph that already has ways inserted as edges. The
+            nodes of zone outlines are added to it.
         :type G: nx.MultiDiGraph
+        :param coordinates: Locations of the nodes of G, new ones by
+            default.
+        :type coordinates: NodeCoordinates
+        :param store: FeatureStore the zones are added to, a new one by
+            default.
+        :type store: FeatureStore
 
         """
         osmium.SimpleHandler.__init__(self)
         self.G = G
+        self.coordinates = NodeCoordinates() if coordinates is None else coordinates
+        self.store = FeatureStore('zones') if store is None else store
         if zone_filter is None:
             self.zone_filter = lambda w: True
         else:
             self.zone_filter = zone_filter
         self.progressbar = progressbar
+        self.boundary = boundary
+        # Areas made into zones
+        self.count = 0
 
     def area(self, a):
         if self.progressbar:
@@ -197,11 +284,18 @@ class OSMZoneParser(osmium.SimpleHandler):
 
         if not self.zone_filter(a.tags):
             return
-        
+
+        if self.boundary is not None:
+            nodes = [u for exterior in a.outer_rings() for u in exterior]
+            if not self.boundary.keeps_nodes(nodes):
+                return
+            del nodes
+
         d = {}
         tags = dict(a.tags)
 
         d2 = {**d, **OSWZoneNormalizer(tags).normalize()}
+        self.count += 1
 
         exteriors_count = 0
         for exterior in a.outer_rings():
@@ -210,52 +304,44 @@ class OSMZoneParser(osmium.SimpleHandler):
                 u = exterior[i]
 
                 u_ref = int(u.ref)
-                u_lon = float(u.lon)
-                u_lat = float(u.lat)
 
                 ndref.append(str(u_ref))
-                self.G.add_node(u_ref, lon=u_lon, lat=u_lat)
+                if u_ref not in self.G._node:
+                    self.G.add_node(u_ref)
+                    self.coordinates.add(u_ref, u.x, u.y)
                 del u
-            
-            d3 = {**d2}
-            d3["ndref"] = ndref
 
             # Add interior holes without nodes
-            indref = []
-            for inner in a.inner_rings(exterior):
-                ndref = []
-                for i in range(len(inner)):
-                    u = inner[i]
-
-                    u_lon = float(u.lon)
-                    u_lat = float(u.lat)
-
-                    ndref.append([u_lon, u_lat])
-                indref.append(ndref)
-            
-            d3["indref"] = indref
+            indref = [coordinate_array(inner) for inner in a.inner_rings(exterior)]
             if exteriors_count > 0:
-                self.G.add_node("z" + str(a.id) + str(exteriors_count), **d3)
+                self.store.add(str(a.id) + str(exteriors_count), {**d2}, ndref=ndref, indref=indref)
             else:
-                self.G.add_node("z" + str(a.id), **d3)
+                self.store.add(str(a.id), {**d2}, ndref=ndref, indref=indref)
             exteriors_count = exteriors_count + 1
 
 
 class OSMPolygonParser(osmium.SimpleHandler):
-    def __init__(self, G, polygon_filter=None, progressbar=None):
+    def __init__(self, G, polygon_filter=None, progressbar=None, boundary=None, store=None):
         """
 
         :param G: MultiDiGraph that already has ways inserted as edges.
         :type G: nx.MultiDiGraph
+        :param store: FeatureStore the polygons are added to, a new one by
+            default. Polygons are not added to G.
+        :type store: FeatureStore
 
         """
         osmium.SimpleHandler.__init__(self)
         self.G = G
+        self.store = FeatureStore('polygons') if store is None else store
         if polygon_filter is None:
             self.polygon_filter = lambda w: True
         else:
             self.polygon_filter = polygon_filter
         self.progressbar = progressbar
+        self.boundary = boundary
+        # Areas made into polygons
+        self.count = 0
 
     def area(self, a):
         if self.progressbar:
@@ -264,252 +350,458 @@ class OSMPolygonParser(osmium.SimpleHandler):
         if not self.polygon_filter(a.tags):
             return
 
+        rings = [
+            (coordinate_array(exterior), [coordinate_array(inner) for inner in a.inner_rings(exterior)])
+            for exterior in a.outer_rings()
+        ]
+        if self.boundary is not None:
+            rings = [
+                (to_fixed(exterior), [to_fixed(inner) for inner in interiors])
+                for ndref, indref in rings
+                for exterior, interiors in self.boundary.clip_polygon(to_degrees(ndref),
+                                                                      [to_degrees(inner) for inner in indref])
+            ]
+            if not rings:
+                return
+
         d = {}
         tags = dict(a.tags)
 
         d2 = {**d, **OSWPolygonNormalizer(tags).normalize()}
+        self.count += 1
 
         exteriors_count = 0
-        for exterior in a.outer_rings():
-            ndref = []
-            for i in range(len(exterior)):
-                u = exterior[i]
-
-                u_lon = float(u.lon)
-                u_lat = float(u.lat)
-
-                ndref.append([u_lon, u_lat])
-                del u
-            
-            d3 = {**d2}
-            d3["ndref"] = ndref
-
+        for ndref, indref in rings:
             # Add interior holes without nodes
-            indref = []
-            for inner in a.inner_rings(exterior):
-                ndref = []
-                for i in range(len(inner)):
-                    u = inner[i]
-
-                    u_lon = float(u.lon)
-                    u_lat = float(u.lat)
-
-                    ndref.append([u_lon, u_lat])
-                indref.append(ndref)
-            
-            d3["indref"] = indref
             if exteriors_count > 0:
-                self.G.add_node("g" + str(a.id) + str(exteriors_count), **d3)
+                self.store.add(str(a.id) + str(exteriors_count), {**d2}, ndref=ndref, indref=indref)
             else:
-                self.G.add_node("g" + str(a.id), **d3)
+                self.store.add(str(a.id), {**d2}, ndref=ndref, indref=indref)
             exteriors_count = exteriors_count + 1
 
 
+class OSMAreaParser(osmium.SimpleHandler):
+    '''Runs zone and polygon parsers, and optionally a line parser, in one
+    apply. osmium assembles areas in two stages: a read of the relations
+    only, then one read shared by the way and area callbacks.
+
+    '''
+
+    def __init__(self, area_parsers, line_parser=None):
+        osmium.SimpleHandler.__init__(self)
+        self.area_parsers = area_parsers
+        self.line_parser = line_parser
+
+    def way(self, w):
+        if self.line_parser is not None:
+            self.line_parser.way(w)
+
+    def area(self, a):
+        for parser in self.area_parsers:
+            parser.area(a)
+
+
+def coordinate_array(nodes) -> np.ndarray:
+    '''(n, 2) array of the fixed-point x and y of osmium node refs, much
+    smaller than nested lists for lines and rings. See to_degrees.
+
+    '''
+    coords = np.array([(u.x, u.y) for u in nodes], dtype=np.int64).reshape(-1, 2)
+    if (np.abs(coords) > (180 * COORDINATE_PRECISION, 90 * COORDINATE_PRECISION)).any():
+        raise osmium.InvalidLocationError('Invalid location of a way node')
+    return coords.astype(np.int32)
+
+
+def osm_buffer_format(buffer: bytes) -> str:
+    '''osmium format name of OSM data in memory: XML, optionally gzip or
+    bzip2 compressed, or PBF.
+
+    '''
+    if buffer[:2] == b'\x1f\x8b':
+        return 'osm.gz'
+    if buffer[:3] == b'BZh':
+        return 'osm.bz2'
+    if buffer[:64].lstrip().startswith(b'<'):
+        return 'osm'
+    return 'pbf'
+
+
+def _in_spatial_order(items: list, geometries: Iterable, order: Optional[str]) -> list:
+    if order is None:
+        return items
+    return [items[i] for i in spatial_order(geometries, order)]
+
+
+def _geojson_geometry(geometry, precision: Optional[int]) -> dict:
+    if isinstance(geometry, LazyGeometry):
+        return geometry.geojson(precision)
+    # Shapely geometries, e.g. of graphs read with from_geojson
+    geometry = mapping(geometry)
+    if precision is None or 'coordinates' not in geometry:
+        return geometry
+    return {**geometry, 'coordinates': round_coordinates(geometry['coordinates'], precision)}
+
+
+@functools.lru_cache(maxsize=None)
+def wgs84_geod() -> pyproj.Geod:
+    '''Shared by all graphs, so that long-lived workers set it up once.'''
+    return pyproj.Geod(ellps='WGS84')
+
+
 class OSMGraph:
-    def __init__(self, G: nx.MultiDiGraph = None) -> None:
+    def __init__(self, G: nx.MultiDiGraph = None, features: Optional[dict] = None,
+                 coordinates: Optional[NodeCoordinates] = None) -> None:
         if G is not None:
             self.G = G
+        # Points, lines, zones and polygons, outside the network graph
+        self.features = feature_stores() if features is None else features
+        # Locations of the network nodes
+        self.coordinates = NodeCoordinates() if coordinates is None else coordinates
 
         # Geodesic distance calculator. Assumes WGS84-like geometries.
-        self.geod = pyproj.Geod(ellps='WGS84')
+        self.geod = wgs84_geod()
 
     @classmethod
     def from_osm_file(
       self, osm_file, way_filter: Optional[callable] = None, node_filter: Optional[callable] = None,
       point_filter: Optional[callable] = None, line_filter: Optional[callable] = None, zone_filter: Optional[callable] = None, 
-      polygon_filter: Optional[callable] = None, progressbar: Optional[callable] = None
+      polygon_filter: Optional[callable] = None, progressbar: Optional[callable] = None,
+      node_cache_dir: Optional[str] = None, metrics: Optional[Metrics] = None,
+      entity_types: Optional[Iterable[str]] = None, boundary: Optional[Boundary] = None
+    ):
+        '''Builds the graph from an OSM file. Only the passes over the file
+        that the chosen OSW entity_types need are run. Zones and polygons
+        need area assembly and are only built when asked for. Features
+        outside boundary are dropped while parsing.
+
+        '''
+        # With a node cache the location index is built by the first pass
+        # and mapped by every later pass and run over the same file.
+        if node_cache_dir is not None:
+            node_cache = NodeLocationCache(osm_file, node_cache_dir)
+            apply_with_locations = node_cache.apply
+        else:
+            apply_with_locations = lambda handler: handler.apply_file(osm_file, locations=True)
+
+        # Area assembly runs its own location handler, without the node cache
+        return self._parse(
+            lambda handler: handler.apply_file(osm_file), apply_with_locations,
+            lambda handler: handler.apply_file(osm_file, locations=True), way_filter, node_filter, point_filter,
+            line_filter, zone_filter, polygon_filter, progressbar, metrics, entity_types, boundary
+        )
+
+    @classmethod
+    def from_osm_buffer(
+      self, buffer: bytes, file_format: Optional[str] = None, way_filter: Optional[callable] = None,
+      node_filter: Optional[callable] = None, point_filter: Optional[callable] = None,
+      line_filter: Optional[callable] = None, zone_filter: Optional[callable] = None,
+      polygon_filter: Optional[callable] = None, progressbar: Optional[callable] = None,
+      metrics: Optional[Metrics] = None, entity_types: Optional[Iterable[str]] = None,
+      boundary: Optional[Boundary] = None
     ):
-        way_parser = OSMWayParser(way_filter, progressbar=progressbar)
-        way_parser.apply_file(osm_file, locations=True)
-        G = way_parser.G
+        '''Same as from_osm_file for OSM data held in memory. file_format is
+        an osmium format name ('pbf', 'osm', 'osm.gz', ...), detected from
+        the data by default.
+
+        '''
+        buffer = bytes(buffer)
+        file_format = file_format or osm_buffer_format(buffer)
+        return self._parse(
+            lambda handler: handler.apply_buffer(buffer, file_format),
+            lambda handler: handler.apply_buffer(buffer, file_format, locations=True),
+            lambda handler: handler.apply_buffer(buffer, file_format, locations=True),
+            way_filter, node_filter, point_filter, line_filter, zone_filter, polygon_filter, progressbar, metrics,
+            entity_types, boundary
+        )
+
+    @classmethod
+    def _parse(
+      self, apply, apply_with_locations, apply_areas, way_filter, node_filter, point_filter, line_filter,
+      zone_filter, polygon_filter, progressbar, metrics, entity_types, boundary=None
+    ):
+        if metrics is None:
+            metrics = Metrics()
+        entity_types = set(DEFAULT_ENTITY_TYPES if entity_types is None else entity_types)
+
+        G = nx.MultiDiGraph()
+        coordinates = NodeCoordinates()
+        # Edges need the node pass as well: nodes of interest such as kerbs
+        # end an edge when simplifying
+        if entity_types & {'edges', 'nodes'}:
+            G, coordinates = self._parse_network(apply, apply_with_locations, way_filter, node_filter, progressbar,
+                                                 metrics, boundary)
+
+        features = feature_stores()
+        if 'points' in entity_types:
+            with metrics.stage('parse_points'):
+                point_parser = OSMPointParser(G, point_filter, progressbar=progressbar, boundary=boundary,
+                                              store=features['points'])
+                metrics.wrap_handler('parse_points', point_parser)
+                apply(point_parser)
+            metrics.count_in('points', point_parser.count)
+            del point_parser
+
+        area_parsers = []
+        if 'zones' in entity_types:
+            # Zones add the nodes of their outlines to the network graph
+            area_parsers.append(OSMZoneParser(G, zone_filter, progressbar=progressbar, boundary=boundary,
+                                              coordinates=coordinates, store=features['zones']))
+        if 'polygons' in entity_types:
+            area_parsers.append(OSMPolygonParser(G, polygon_filter, progressbar=progressbar, boundary=boundary,
+                                                 store=features['polygons']))
+
+        if area_parsers:
+            # Lines share the read of the area pass
+            with metrics.stage('parse_areas'):
+                line_parser = OSMLineParser(G, line_filter, progressbar=progressbar, boundary=boundary,
+                                            store=features['lines']) if 'lines' in entity_types else None
+                area_parser = OSMAreaParser(area_parsers, line_parser)
+                metrics.wrap_handler('parse_areas', area_parser)
+                apply_areas(area_parser)
+            for parser in area_parsers:
+                metrics.count_in(parser.store.entity_type, parser.count)
+            if line_parser is not None:
+                metrics.count_in('lines', line_parser.count)
+            del area_parser, area_parsers, line_parser
+        elif 'lines' in entity_types:
+            with metrics.stage('parse_lines'):
+                line_parser = OSMLineParser(G, line_filter, progressbar=progressbar, boundary=boundary,
+                                            store=features['lines'])
+                metrics.wrap_handler('parse_lines', line_parser)
+                apply_with_locations(line_parser)
+            metrics.count_in('lines', line_parser.count)
+            del line_parser
+
+        return OSMGraph(G, features, coordinates)
+
+    @staticmethod
+    def _parse_network(apply, apply_with_locations, way_filter, node_filter, progressbar, metrics, boundary=None):
+        with metrics.stage('parse_ways'):
+            way_parser = OSMWayParser(way_filter, progressbar=progressbar, boundary=boundary)
+            metrics.wrap_handler('parse_ways', way_parser)
+            apply_with_locations(way_parser)
+            G = way_parser.build_graph()
+            coordinates = way_parser.coordinates
+        metrics.count_in('edges', way_parser.count)
         del way_parser
 
-        node_parser = OSMNodeParser(G, node_filter, progressbar=progressbar)
-        node_parser.apply_file(osm_file)
-        G = node_parser.G
+        with metrics.stage('parse_nodes'):
+            node_parser = OSMNodeParser(G, node_filter, progressbar=progressbar)
+            metrics.wrap_handler('parse_nodes', node_parser)
+            apply(node_parser)
+            G = node_parser.G
+        metrics.count_in('nodes', node_parser.count)
         del node_parser
 
-        point_parser = OSMPointParser(G, point_filter, progressbar=progressbar)
-        point_parser.apply_file(osm_file)
-        G = point_parser.G
-        del point_parser
+        return G, coordinates
 
-        line_parser = OSMLineParser(G, line_filter, progressbar=progressbar)
-        line_parser.apply_file(osm_file, locations=True)
-        G = line_parser.G
-        del line_parser
+    def to_checkpoint(self, path, stage: str, **meta) -> None:
+        '''Persists the graph between pipeline stages. See osm_checkpoint for
+        the format.
 
-        # zone_parser = OSMZoneParser(G, zone_filter, progressbar=progressbar)
-        # zone_parser.apply_file(osm_file)
-        # G = zone_parser.G
-        # del zone_parser
+        '''
+        write_checkpoint(self.G, str(path), {**meta, 'stage': stage}, self.features, self.coordinates)
 
-        # polygon_parser = OSMPolygonParser(G, polygon_filter, progressbar=progressbar)
-        # polygon_parser.apply_file(osm_file)
-        # G = polygon_parser.G
-        # del polygon_parser
+    @classmethod
+    def from_checkpoint(cls, path):
+        return cls(*read_checkpoint(str(path)))
 
-        return OSMGraph(G)
+    @staticmethod
+    def checkpoint_meta(path) -> dict:
+        return read_checkpoint_meta(str(path))
 
-    def simplify(self) -> None:
-        '''Simplifies graph by merging way segments of degree 2 - i.e.
-        continuations.
+    def node_locations(self, nodes: list) -> np.ndarray:
+        '''(n, 2) float longitudes and latitudes of network nodes, from the
+        coordinate table or, in graphs built by hand, their lon and lat
+        attributes.
 
         '''
-        # Do not simplify edges that share a node with a zone
+        coords = self.coordinates.degrees(nodes)
+        for i in np.flatnonzero(np.isnan(coords[:, 0])):
+            node_d = self.G._node[nodes[i]]
+            coords[i] = node_d['lon'], node_d['lat']
+        return coords
+
+    def zone_nodes(self) -> set:
+        '''Ids, as strings, of the nodes zones are made of.'''
         zone_nodes = set()
-        for node, d in self.G.nodes(data=True):
-            if OSWZoneNormalizer.osw_zone_filter(d):
-                zone_nodes.update(d["ndref"])
+        for ndref in self.features['zones'].ndref:
+            zone_nodes.update(ndref)
+        return zone_nodes
 
-        # Structure is way_id: (node, segment_number). This makes it easy to
-        # sort on-the-fly.
-        remove_nodes = {}
+    def removable_nodes(self, zone_nodes: set, keep: Optional[set] = None) -> List[tuple]:
+        '''(node_in, node, node_out, segment) of every node simplify merges
+        away, in graph order: nodes with one predecessor and one successor,
+        on segments of the same way, that are neither kerbs nor part of a
+        zone.
 
-        for node, d in self.G.nodes(data=True):
-            if OSWNodeNormalizer.osw_node_filter(d):
-                # Skip if this is a node feature of interest, e.g. kerb ramp
-                continue
+        Degrees and way ids are compared as arrays over the adjacent node
+        pairs of the graph, so that only the nodes found are handled one by
+        one.
 
-            if str(node) in zone_nodes:
-                # Do not simplify edges that share a node with a zone
-                continue
+        '''
+        nodes = list(self.G._node)
+        index = {node: i for i, node in enumerate(nodes)}
+        succ = self.G._succ
+
+        # One row per adjacent (u, v) pair, with the way and segment of its
+        # first edge
+        out_degree = np.fromiter(map(len, succ.values()), dtype=np.int64, count=len(nodes))
+        if not out_degree.any():
+            return []
+        u_rows = np.repeat(np.arange(len(nodes)), out_degree)
+        v_rows = np.fromiter((index[v] for nbrs in succ.values() for v in nbrs), dtype=np.int64,
+                             count=len(u_rows))
+        first = [keydict.get(0, {}) for nbrs in succ.values() for keydict in nbrs.values()]
+        osm_ids = [d.get('osm_id') for d in first]
+        segments = [d.get('segment') for d in first]
+        del first
+        way_ids = np.array(osm_ids)
+        if way_ids.dtype.kind not in 'iu':
+            # Ids of graphs built by hand may be anything, and must not be
+            # turned into strings
+            way_ids = np.array(osm_ids, dtype=object)
+
+        # Pairs do not repeat, so counts are numbers of distinct neighbors
+        candidates = (np.bincount(v_rows, minlength=len(nodes)) == 1) & (out_degree == 1)
+        # Skip node features of interest, e.g. kerb ramps
+        candidates &= np.fromiter((d.get(KIND) != KIND_KERB for d in self.G._node.values()), dtype=bool,
+                                  count=len(nodes))
+        # Do not simplify edges that share a node with a zone
+        excluded = [index.get(int(ref) if ref.lstrip('-').isdigit() else ref) for ref in zone_nodes]
+        if keep:
+            excluded.extend(index.get(node) for node in keep)
+        excluded = [i for i in excluded if i is not None]
+        candidates[excluded] = False
+
+        # The one pair into and out of every candidate
+        pair_in = np.zeros(len(nodes), dtype=np.int64)
+        pair_in[v_rows] = np.arange(len(v_rows))
+        pair_out = np.zeros(len(nodes), dtype=np.int64)
+        pair_out[u_rows] = np.arange(len(u_rows))
+
+        # A node shared between two different ways is an important decision
+        # point for some paths
+        found = np.flatnonzero(candidates)
+        found = found[way_ids[pair_in[found]] == way_ids[pair_out[found]]]
+
+        rows_in = pair_in[found]
+        nodes_in = u_rows[rows_in].tolist()
+        nodes_out = v_rows[pair_out[found]].tolist()
+        with gc_paused():
+            return [
+                (nodes[node_in], nodes[i], nodes[node_out], segments[row_in])
+                for node_in, i, node_out, row_in in zip(nodes_in, found.tolist(), nodes_out, rows_in.tolist())
+            ]
+
+    def simplify(self, keep: Optional[set] = None) -> None:
+        '''Simplifies graph by merging way segments of degree 2 - i.e.
+        continuations. Nodes in keep are never merged away.
 
-            predecessors = list(self.G.predecessors(node))
-            successors = list(self.G.successors(node))
-
-            if (len(predecessors) == 1) and (len(successors) == 1):
-                # Only one predecessor and one successor - ideal internal node
-                # to remove from the graph, merging its location data into other
-                # edges.
-                node_in = predecessors[0]
-                node_out = successors[0]
-                edge_in = self.G[node_in][node][0]
-                edge_out = self.G[node][node_out][0]
-
-                # Only one exception: we shouldn't remove a node that's shared
-                # between two different ways: this is an important decision
-                # point for some paths.
-                if edge_in['osm_id'] != edge_out['osm_id']:
-                    continue
+        '''
+        # Structure is way_id: (node, segment_number). This makes it easy to
+        # sort on-the-fly.
+        remove_nodes = {}
 
-                node_data = (node_in, node, node_out, edge_in['segment'])
-
-                # Group by way
-                edge_id = edge_in['osm_id']
-                if edge_id in remove_nodes:
-                    remove_nodes[edge_id].append(node_data)
-                else:
-                    remove_nodes[edge_id] = [node_data]
-
-        # NOTE: an otherwise unconnected circular path would be removed, as all
-        # nodes are degree 2 and on the same way. This path is pointless for a
-        # network, but is something to keep in mind for any downstream
-        # analysis.
-        for way_id, node_data in remove_nodes.items():
-            # Sort by segment number
-            sorted_node_data = list(sorted(node_data, key=lambda x: x[3]))
-
-            # First node matches last node_out?
-            is_circular = sorted_node_data[0][1] == sorted_node_data[-1][2]
-
-            # Split into lists of neighboring nodes
-            neighbors_list = []
-
-            neighbors = [sorted_node_data.pop(0)]
-            for node_in, node, node_out, segment_n in sorted_node_data:
-                if (segment_n - neighbors[-1][3]) != 1:
-                    # Not neighbors!
-                    neighbors_list.append(neighbors)
-                    neighbors = [(node_in, node, node_out, segment_n)]
-                else:
-                    # Neighbors!
-                    neighbors.append((node_in, node, node_out, segment_n))
-            neighbors_list.append(neighbors)
-
-            # Detect neighbors in circular ways which are not completely disjoint from other ways
-            if is_circular and len(neighbors_list) > 1:
-                # Combine first and last neighbor lists
-                neighbors_list[-1].extend(neighbors_list.pop(0))
-            
-            # Remove internal nodes by group
-            for neighbors in neighbors_list:
-                u, v, w, segment_n = neighbors[0]
-                # FIXME: this try/except is a hack to avert an uncommon and
-                # unexplored edge case. Come back and fix!
-                try:
-                    edge_data = self.G[u][v][0]
-                except KeyError:
+        succ = self.G._succ
+        for node_data in self.removable_nodes(self.zone_nodes(), keep):
+            # Group by way
+            edge_id = succ[node_data[0]][node_data[1]][0]['osm_id']
+            if edge_id in remove_nodes:
+                remove_nodes[edge_id].append(node_data)
+            else:
+                remove_nodes[edge_id] = [node_data]
+
+        chains = merge_chains(remove_nodes.values())
+        del remove_nodes
+
+        # Update the graph in bulk
+        removed = []
+        merged_u = []
+        merged_v = []
+        merged_data = []
+        with gc_paused():
+            for u, v, nodes, ndref in chains:
+                # FIXME: skipping chains whose first edge is gone is a hack
+                # to avert an uncommon and unexplored edge case. Come back
+                # and fix!
+                edge_data = succ[u].get(v, {}).get(0)
+                if edge_data is None:
                     continue
-                ndref = edge_data['ndref']
-                self.G.remove_edge(u, v)
-                for node_in, node, node_out, segment_n in neighbors:
-                    ndref.append(node_out)
-                    # Remove intervening edge
-                    try:
-                        self.G.remove_edge(node, node_out)
-                    except nx.exception.NetworkXError:
-                        pass
-                self.G.add_edges_from([(u, node_out, edge_data)])
+                edge_data['ndref'].extend(ndref)
+                removed.append((u, v))
+                # Remove intervening edges
+                removed.extend(zip(nodes, ndref))
+                merged_u.append(u)
+                merged_v.append(ndref[-1])
+                merged_data.append(dict(edge_data))
+        del chains
+        remove_edges_in_bulk(self.G, removed)
+        add_edges_in_bulk(self.G, merged_u, merged_v, merged_data)
 
     def construct_geometries(self, progressbar: Optional[callable] = None) -> None:
         '''Given the current list of node references per edge, construct
-        geometry.
+        geometry. Geometries are kept as coordinates (see LazyGeometry), and
+        lengths are computed from them.
 
         '''
+        edges = list(self.G.edges(data=True))
+        # Locations of the nodes of all edges, looked up at once
+        coords = self.node_locations([ref for u, v, d in edges for ref in d['ndref']])
+        start = 0
         internal_nodes = []
-        for u, v, d in self.G.edges(data=True):
-            coords = []
-            for ref in d['ndref']:
-                # FIXME: is this the best way to retrieve node attributes?
-                node_d = self.G._node[ref]
-                coords.append((node_d['lon'], node_d['lat']))
-
-            geometry = LineString(coords)
-            d['geometry'] = geometry
-            d['length'] = round(self.geod.geometry_length(geometry), 1)
-            internal_nodes = internal_nodes + d["ndref"][1:len(d["ndref"])-1]
+        for u, v, d in edges:
+            end = start + len(d['ndref'])
+            edge_coords = coords[start:end]
+            start = end
+            d['geometry'] = LazyGeometry.line_string(edge_coords)
+            d['length'] = round(self.geod.line_length(edge_coords[:, 0], edge_coords[:, 1]), 1)
+            internal_nodes.extend(d["ndref"][1:len(d["ndref"])-1])
             del d['ndref']
             if progressbar:
                 progressbar.update(1)
 
-        for n, d in self.G.nodes(data=True):
-            if OSWZoneNormalizer.osw_zone_filter(d):
-                coords = []
-                for ref in d["ndref"]:
-                    node_d = self.G._node[int(ref)]
-                    coords.append((node_d["lon"], node_d["lat"]))
-
-                geometry = Polygon(coords, d["indref"])
-                d["geometry"] = geometry
-
-                d["_w_id"] = d.pop("ndref")
-                del d["indref"]
-
-                if progressbar:
-                    progressbar.update(1)
-            elif OSWPolygonNormalizer.osw_polygon_filter(d):
-                geometry = Polygon(d["ndref"], d["indref"])
-                d["geometry"] = geometry
-
-                del d["ndref"]
-                del d["indref"]
-
-                if progressbar:
-                    progressbar.update(1)
-            elif OSWLineNormalizer.osw_line_filter(d):
-                geometry = LineString(d["ndref"])
-                d["geometry"] = geometry
-                d["length"] = round(self.geod.geometry_length(geometry), 1)
-                del d["ndref"]
-                if progressbar:
-                    progressbar.update(1)
-            else:
-                geometry = Point(d["lon"], d["lat"])
-                d["geometry"] = geometry
-                if progressbar:
-                    progressbar.update(1)
-                
+        del edges, coords
+
+        coords = self.node_locations(list(self.G.nodes)).tolist()
+        for (n, d), (lon, lat) in zip(self.G.nodes(data=True), coords):
+            d["geometry"] = LazyGeometry.point(lon, lat)
+            if progressbar:
+                progressbar.update(1)
+
+        points = self.features['points']
+        points.geometry = [
+            LazyGeometry.point(lon, lat) for lon, lat in zip(to_degrees(points.x).tolist(), to_degrees(points.y).tolist())
+        ]
+        if progressbar:
+            progressbar.update(len(points))
+
+        lines = self.features['lines']
+        for ndref, tags in zip(lines.ndref, lines.tags):
+            line_coords = to_degrees(ndref)
+            lines.geometry.append(LazyGeometry.line_string(line_coords))
+            tags["length"] = round(self.geod.line_length(line_coords[:, 0], line_coords[:, 1]), 1)
+            if progressbar:
+                progressbar.update(1)
+
+        zones = self.features['zones']
+        for ndref, indref, tags in zip(zones.ndref, zones.indref, zones.tags):
+            coords = self.node_locations([int(ref) for ref in ndref])
+            zones.geometry.append(LazyGeometry.polygon(coords, [to_degrees(inner) for inner in indref]))
+            tags["_w_id"] = ndref
+            if progressbar:
+                progressbar.update(1)
+
+        polygons = self.features['polygons']
+        for ndref, indref in zip(polygons.ndref, polygons.indref):
+            polygons.geometry.append(LazyGeometry.polygon(to_degrees(ndref), [to_degrees(inner) for inner in indref]))
+            if progressbar:
+                progressbar.update(1)
+
+        for store in self.features.values():
+            store.ndref = []
+            store.indref = []
+
         self.G.remove_nodes_from(internal_nodes)
 
     def to_undirected(self):
@@ -517,9 +809,21 @@ class OSMGraph:
             G = nx.MultiGraph(self.G)
         else:
             G = nx.Graph(self.G)
-        return OSMGraph(G)
+        return OSMGraph(G, self.features, self.coordinates)
 
     def get_graph(self) -> nx.MultiDiGraph:
+        '''The network graph, with shapely geometries: the coordinates
+        construct_geometries keeps are turned into shapely objects here, for
+        analysis. Feature store geometries have a to_shape method for the
+        same.
+
+        '''
+        for _, d in self.G.nodes(data=True):
+            if isinstance(d.get('geometry'), LazyGeometry):
+                d['geometry'] = d['geometry'].to_shape()
+        for _, _, d in self.G.edges(data=True):
+            if isinstance(d.get('geometry'), LazyGeometry):
+                d['geometry'] = d['geometry'].to_shape()
         return self.G
 
     def filter_edges(self, func: callable):
@@ -544,7 +848,7 @@ class OSMGraph:
             d = self.G._node[node]
             G.add_node(node, **d)
 
-        return OSMGraph(G)
+        return OSMGraph(G, coordinates=self.coordinates)
 
     def is_multigraph(self) -> bool:
         return self.G.is_multigraph()
@@ -552,18 +856,26 @@ class OSMGraph:
     def is_directed(self) -> bool:
         return self.G.is_directed()
 
-    def to_geojson(self, *args) -> None:
+    def to_feature_collections(self, entity_types: Optional[Iterable[str]] = None,
+                               precision: Optional[int] = None, order: Optional[str] = None) -> dict:
+        '''OSW feature collections by file type (nodes, edges, points,
+        lines, zones and polygons), including empty ones. Only the chosen
+        entity_types are built, all by default. Coordinates are rounded to
+        precision decimals unless it is None.
+
+        Features are in graph and parse order, or with order, 'hilbert' or
+        'z', sorted along that curve (see osm_order) collection by
+        collection. Edge ids are numbered in output order.
+
+        '''
         OSW_JSON_HEADER = {"$schema": OSW_SCHEMA_ID, "type": "FeatureCollection"}
-        nodes_path = args[0]
-        edges_path = args[1]
-        points_path = args[2]
-        lines_path = args[3]
-        zones_path = args[4]
-        polygons_path = args[5]
+        entity_types = set(OSW_ENTITY_TYPES if entity_types is None else entity_types)
+        check_spatial_order(order)
 
         _id = 1
         edge_features = []
-        for u, v, d in self.G.edges(data=True):
+        edges = list(self.G.edges(data=True)) if 'edges' in entity_types else []
+        for u, v, d in _in_spatial_order(edges, (d['geometry'] for _, _, d in edges), order):
             d_copy = {**d}
             d_copy['_id'] = str(_id)
             _id += 1
@@ -576,7 +888,7 @@ class OSMGraph:
             if 'segment' in d_copy:
                 d_copy.pop('segment')
 
-            geometry = mapping(d_copy.pop('geometry'))
+            geometry = _geojson_geometry(d_copy.pop('geometry'), precision)
 
             edge_features.append(
                 {'type': 'Feature', 'geometry': geometry, 'properties': d_copy}
@@ -584,87 +896,84 @@ class OSMGraph:
         edges_fc = {**OSW_JSON_HEADER, **{"features": edge_features}}
 
         node_features = []
-        point_features = []
-        line_features = []
-        zone_features = []
-        polygon_features = []
-        for n, d in self.G.nodes(data=True):
+        nodes = list(self.G.nodes(data=True)) if 'nodes' in entity_types else []
+        for n, d in _in_spatial_order(nodes, (d['geometry'] for _, d in nodes), order):
             d_copy = {**d}
-            d_copy["_id"] = str(n)[1:]
-
-            if OSWPointNormalizer.osw_point_filter(d):
-                geometry = mapping(d_copy.pop("geometry"))
-
-                if "lon" in d_copy:
-                    d_copy.pop("lon")
-
-                if "lat" in d_copy:
-                    d_copy.pop("lat")
-
-                point_features.append(
-                    {"type": "Feature", "geometry": geometry, "properties": d_copy}
-                )
-            elif OSWLineNormalizer.osw_line_filter(d):
-                geometry = mapping(d_copy.pop("geometry"))
-
-                line_features.append(
-                    {"type": "Feature", "geometry": geometry, "properties": d_copy}
-                )
-            elif OSWZoneNormalizer.osw_zone_filter(d):
-                geometry = mapping(d_copy.pop("geometry"))
-
-                zone_features.append(
-                    {"type": "Feature", "geometry": geometry, "properties": d_copy}
-                )
-            elif OSWPolygonNormalizer.osw_polygon_filter(d):
-                geometry = mapping(d_copy.pop("geometry"))
-
-                polygon_features.append(
-                    {"type": "Feature", "geometry": geometry, "properties": d_copy}
-                )
-            else:
-                d_copy['_id'] = str(n)
-
-                geometry = mapping(d_copy.pop('geometry'))
-
-                if 'lon' in d_copy:
-                    d_copy.pop('lon')
+            d_copy.pop(KIND, None)
+            d_copy['_id'] = str(n)
 
-                if 'lat' in d_copy:
-                    d_copy.pop('lat')
+            geometry = _geojson_geometry(d_copy.pop('geometry'), precision)
 
-                node_features.append(
-                    {'type': 'Feature', 'geometry': geometry, 'properties': d_copy}
-                )
-        nodes_fc = {**OSW_JSON_HEADER, **{"features": node_features}}
-        points_fc = {**OSW_JSON_HEADER, **{"features": point_features}}
-        lines_fc = {**OSW_JSON_HEADER, **{"features": line_features}}
-        zones_fc = {**OSW_JSON_HEADER, **{"features": zone_features}}
-        polygons_fc = {**OSW_JSON_HEADER, **{"features": polygon_features}}
+            if 'lon' in d_copy:
+                d_copy.pop('lon')
 
-        if len(edge_features) > 0:
-            with open(edges_path, 'w') as f:
-                json.dump(edges_fc, f)
+            if 'lat' in d_copy:
+                d_copy.pop('lat')
 
-        if len(node_features) > 0:
-            with open(nodes_path, 'w') as f:
-                json.dump(nodes_fc, f)
+            node_features.append(
+                {'type': 'Feature', 'geometry': geometry, 'properties': d_copy}
+            )
 
-        if len(point_features) > 0:
-            with open(points_path, "w") as f:
-                json.dump(points_fc, f)
+        features = {}
+        for name, store in self.features.items():
+            features[name] = [
+                {"type": "Feature", "geometry": _geojson_geometry(geometry, precision),
+                 "properties": {**tags, "_id": _id}}
+                for _id, tags, geometry in _in_spatial_order(list(zip(store.ids, store.tags, store.geometry)),
+                                                             store.geometry, order)
+            ] if name in entity_types else []
 
-        if len(line_features) > 0:
-            with open(lines_path, "w") as f:
-                json.dump(lines_fc, f)
+        nodes_fc = {**OSW_JSON_HEADER, **{"features": node_features}}
+        points_fc = {**OSW_JSON_HEADER, **{"features": features['points']}}
+        lines_fc = {**OSW_JSON_HEADER, **{"features": features['lines']}}
+        zones_fc = {**OSW_JSON_HEADER, **{"features": features['zones']}}
+        polygons_fc = {**OSW_JSON_HEADER, **{"features": features['polygons']}}
+
+        collections = {
+            'edges': edges_fc,
+            'nodes': nodes_fc,
+            'points': points_fc,
+            'lines': lines_fc,
+            'zones': zones_fc,
+            'polygons': polygons_fc
+        }
+        return {name: fc for name, fc in collections.items() if name in entity_types}
+
+    def to_geojson(self, *args, entity_types: Optional[Iterable[str]] = None,
+                   precision: Optional[int] = DEFAULT_PRECISION, order: Optional[str] = None) -> dict:
+        '''Writes the feature collections to the nodes, edges, points, lines,
+        zones and polygons paths, with coordinates rounded to precision
+        decimals, OSM's own by default, and features in the given order, see
+        to_feature_collections. Empty collections are not written.
+
+        Files are written to a temporary name and renamed over the path, as
+        the path may be a hard link to a result cache entry.
 
-        if len(zone_features) > 0:
-            with open(zones_path, "w") as f:
-                json.dump(zones_fc, f)
+        '''
+        paths = {
+            'nodes': args[0],
+            'edges': args[1],
+            'points': args[2],
+            'lines': args[3],
+            'zones': args[4],
+            'polygons': args[5]
+        }
+        collections = self.to_feature_collections(entity_types, precision, order)
+
+        counts = {}
+        for name, fc in collections.items():
+            counts[name] = len(fc['features'])
+            if len(fc['features']) > 0:
+                tmp_path = f'{paths[name]}.{uuid.uuid4().hex}.tmp'
+                try:
+                    with open(tmp_path, 'w') as f:
+                        dump_feature_collection(fc, f)
+                    os.replace(tmp_path, paths[name])
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
 
-        if len(polygon_features) > 0:
-            with open(polygons_path, "w") as f:
-                json.dump(polygons_fc, f)
+        return counts
 
     @classmethod
     def from_geojson(cls, nodes_path, edges_path):
@@ -680,8 +989,16 @@ class OSMGraph:
         for node_feature in nodes_fc['features']:
             props = node_feature['properties']
             n = props.pop('_id')
+            if OSWNodeNormalizer.osw_node_filter(props):
+                props[KIND] = KIND_KERB
             props['geometry'] = shape(node_feature['geometry'])
             G.add_node(n, **props)
 
         for edge_feature in edges_fc['features']:
             props = edge_feature['properties']
+            u = props.pop('_u_id')
+            v = props.pop('_v_id')
+            props['geometry'] = shape(edge_feature['geometry'])
+            G.add_edge(u, v, **props)
+
+        return osm_graph
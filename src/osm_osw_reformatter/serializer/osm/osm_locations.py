@@ -0,0 +1,67 @@
+import os
+import uuid
+from pathlib import Path
+import osmium
+from ...helpers.cache import file_digest
+
+# Sorted (id, location) pairs in a file, 16 bytes per node. Unlike the dense
+# variants its size does not depend on the largest node id.
+INDEX_TYPE = 'sparse_file_array'
+
+
+class NodeLocationCache:
+    '''Node location index that is built once per input file and then mapped
+    by every later pass and run.
+
+    The index file is named after the input and its content hash, so a
+    changed input never picks up stale locations. It is built under a
+    temporary name and renamed into place, so concurrent builders cannot
+    observe a partial index. Passes over a prebuilt index read ways only:
+    the nodes block of the input is never decoded and the index is never
+    written to.
+
+    '''
+
+    def __init__(self, osm_file: str, cache_dir: str = None) -> None:
+        self.osm_file = str(osm_file)
+        cache_dir = cache_dir or os.path.dirname(os.path.abspath(self.osm_file))
+        digest = file_digest(self.osm_file)
+        self.path = Path(cache_dir, f'{os.path.basename(self.osm_file)}.{digest[:16]}.nodes.idx')
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def apply(self, handler) -> None:
+        '''Applies handler to the ways of the input with node locations
+        set, building the index first if needed.
+
+        '''
+        if self.exists():
+            index = osmium.index.create_map(f'{INDEX_TYPE},{self.path}')
+            reader = osmium.io.Reader(self.osm_file, osmium.osm.osm_entity_bits.WAY)
+            self._apply(reader, index, handler)
+            return
+
+        os.makedirs(self.path.parent, exist_ok=True)
+        tmp_path = f'{self.path}.{uuid.uuid4().hex}.tmp'
+        try:
+            index = osmium.index.create_map(f'{INDEX_TYPE},{tmp_path}')
+            reader = osmium.io.Reader(self.osm_file)
+            self._apply(reader, index, handler)
+            # Dropping the map unmaps and flushes the file
+            del index
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _apply(reader, index, handler) -> None:
+        locations = osmium.NodeLocationsForWays(index)
+        # Same behaviour as apply_file(locations=True): ways referencing
+        # nodes missing from the extract get invalid locations.
+        locations.ignore_errors()
+        try:
+            osmium.apply(reader, locations, handler)
+        finally:
+            reader.close()
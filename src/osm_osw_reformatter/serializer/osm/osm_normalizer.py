@@ -9,6 +9,9 @@ class OSMNormalizer(ogr2osm.TranslationBase):
         "living_street"
     )
 
+    # Number of nodes, ways and relations written, set by process_output
+    counts = {}
+
     def filter_tags(self, tags):
         '''
         Override this method if you want to modify or add tags to the xml output
@@ -39,4 +42,11 @@ class OSMNormalizer(ogr2osm.TranslationBase):
         well. Note that any return values will be discarded by ogr2osm.
         '''
         if osmgeometry.tags['_id'][0]:
-            osmgeometry.id = int(osmgeometry.tags.pop('_id')[0])
\ No newline at end of file
+            osmgeometry.id = int(osmgeometry.tags.pop('_id')[0])
+
+    def process_output(self, osmnodes, osmways, osmrelations):
+        '''
+        Called right before writing. Records the number of written entities
+        for the conversion metrics.
+        '''
+        self.counts = {'nodes': len(osmnodes), 'ways': len(osmways), 'relations': len(osmrelations)}
@@ -0,0 +1,120 @@
+from typing import Iterable
+import numpy as np
+from .osm_geometry import LazyGeometry
+
+# Space-filling curves output features can be sorted along
+SPATIAL_ORDERS = ('hilbert', 'z')
+
+# Cells per axis of the curve grid are 2 ** CURVE_BITS
+CURVE_BITS = 16
+
+
+def check_spatial_order(order) -> None:
+    if order is not None and order not in SPATIAL_ORDERS:
+        raise ValueError(f'Unknown spatial order {order!r}, expected one of {", ".join(SPATIAL_ORDERS)}')
+
+
+def spatial_order(geometries: Iterable, order: str) -> np.ndarray:
+    '''Indices that sort geometries along the order curve, 'hilbert' or
+    'z', by the centers of their bounding boxes on a grid over the extent
+    of all of them. Geometries in the same grid cell keep their order.
+
+    '''
+    check_spatial_order(order)
+    centers = geometry_centers(geometries)
+    if len(centers) == 0:
+        return np.empty(0, dtype=np.int64)
+    x, y = _grid_cells(centers)
+    index = hilbert_index(x, y) if order == 'hilbert' else z_index(x, y)
+    return np.argsort(index, kind='stable')
+
+
+def geometry_centers(geometries: Iterable) -> np.ndarray:
+    '''(n, 2) centers of the bounding boxes of LazyGeometry or shapely
+    geometries, NaN for empty ones. Line strings and polygon outlines are
+    joined into one array and reduced together.
+
+    '''
+    point_rows, points = [], []
+    ring_rows, rings = [], []
+    n = 0
+    for i, geometry in enumerate(geometries):
+        n += 1
+        if not isinstance(geometry, LazyGeometry):
+            if geometry.is_empty:
+                continue
+            min_x, min_y, max_x, max_y = geometry.bounds
+            point_rows.append(i)
+            points.append(((min_x + max_x) / 2, (min_y + max_y) / 2))
+        elif geometry.type == 'Point':
+            point_rows.append(i)
+            points.append(geometry.coordinates)
+        else:
+            ring = geometry.coordinates if geometry.type == 'LineString' else geometry.coordinates[0]
+            if len(ring):
+                ring_rows.append(i)
+                rings.append(ring)
+
+    centers = np.full((n, 2), np.nan)
+    if points:
+        centers[point_rows] = np.array(points, dtype=np.float64).reshape(-1, 2)
+    if rings:
+        starts = np.zeros(len(rings), dtype=np.int64)
+        np.cumsum([len(ring) for ring in rings[:-1]], out=starts[1:])
+        coords = np.concatenate(rings)
+        centers[ring_rows] = (np.minimum.reduceat(coords, starts) + np.maximum.reduceat(coords, starts)) / 2
+    return centers
+
+
+def _grid_cells(centers: np.ndarray) -> tuple:
+    # Empty geometries go to the last cell
+    cells = (1 << CURVE_BITS) - 1
+    finite = np.isfinite(centers).all(axis=1)
+    if not finite.any():
+        return np.full(len(centers), cells, dtype=np.uint64), np.full(len(centers), cells, dtype=np.uint64)
+    low = centers[finite].min(axis=0)
+    span = centers[finite].max(axis=0) - low
+    span[span == 0] = 1
+    scaled = np.where(finite[:, None], (centers - low) / span * cells, cells)
+    cell = np.rint(scaled).astype(np.uint64)
+    return cell[:, 0], cell[:, 1]
+
+
+def hilbert_index(x: np.ndarray, y: np.ndarray, bits: int = CURVE_BITS) -> np.ndarray:
+    '''Distance along the Hilbert curve through a 2 ** bits grid of cells
+    (x, y), for all cells at once.
+
+    '''
+    x = np.asarray(x, dtype=np.uint64).copy()
+    y = np.asarray(y, dtype=np.uint64).copy()
+    n = np.uint64(1 << bits)
+    d = np.zeros(len(x), dtype=np.uint64)
+    s = n >> np.uint64(1)
+    while s > 0:
+        rx = ((x & s) > 0).astype(np.uint64)
+        ry = ((y & s) > 0).astype(np.uint64)
+        d += s * s * ((np.uint64(3) * rx) ^ ry)
+        # Rotate the quadrant, so the curve continues from the previous one
+        rotate = ry == 0
+        flip = rotate & (rx == 1)
+        x[flip] = n - np.uint64(1) - x[flip]
+        y[flip] = n - np.uint64(1) - y[flip]
+        x[rotate], y[rotate] = y[rotate], x[rotate]
+        s >>= np.uint64(1)
+    return d
+
+
+def z_index(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    '''Z-order (Morton) index of cells (x, y) of up to 32 bits each: their
+    bits interleaved, y's above x's.
+
+    '''
+    return _spread_bits(x) | (_spread_bits(y) << np.uint64(1))
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    v = np.asarray(v, dtype=np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
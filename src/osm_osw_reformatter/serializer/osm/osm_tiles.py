@@ -0,0 +1,379 @@
+import os
+import math
+import multiprocessing
+from typing import Dict, Iterable, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+import osmium
+import networkx as nx
+import numpy as np
+from .osm_graph import OSMGraph, wgs84_geod
+from .osm_features import feature_stores
+from .osm_coordinates import NodeCoordinates, to_degrees, to_fixed
+from .osm_geometry import LazyGeometry
+from .osm_locations import NodeLocationCache
+from .osm_boundary import Boundary
+from ...helpers.metrics import Metrics
+
+# Side of the grid cells tiles are made of, in degrees (about 1 km)
+CELL_SIZE = 0.01
+# OSW entity types a tiled conversion can produce. Zones pin the nodes they
+# are made of, which would need the areas of every neighbouring tile.
+TILED_ENTITY_TYPES = ('edges', 'nodes', 'points', 'lines')
+# Buffer of each tile file writer, the split pass keeps one per tile open
+TILE_WRITER_BUFFER = 1024 * 1024
+
+
+def _morton(x: int, y: int) -> int:
+    code = 0
+    for bit in range(32):
+        code |= ((x >> bit) & 1) << (2 * bit) | ((y >> bit) & 1) << (2 * bit + 1)
+    return code
+
+
+class TileGrid:
+    '''Assignment of grid cells to tiles. Every node belongs to the tile of
+    the cell it lies in; cells without way nodes belong to tile 0.
+
+    '''
+
+    def __init__(self, cell_tiles: Dict[tuple, int], cell_size: float = CELL_SIZE) -> None:
+        self.cell_tiles = cell_tiles
+        self.cell_size = cell_size
+
+    @classmethod
+    def partition(cls, cell_weights: Dict[tuple, int], tiles: int, cell_size: float = CELL_SIZE):
+        '''Cuts the cells, in Z-order, into at most `tiles` runs of about
+        the same weight, so that tiles are compact and take about the same
+        time to convert.
+
+        '''
+        if not cell_weights:
+            return cls({}, cell_size)
+        min_x = min(x for x, y in cell_weights)
+        min_y = min(y for x, y in cell_weights)
+        cells = sorted(cell_weights, key=lambda cell: _morton(cell[0] - min_x, cell[1] - min_y))
+        target = sum(cell_weights.values()) / tiles
+        cell_tiles = {}
+        tile = 0
+        weight = 0
+        for cell in cells:
+            if weight >= target * (tile + 1) and tile < tiles - 1:
+                tile += 1
+            cell_tiles[cell] = tile
+            weight += cell_weights[cell]
+        return cls(cell_tiles, cell_size)
+
+    def cell(self, lon: float, lat: float) -> tuple:
+        return math.floor(lon / self.cell_size), math.floor(lat / self.cell_size)
+
+    def tile(self, lon: float, lat: float) -> int:
+        return self.cell_tiles.get(self.cell(lon, lat), 0)
+
+
+class OSMTileIndexer(osmium.SimpleHandler):
+    '''First pass of the split: finds the cells of every way of interest
+    and weighs cells by the way nodes and points in them.
+
+    Network ways go to the cells of all their nodes, so that every tile
+    sees all the segments at the nodes it owns. Lines only go to the cells
+    where they start, which own them: the cell of their first node, or with
+    a clipping boundary, of the first coordinate of each part kept, as
+    convert_tile keeps line features by their first location.
+
+    '''
+
+    def __init__(self, cell_size: float, way_filter: Optional[callable] = None,
+                 line_filter: Optional[callable] = None, point_filter: Optional[callable] = None,
+                 boundary: Optional[Boundary] = None) -> None:
+        osmium.SimpleHandler.__init__(self)
+        self.grid = TileGrid({}, cell_size)
+        self.way_filter = way_filter
+        self.line_filter = line_filter
+        self.point_filter = point_filter
+        # Ways and points the tile parsers would drop are left out early
+        self.boundary = boundary
+        self.way_cells = {}
+        self.node_cells = {}
+        self.cell_weights = {}
+        self.count = 0
+        # Nodes and ways the tiles make into points and lines
+        self.points = 0
+        self.lines = 0
+
+    def node(self, n) -> None:
+        if self.point_filter is not None and self.point_filter(n.tags) and n.location.valid():
+            if self.boundary is not None and not self.boundary.contains(n.location.lon, n.location.lat):
+                return
+            cell = self.grid.cell(n.location.lon, n.location.lat)
+            self.cell_weights[cell] = self.cell_weights.get(cell, 0) + 1
+            self.points += 1
+
+    def way(self, w) -> None:
+        self.count += 1
+        network = self.way_filter is not None and self.way_filter(w.tags)
+        if not network and not (self.line_filter is not None and self.line_filter(w.tags)):
+            return
+
+        if self.boundary is not None and not any(self.boundary.contains_nodes(w.nodes)):
+            return
+        cells = [self.grid.cell(n.lon, n.lat) for n in w.nodes if n.location.valid()]
+        if not cells:
+            return
+        for cell in cells:
+            self.cell_weights[cell] = self.cell_weights.get(cell, 0) + 1
+
+        line_cells = self._line_cells(w, cells) if self.line_filter is not None and self.line_filter(w.tags) else ()
+        if line_cells:
+            self.lines += 1
+        cells = frozenset(cells if network else ()) | frozenset(line_cells)
+        self.way_cells[w.id] = cells
+        for n in w.nodes:
+            node_cells = self.node_cells.get(n.ref)
+            self.node_cells[n.ref] = cells if node_cells is None else node_cells | cells
+
+
+    def _line_cells(self, w, cells: list) -> list:
+        if self.boundary is None or not self.boundary.clip:
+            return cells[:1]
+        # Parts as the line parser cuts them, from the same fixed-point
+        # coordinates
+        fixed = np.array([(n.x, n.y) for n in w.nodes if n.location.valid()], dtype=np.int64).reshape(-1, 2)
+        parts = self.boundary.clip_line(to_degrees(fixed))
+        return [self.grid.cell(*to_degrees(to_fixed(part[0]))) for part in parts]
+
+
+class OSMTileWriter(osmium.SimpleHandler):
+    '''Second pass of the split: writes every tile its ways, their nodes
+    and the points it owns, as one PBF file per tile.
+
+    '''
+
+    def __init__(self, tile_dir: str, grid: TileGrid, way_cells: dict, node_cells: dict,
+                 point_filter: Optional[callable] = None) -> None:
+        osmium.SimpleHandler.__init__(self)
+        self.tile_dir = tile_dir
+        self.grid = grid
+        self.way_cells = way_cells
+        self.node_cells = node_cells
+        self.point_filter = point_filter
+        self.writers = {}
+        self.paths = {}
+        self.count = 0
+
+    def _writer(self, tile: int):
+        writer = self.writers.get(tile)
+        if writer is None:
+            path = os.path.join(self.tile_dir, f'tile-{tile}.osm.pbf')
+            writer = self.writers[tile] = osmium.SimpleWriter(path, TILE_WRITER_BUFFER)
+            self.paths[tile] = path
+        return writer
+
+    def _tiles(self, cells) -> set:
+        return {self.grid.cell_tiles.get(cell, 0) for cell in cells}
+
+    def node(self, n) -> None:
+        self.count += 1
+        cells = self.node_cells.get(n.id)
+        tiles = self._tiles(cells) if cells else set()
+        if self.point_filter is not None and self.point_filter(n.tags) and n.location.valid():
+            tiles.add(self.grid.tile(n.location.lon, n.location.lat))
+        for tile in tiles:
+            self._writer(tile).add_node(n)
+
+    def way(self, w) -> None:
+        cells = self.way_cells.get(w.id)
+        if cells:
+            for tile in self._tiles(cells):
+                self._writer(tile).add_way(w)
+
+    def close(self) -> Dict[int, str]:
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+        return self.paths
+
+
+def split_tiles(osm_file: str, tile_dir: str, tiles: int, way_filter: Optional[callable] = None,
+                point_filter: Optional[callable] = None, line_filter: Optional[callable] = None,
+                node_cache_dir: Optional[str] = None, metrics: Optional[Metrics] = None,
+                entity_types: Optional[Iterable[str]] = None, boundary: Optional[Boundary] = None):
+    '''Splits an OSM file into at most `tiles` tile files in tile_dir.
+    Returns the TileGrid and the tile file paths by tile.
+
+    '''
+    entity_types = set(TILED_ENTITY_TYPES if entity_types is None else entity_types)
+    network = bool(entity_types & {'edges', 'nodes'})
+    indexer = OSMTileIndexer(
+        CELL_SIZE,
+        way_filter if network else None,
+        line_filter if 'lines' in entity_types else None,
+        point_filter if 'points' in entity_types else None,
+        boundary
+    )
+    if node_cache_dir is not None:
+        node_cache = NodeLocationCache(osm_file, node_cache_dir)
+        # Passes over a prebuilt index read ways only, the points are
+        # weighed in a nodes pass of their own
+        if node_cache.exists() and indexer.point_filter is not None:
+            reader = osmium.io.Reader(osm_file, osmium.osm.osm_entity_bits.NODE)
+            try:
+                osmium.apply(reader, indexer)
+            finally:
+                reader.close()
+        node_cache.apply(indexer)
+    else:
+        indexer.apply_file(osm_file, locations=True)
+    grid = TileGrid.partition(indexer.cell_weights, tiles)
+    way_cells, node_cells = indexer.way_cells, indexer.node_cells
+    if metrics is not None:
+        metrics.count_in('edges', indexer.count)
+        if indexer.point_filter is not None:
+            metrics.count_in('points', indexer.points)
+        if indexer.line_filter is not None:
+            metrics.count_in('lines', indexer.lines)
+    del indexer
+
+    writer = OSMTileWriter(tile_dir, grid, way_cells, node_cells,
+                           point_filter if 'points' in entity_types else None)
+    try:
+        writer.apply_file(osm_file)
+    finally:
+        paths = writer.close()
+    if metrics is not None:
+        metrics.count_in('nodes', writer.count)
+    return grid, paths
+
+
+_grid = None
+
+
+def init_tile_worker(grid: TileGrid) -> None:
+    '''Initializer of tile processes: the grid is sent once per process
+    rather than with every tile.
+
+    '''
+    global _grid
+    _grid = grid
+
+
+def tile_pool(grid: TileGrid, processes: int) -> ProcessPoolExecutor:
+    '''Process pool for convert_tile. Processes are started from a fork
+    server, or spawned, as the libosmium thread pool of the parent does not
+    survive a fork.
+
+    '''
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(method),
+                               initializer=init_tile_worker, initargs=(grid,))
+
+
+def convert_tile(tile_file: str, tile: int, filters: tuple, entity_types: Optional[Iterable[str]] = None,
+                 boundary: Optional[Boundary] = None) -> dict:
+    '''Parses, simplifies and builds the geometries of one tile, in a tile
+    process.
+
+    The tile keeps the segments at the nodes it owns, so every owned node
+    is simplified exactly as in a whole-file conversion. Nodes of other
+    tiles (the halo) are never merged away, and neither are seams: owned
+    nodes simplify would merge whose incoming segment belongs to the
+    previous tile. stitch_tiles merges the chains meeting at seams.
+
+    '''
+    way_filter, node_filter, point_filter, line_filter = filters
+    OG = OSMGraph.from_osm_file(tile_file, way_filter, node_filter, point_filter, line_filter,
+                                entity_types=entity_types, boundary=boundary)
+    G = OG.G
+
+    nodes = list(G.nodes)
+    owned = {node for node, (lon, lat) in zip(nodes, OG.node_locations(nodes)) if _grid.tile(lon, lat) == tile}
+    del nodes
+    # Points and lines belong to the tile of their (first) location
+    OG.features = {
+        name: store.select(_grid.tile(*store.location(i)) == tile for i in range(len(store)))
+        for name, store in OG.features.items()
+    }
+    G.remove_edges_from([(u, v, k) for u, v, k in G.edges(keys=True) if u not in owned and v not in owned])
+    G.remove_nodes_from([node for node in G.nodes if node not in owned and G.degree(node) == 0])
+    halo = {node for node in G.nodes if node not in owned}
+
+    seams = {node for node_in, node, _, _ in OG.removable_nodes(set()) if node in owned and node_in in halo}
+    OG.simplify(keep=halo | seams)
+    # Segments coming in from the halo belong to the previous tile
+    G.remove_edges_from([(u, v, k) for u, v, k in G.edges(keys=True) if u in halo])
+    OG.construct_geometries()
+
+    nodes = [(node, d) for node, d in G.nodes(data=True) if node not in halo]
+    return {
+        'tile': tile,
+        'nodes': nodes,
+        'coordinates': OG.coordinates.subset(node for node, d in nodes),
+        'edges': list(G.edges(data=True)),
+        'features': OG.features,
+        'seams': seams
+    }
+
+
+def stitch_tiles(results: List[dict]) -> OSMGraph:
+    '''Joins the converted tiles, merging the chains of a way that meet at
+    a seam into one edge with the attributes of the first, as simplify
+    does. Closed ways without any node to keep are dropped, like simplify
+    and construct_geometries drop them.
+
+    '''
+    seams = set()
+    for result in results:
+        seams.update(result['seams'])
+
+    starts = {}
+    chains = []
+    for result in results:
+        for u, v, d in result['edges']:
+            if u in seams:
+                starts[u] = (v, d)
+            else:
+                chains.append((u, v, d))
+
+    geod = wgs84_geod()
+    merged = set()
+
+    def follow(u, v, d):
+        if v not in starts:
+            return v, d
+        coords = [d['geometry'].coordinates]
+        while v in starts and v != u:
+            merged.add(v)
+            v, d_next = starts.pop(v)
+            coords.append(d_next['geometry'].coordinates[1:])
+        coords = np.concatenate(coords)
+        return v, {**d, 'geometry': LazyGeometry.line_string(coords),
+                   'length': round(geod.line_length(coords[:, 0], coords[:, 1]), 1)}
+
+    G = nx.MultiDiGraph()
+    edges = []
+    for u, v, d in chains:
+        v, d = follow(u, v, d)
+        edges.append((u, v, d))
+    # Chains left start at seams no other chain reaches: closed ways of
+    # nodes simplify merges away, unless a chain is left out.
+    while starts:
+        u = next(iter(starts))
+        v, d = follow(u, *starts.pop(u))
+        if v == u:
+            merged.add(u)
+        else:
+            edges.append((u, v, d))
+
+    for result in results:
+        for node, d in result['nodes']:
+            if node not in merged:
+                G.add_node(node, **d)
+    G.add_edges_from(edges)
+
+    features = feature_stores()
+    coordinates = NodeCoordinates()
+    for result in results:
+        for name, store in result.get('features', {}).items():
+            features[name].extend(store)
+        if 'coordinates' in result:
+            coordinates.extend(result['coordinates'])
+    return OSMGraph(G, features, coordinates)
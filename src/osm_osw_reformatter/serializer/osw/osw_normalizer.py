@@ -1,5 +1,9 @@
 import types
 OSW_SCHEMA_ID = "https://sidewalks.washington.edu/opensidewalks/0.2/schema.json"
+# OSW file types, in the order they are written
+OSW_ENTITY_TYPES = ("edges", "nodes", "points", "lines", "zones", "polygons")
+# Zones and polygons need area assembly, an extra pass over the input
+DEFAULT_ENTITY_TYPES = ("edges", "nodes", "points", "lines")
 
 class OSWWayNormalizer:
 
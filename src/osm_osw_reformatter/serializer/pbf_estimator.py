@@ -0,0 +1,252 @@
+import zlib
+import struct
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+# osmium, osmosis and most other writers put at most 8000 entities in a block
+ENTITIES_PER_BLOCK = 8000
+
+# Uncompressed bytes per entity, used when a file has no full block of a type
+# to calibrate from. Measured on osmium-written extracts.
+DEFAULT_BYTES_PER_ENTITY = {'nodes': 12, 'ways': 65, 'relations': 600}
+
+# PrimitiveGroup field numbers
+_GROUP_TYPES = {1: 'nodes', 2: 'nodes', 3: 'ways', 4: 'relations'}
+
+# How much compressed data is read at once while looking for the first group
+_READ_SIZE = 16 * 1024
+
+# BlobHeaders are limited to 64 KiB by the PBF specification
+_MAX_HEADER_SIZE = 64 * 1024
+
+
+@dataclass
+class PbfEstimate:
+    nodes: int
+    ways: int
+    relations: int
+    # (min_lon, min_lat, max_lon, max_lat) from the file header, if present
+    bbox: Optional[Tuple[float, float, float, float]]
+    blocks: int
+
+    @property
+    def progress_total(self) -> int:
+        '''Number of progressbar updates of OSMGraph.from_osm_file: the way
+        and line passes visit every way, the node and point passes every
+        node. The zone and polygon passes add one update per area, which is
+        not estimated.
+
+        '''
+        return 2 * self.nodes + 2 * self.ways
+
+
+def _varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(buf: bytes):
+    pos = 0
+    while pos < len(buf):
+        key, pos = _varint(buf, pos)
+        wire_type = key & 7
+        if wire_type == 0:
+            value, pos = _varint(buf, pos)
+        elif wire_type == 2:
+            length, pos = _varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        elif wire_type == 1:
+            value = buf[pos:pos + 8]
+            pos += 8
+        elif wire_type == 5:
+            value = buf[pos:pos + 4]
+            pos += 4
+        else:
+            raise ValueError(f'Unsupported protobuf wire type {wire_type}')
+        yield key >> 3, value
+
+
+def _zigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+class _Inflater:
+    '''Incrementally decompresses the start of a zlib blob, keeping track
+    of the uncompressed offset.
+
+    '''
+
+    def __init__(self, f, size: int, data: bytes = b'') -> None:
+        self.f = f
+        self.remaining = size
+        self.decompressor = zlib.decompressobj() if f is not None else None
+        self.buf = data
+        self.offset = 0
+
+    def _fill(self, n: int) -> None:
+        while len(self.buf) < n:
+            if self.decompressor is None:
+                # Uncompressed blob, everything is in buf already
+                return
+            data = self.decompressor.unconsumed_tail
+            if not data:
+                if self.remaining <= 0:
+                    return
+                data = self.f.read(min(_READ_SIZE, self.remaining))
+                self.remaining -= len(data)
+            self.buf += self.decompressor.decompress(data, max(n - len(self.buf), _READ_SIZE))
+
+    def varint(self) -> int:
+        self._fill(10)
+        value, pos = _varint(self.buf, 0)
+        self.buf = self.buf[pos:]
+        self.offset += pos
+        return value
+
+    def skip(self, n: int) -> None:
+        self.offset += n
+        while n > len(self.buf):
+            n -= len(self.buf)
+            self.buf = b''
+            self._fill(min(n, _READ_SIZE))
+            if not self.buf:
+                raise EOFError
+        self.buf = self.buf[n:]
+
+
+def _first_group(inflater: _Inflater) -> Tuple[Optional[str], int]:
+    '''Returns the entity type of the first PrimitiveGroup and the offset
+    at which it ends. Only the string table in front of it is decompressed.
+
+    '''
+    while True:
+        key = inflater.varint()
+        length = inflater.varint()
+        if key >> 3 == 2:
+            end = inflater.offset + length
+            group_key = inflater.varint()
+            return _GROUP_TYPES.get(group_key >> 3), end
+        inflater.skip(length)
+
+
+def estimate_pbf(osm_file_path: str, entities_per_block: int = ENTITIES_PER_BLOCK) -> PbfEstimate:
+    '''Estimates the number of nodes, ways and relations of a PBF file from
+    its block structure, without decoding any entity.
+
+    Every block is classified by its first PrimitiveGroup, which takes
+    decompressing just the string table in front of it. Counts are then
+    derived from the uncompressed block sizes, calibrated on blocks that are
+    followed by another block of the same type and so are assumed full.
+    Blocks mixing types are split by size: everything after the first group
+    is attributed to the next entity type.
+
+    '''
+    bbox = None
+    blocks = 0
+    # type: [uncompressed bytes of every block, uncompressed bytes of full blocks, number of full blocks]
+    sizes = {entity_type: [0, 0, 0] for entity_type in DEFAULT_BYTES_PER_ENTITY}
+    previous = None
+    has_header = False
+
+    with open(osm_file_path, 'rb') as f:
+        while True:
+            length_prefix = f.read(4)
+            if len(length_prefix) < 4:
+                break
+            header_size = struct.unpack('>I', length_prefix)[0]
+            try:
+                if header_size > _MAX_HEADER_SIZE:
+                    raise ValueError
+                header = dict(_fields(f.read(header_size)))
+                block_type = header.get(1, b'').decode('utf-8', 'replace')
+                datasize = header[3]
+            except (ValueError, KeyError, IndexError):
+                raise ValueError(f'{osm_file_path} is not an OSM PBF file')
+            if not has_header and block_type != 'OSMHeader':
+                raise ValueError(f'{osm_file_path} is not an OSM PBF file')
+            blob_end = f.tell() + datasize
+
+            if block_type == 'OSMHeader':
+                has_header = True
+                blob = dict(_fields(f.read(datasize)))
+                raw = blob[1] if 1 in blob else zlib.decompress(blob[3])
+                header_block = dict(_fields(raw))
+                if 1 in header_block:
+                    box = {k: _zigzag(v) / 1e9 for k, v in _fields(header_block[1])}
+                    bbox = (box[1], box[4], box[2], box[3])
+            elif block_type == 'OSMData':
+                blocks += 1
+                entity_type, raw_size, first_end = _classify_blob(f, datasize)
+                if entity_type is not None:
+                    if previous is not None and previous[0] == entity_type:
+                        sizes[entity_type][1] += previous[1]
+                        sizes[entity_type][2] += 1
+                    first_end = min(first_end, raw_size)
+                    sizes[entity_type][0] += first_end
+                    rest = raw_size - first_end
+                    # Trailing granularity fields take a few bytes
+                    if rest > 64 and entity_type != 'relations':
+                        sizes['ways' if entity_type == 'nodes' else 'relations'][0] += rest
+                        entity_type = None
+                    previous = (entity_type, raw_size) if entity_type else None
+
+            f.seek(blob_end)
+
+    counts = {}
+    for entity_type, (total, full, n_full) in sizes.items():
+        if n_full:
+            bytes_per_entity = full / (n_full * entities_per_block)
+        else:
+            bytes_per_entity = DEFAULT_BYTES_PER_ENTITY[entity_type]
+        counts[entity_type] = int(round(total / bytes_per_entity))
+
+    return PbfEstimate(
+        nodes=counts['nodes'],
+        ways=counts['ways'],
+        relations=counts['relations'],
+        bbox=bbox,
+        blocks=blocks
+    )
+
+
+def _classify_blob(f, datasize: int) -> Tuple[Optional[str], int, int]:
+    '''Reads the Blob fields up to the compressed data and classifies the
+    block. Returns the entity type, the uncompressed size and the offset at
+    which the first group ends.
+
+    '''
+    start = f.tell()
+    raw_size = None
+    prefix = f.read(min(32, datasize))
+    pos = 0
+    while pos < len(prefix):
+        key, pos = _varint(prefix, pos)
+        field = key >> 3
+        if field == 2:
+            raw_size, pos = _varint(prefix, pos)
+            continue
+        length, pos = _varint(prefix, pos)
+        f.seek(start + pos)
+        if field == 1:
+            # Uncompressed block
+            raw_size = length
+            inflater = _Inflater(None, 0, f.read(length))
+        elif field == 3 and raw_size is not None:
+            inflater = _Inflater(f, length)
+        else:
+            # lzma, lz4 or zstd, or no raw_size to size the block with
+            return None, 0, 0
+        try:
+            entity_type, first_end = _first_group(inflater)
+        except (EOFError, IndexError, zlib.error):
+            return None, 0, 0
+        return entity_type, raw_size, first_end
+    return None, 0, 0
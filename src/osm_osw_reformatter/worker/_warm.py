@@ -0,0 +1,5 @@
+# Preloaded by the fork server of WorkerService, so that every worker is
+# forked from a process that has imported everything but never run osmium.
+from .worker import warm_up
+
+warm_up()
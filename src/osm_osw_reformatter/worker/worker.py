@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import asyncio
+import argparse
+import traceback
+import dataclasses
+import multiprocessing
+from pathlib import Path
+from typing import Optional
+from ..helpers.metrics import peak_rss
+
+DIRECTIONS = ('osm2osw', 'osw2osm')
+# Job files move from pending to running (as <job id>.<worker pid>.json) and
+# end up in done or failed, next to their result
+QUEUE_DIRS = ('pending', 'running', 'done', 'failed')
+
+
+def _write_json(path, data: dict) -> None:
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class JobQueue:
+    '''Job queue in a local directory, shared by producers and workers.
+
+    Jobs are JSON files published with an atomic rename into `pending/` and
+    claimed by renaming them into `running/`, so every job is run by exactly
+    one worker. Results are written to `done/` or `failed/` as
+    `<job id>.json`.
+
+    '''
+
+    def __init__(self, queue_dir: str) -> None:
+        self.queue_dir = str(queue_dir)
+        for name in QUEUE_DIRS:
+            os.makedirs(os.path.join(self.queue_dir, name), exist_ok=True)
+
+    def _path(self, state: str, name: str) -> str:
+        return os.path.join(self.queue_dir, state, name)
+
+    def submit(self, direction: str, file_path: str, workdir: str, prefix: str = 'final', **options) -> str:
+        '''Queues a conversion and returns its job id. options are passed on
+        to Formatter.
+
+        '''
+        if direction not in DIRECTIONS:
+            raise ValueError(f'Unknown direction {direction}')
+        job_id = f'{time.time_ns():020d}-{uuid.uuid4().hex[:8]}'
+        job = {
+            'id': job_id,
+            'direction': direction,
+            'file_path': str(file_path),
+            'workdir': str(workdir),
+            'prefix': prefix,
+            'options': options,
+            'submitted': time.time()
+        }
+        _write_json(self._path('pending', f'{job_id}.json'), job)
+        return job_id
+
+    def claim(self) -> Optional[dict]:
+        '''Claims the oldest pending job for the calling process.'''
+        for name in sorted(os.listdir(os.path.join(self.queue_dir, 'pending'))):
+            if not name.endswith('.json'):
+                continue
+            running = self._path('running', f'{name[:-len(".json")]}.{os.getpid()}.json')
+            try:
+                os.rename(self._path('pending', name), running)
+            except FileNotFoundError:
+                # Claimed by another worker
+                continue
+            with open(running) as f:
+                return json.load(f)
+        return None
+
+    def finish(self, job: dict, result: dict) -> None:
+        state = 'done' if result.get('status') else 'failed'
+        _write_json(self._path(state, f'{job["id"]}.json'), {**result, 'job': job})
+        running = self._path('running', f'{job["id"]}.{os.getpid()}.json')
+        if os.path.exists(running):
+            os.remove(running)
+
+    def fail_claimed(self, pid: int, error: str) -> None:
+        '''Fails the jobs a dead worker had claimed.'''
+        suffix = f'.{pid}.json'
+        for name in os.listdir(os.path.join(self.queue_dir, 'running')):
+            if name.endswith(suffix):
+                path = self._path('running', name)
+                with open(path) as f:
+                    job = json.load(f)
+                _write_json(self._path('failed', f'{job["id"]}.json'), {'status': False, 'error': error, 'job': job})
+                os.remove(path)
+
+    def result(self, job_id: str) -> Optional[dict]:
+        for state in ('done', 'failed'):
+            path = self._path(state, f'{job_id}.json')
+            if os.path.exists(path):
+                with open(path) as f:
+                    return json.load(f)
+        return None
+
+    def pending(self) -> int:
+        return sum(1 for name in os.listdir(os.path.join(self.queue_dir, 'pending')) if name.endswith('.json'))
+
+
+def warm_up() -> None:
+    '''Imports both directions and sets up the shared state every
+    conversion needs, so that workers forked afterwards start warm.
+
+    '''
+    from ..osm2osw.osm2osw import OSM2OSW  # noqa: F401
+    from ..osw2osm.osw2osm import OSW2OSM  # noqa: F401
+    from ..helpers.osw import OSWHelper
+    from ..serializer.osm.osm_graph import wgs84_geod
+    wgs84_geod()
+    OSWHelper.osw_way_filter({'highway': 'footway'})
+    try:
+        import ogr2osm  # noqa: F401
+        from ..serializer.osm.osm_normalizer import OSMNormalizer  # noqa: F401
+    except ImportError:
+        # OSW to OSM jobs fail with the import error when they run
+        pass
+
+
+def run_job(job: dict) -> dict:
+    from .. import Formatter
+
+    start = time.perf_counter()
+    try:
+        formatter = Formatter(workdir=job['workdir'], file_path=job['file_path'], prefix=job['prefix'],
+                              **job['options'])
+        if job['direction'] == 'osm2osw':
+            response = asyncio.run(formatter.osm2osw())
+        else:
+            response = formatter.osw2osm()
+        result = dataclasses.asdict(response)
+    except Exception as error:
+        traceback.print_exc()
+        result = {'status': False, 'generated_files': None, 'error': str(error), 'metrics': None}
+    result['worker'] = os.getpid()
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def _worker_loop(queue_dir: str, max_jobs: int, max_rss: Optional[int], poll_interval: float, stop) -> None:
+    # Stopping is up to the supervisor, a job in progress is finished first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    queue = JobQueue(queue_dir)
+    jobs = 0
+    while not stop.is_set():
+        job = queue.claim()
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+        queue.finish(job, run_job(job))
+        jobs += 1
+        if max_jobs and jobs >= max_jobs:
+            return
+        if max_rss and (peak_rss() or 0) >= max_rss:
+            return
+
+
+class WorkerService:
+    '''Long-lived pool of conversion workers pulling jobs from a JobQueue.
+
+    Everything is imported once in a fork server (see warm_up) and
+    `concurrency` workers are forked from it. A worker exits after
+    `max_jobs` jobs or once its peak RSS reaches `max_rss` bytes, and is
+    replaced by a fresh fork, which bounds the memory a worker can leak or
+    fragment. Jobs claimed by a worker that crashes are failed.
+
+    '''
+
+    def __init__(self, queue_dir: str, concurrency: int = 2, max_jobs: int = 100, max_rss: Optional[int] = None,
+                 poll_interval: float = 0.5) -> None:
+        self.queue = JobQueue(queue_dir)
+        self.concurrency = concurrency
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.poll_interval = poll_interval
+        self.started_workers = 0
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            # Workers are forked from a server that ran warm_up. Forking this
+            # process instead is not safe once it has read a PBF file: the
+            # libosmium thread pool does not survive a fork.
+            self._ctx = multiprocessing.get_context('forkserver')
+            self._ctx.set_forkserver_preload([f'{__package__}._warm'])
+        else:
+            self._ctx = multiprocessing.get_context('spawn')
+        self._stop = self._ctx.Event()
+        self._workers = []
+
+    def _start_worker(self):
+        process = self._ctx.Process(
+            target=_worker_loop,
+            args=(self.queue.queue_dir, self.max_jobs, self.max_rss, self.poll_interval, self._stop),
+            # Not a daemon, so that tiled conversions can start their tile
+            # processes; run() always joins the workers
+            daemon=False
+        )
+        process.start()
+        self.started_workers += 1
+        return process
+
+    def _reap(self) -> None:
+        alive = []
+        for process in self._workers:
+            if process.is_alive():
+                alive.append(process)
+                continue
+            process.join()
+            if process.exitcode != 0:
+                self.queue.fail_claimed(process.pid, f'Worker exited with code {process.exitcode}')
+        self._workers = alive
+
+    def _idle(self) -> bool:
+        return self.queue.pending() == 0 and not os.listdir(os.path.join(self.queue.queue_dir, 'running'))
+
+    def run(self, until_idle: bool = False) -> None:
+        '''Runs workers until stop() is called, or until the queue is empty
+        with until_idle.
+
+        '''
+        try:
+            while not self._stop.is_set():
+                self._reap()
+                if until_idle and self._idle():
+                    break
+                while len(self._workers) < self.concurrency:
+                    self._workers.append(self._start_worker())
+                time.sleep(min(self.poll_interval, 0.1))
+        finally:
+            self.stop()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        '''Lets workers finish their current job and waits for them.'''
+        self._stop.set()
+        for process in self._workers:
+            process.join(timeout)
+        self._reap()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Run conversion workers on a job queue directory')
+    parser.add_argument('queue_dir')
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--max-jobs', type=int, default=100, help='Jobs after which a worker is replaced')
+    parser.add_argument('--max-rss-mb', type=int, default=None, help='Peak RSS after which a worker is replaced')
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    service = WorkerService(args.queue_dir, args.concurrency, args.max_jobs,
+                            args.max_rss_mb * 1024 ** 2 if args.max_rss_mb else None, args.poll_interval)
+    signal.signal(signal.SIGTERM, lambda signum, frame: service.stop())
+    print(f'Serving {Path(args.queue_dir).resolve()} with {args.concurrency} workers...')
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        service.stop()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,98 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from src.osm_osw_reformatter.helpers.cache import ConversionCache, file_digest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_FILE = os.path.join(ROOT_DIR, 'test_files/wa.microsoft.osm.pbf')
+
+
+class TestConversionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.workdir = os.path.join(self.tmp_dir, 'work')
+        os.makedirs(self.workdir)
+        self.cache = ConversionCache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_outputs(self, stem, size=10):
+        files = []
+        for name in ['graph.nodes.geojson', 'graph.edges.geojson']:
+            path = os.path.join(self.workdir, f'{stem}.{name}')
+            with open(path, 'w') as f:
+                f.write('x' * size)
+            files.append(path)
+        return files
+
+    def test_file_digest(self):
+        self.assertEqual(file_digest(TEST_FILE), file_digest(TEST_FILE))
+        self.assertEqual(len(file_digest(TEST_FILE)), 64)
+
+    def test_key_depends_on_direction_and_options(self):
+        key = self.cache.key(TEST_FILE, 'osm2osw')
+        self.assertEqual(key, self.cache.key(TEST_FILE, 'osm2osw', {}))
+        self.assertNotEqual(key, self.cache.key(TEST_FILE, 'osw2osm'))
+        self.assertNotEqual(key, self.cache.key(TEST_FILE, 'osm2osw', {'option': 1}))
+
+    def test_get_miss(self):
+        self.assertIsNone(self.cache.get('missing', self.workdir, 'stem'))
+
+    def test_put_and_get_renames_to_stem(self):
+        files = self._write_outputs('first.input')
+        self.cache.put('key', files, 'first.input')
+
+        generated_files = self.cache.get('key', self.workdir, 'second.input')
+        self.assertEqual(
+            [os.path.basename(file) for file in generated_files],
+            ['second.input.graph.nodes.geojson', 'second.input.graph.edges.geojson']
+        )
+        for file in generated_files:
+            with open(file) as f:
+                self.assertEqual(f.read(), 'x' * 10)
+
+    def test_get_survives_cleanup_of_outputs(self):
+        files = self._write_outputs('stem')
+        self.cache.put('key', files, 'stem')
+        for file in files:
+            os.remove(file)
+
+        generated_files = self.cache.get('key', self.workdir, 'stem')
+        self.assertEqual(len(generated_files), 2)
+        self.assertTrue(all(os.path.exists(file) for file in generated_files))
+
+    def test_put_rejects_foreign_file_names(self):
+        files = self._write_outputs('stem')
+        with self.assertRaises(ValueError):
+            self.cache.put('key', files, 'other')
+
+    def test_evicts_least_recently_used(self):
+        cache = ConversionCache(self.cache_dir, max_bytes=50)
+        cache.put('old', self._write_outputs('stem', size=10), 'stem')
+        cache.put('used', self._write_outputs('stem', size=10), 'stem')
+        # Make 'old' the least recently used entry
+        old_time = time.time() - 100
+        os.utime(os.path.join(self.cache_dir, 'entries', 'old', 'manifest.json'), (old_time, old_time))
+        os.utime(os.path.join(self.cache_dir, 'entries', 'used', 'manifest.json'), (old_time + 1, old_time + 1))
+        self.assertIsNotNone(cache.get('used', self.workdir, 'stem'))
+
+        cache.put('new', self._write_outputs('stem', size=10), 'stem')
+
+        self.assertIsNone(cache.get('old', self.workdir, 'stem'))
+        self.assertIsNotNone(cache.get('used', self.workdir, 'stem'))
+        self.assertIsNotNone(cache.get('new', self.workdir, 'stem'))
+
+    def test_copy_mode(self):
+        cache = ConversionCache(self.cache_dir, link=False)
+        files = self._write_outputs('stem')
+        cache.put('key', files, 'stem')
+        generated_files = cache.get('key', self.workdir, 'copy')
+        self.assertNotEqual(os.stat(generated_files[0]).st_ino, os.stat(files[0]).st_ino)
+
+
+if __name__ == '__main__':
+    unittest.main()
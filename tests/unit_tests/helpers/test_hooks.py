@@ -0,0 +1,122 @@
+import os
+import asyncio
+import tempfile
+import unittest
+import osmium
+from src.osm_osw_reformatter.helpers.hooks import PipelineHook, SpanHook, CProfileHook, TracemallocHook, \
+    CallbackTimingHook
+from src.osm_osw_reformatter.helpers.metrics import Metrics
+from src.osm_osw_reformatter.osm2osw.osm2osw import OSM2OSW
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(ROOT_DIR)), 'output')
+TEST_FILE = os.path.join(ROOT_DIR, 'test_files/wa.microsoft.osm.pbf')
+
+
+class NodeHandler(osmium.SimpleHandler):
+    def __init__(self):
+        super().__init__()
+        self.nodes = 0
+
+    def node(self, n):
+        self.nodes += 1
+
+
+class RecordingHook(PipelineHook):
+    def __init__(self, stages=None):
+        super().__init__(stages)
+        self.calls = []
+
+    def stage_start(self, metrics, stage):
+        self.calls.append(('start', stage))
+
+    def stage_end(self, metrics, stage, record):
+        self.calls.append(('end', stage))
+
+
+class TestPipelineHooks(unittest.TestCase):
+    def test_hooks_wrap_stages_in_order(self):
+        first = RecordingHook()
+        second = RecordingHook(stages=['b'])
+        metrics = Metrics([first, second])
+        with metrics.stage('a'):
+            pass
+        with metrics.stage('b'):
+            pass
+        self.assertEqual(first.calls, [('start', 'a'), ('end', 'a'), ('start', 'b'), ('end', 'b')])
+        self.assertEqual(second.calls, [('start', 'b'), ('end', 'b')])
+
+    def test_no_hooks_leave_handlers_untouched(self):
+        handler = NodeHandler()
+        Metrics().wrap_handler('parse_nodes', handler)
+        self.assertNotIn('node', vars(handler))
+
+    def test_span_hook_emits_events(self):
+        events = []
+        metrics = Metrics([SpanHook(events.append)])
+        with metrics.stage('parse'):
+            metrics.count_in('nodes', 3)
+        self.assertEqual([event['event'] for event in events], ['start', 'end'])
+        self.assertEqual(events[1]['stage'], 'parse')
+        self.assertEqual(events[1]['counts']['in'], {'nodes': 3})
+        self.assertIn('wall', events[1])
+
+    def test_cprofile_hook(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            hook = CProfileHook(stages=['sum'], output_dir=output_dir)
+            metrics = Metrics([hook])
+            with metrics.stage('sum'):
+                sum(range(1000))
+            with metrics.stage('other'):
+                pass
+            self.assertEqual(list(hook.profiles), ['sum'])
+            self.assertTrue(os.path.exists(os.path.join(output_dir, 'sum.prof')))
+
+    def test_tracemalloc_hook(self):
+        hook = TracemallocHook(top=3)
+        metrics = Metrics([hook])
+        with metrics.stage('allocate'):
+            data = [bytearray(1024) for _ in range(100)]
+        del data
+        self.assertGreater(hook.results['allocate']['peak'], 100 * 1024)
+        self.assertLessEqual(len(hook.results['allocate']['top']), 3)
+
+    def test_callback_timing_hook(self):
+        hook = CallbackTimingHook(sample_every=10)
+        metrics = Metrics([hook])
+        handler = NodeHandler()
+        metrics.wrap_handler('parse_nodes', handler)
+        handler.apply_file(TEST_FILE)
+
+        result = hook.results['parse_nodes']['node']
+        self.assertEqual(handler.nodes, 17502)
+        self.assertEqual(result['calls'], 17502)
+        self.assertEqual(result['sampled'], 1750)
+        self.assertEqual(sum(result['histogram'].values()), 1750)
+
+    def test_osm2osw_with_hooks(self):
+        events = []
+        profile = CProfileHook(stages=['simplify'])
+        timing = CallbackTimingHook(stages=['parse_ways'])
+
+        async def run_test():
+            osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test',
+                              hooks=[SpanHook(events.append), profile, timing])
+            result = await osm2osw.convert()
+            self.assertTrue(result.status)
+            for file in result.generated_files:
+                os.remove(file)
+
+        asyncio.run(run_test())
+
+        stages = [event['stage'] for event in events if event['event'] == 'end']
+        self.assertEqual(stages, ['parse_ways', 'parse_nodes', 'parse_points', 'parse_lines', 'simplify',
+                                  'construct_geometries', 'write'])
+        # Stages run in the executor thread, so the profile sees the work
+        functions = [func[2] for func in profile.profiles['simplify'].stats]
+        self.assertIn('simplify', functions)
+        self.assertEqual(timing.results['parse_ways']['way']['calls'], 4630)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import time
+import unittest
+from src.osm_osw_reformatter.helpers.metrics import Metrics, peak_rss
+
+
+class TestMetrics(unittest.TestCase):
+    def test_stage_records_times(self):
+        metrics = Metrics()
+        with metrics.stage('sleep'):
+            time.sleep(0.01)
+        stage = metrics.stages['sleep']
+        self.assertGreaterEqual(stage['wall'], 0.01)
+        self.assertGreaterEqual(stage['cpu'], 0)
+        self.assertGreater(stage['peak_rss'], 0)
+
+    def test_stage_records_on_error(self):
+        metrics = Metrics()
+        with self.assertRaises(ValueError):
+            with metrics.stage('fail'):
+                raise ValueError
+        self.assertIn('fail', metrics.stages)
+
+    def test_counts_accumulate(self):
+        metrics = Metrics()
+        metrics.count_in('nodes', 2)
+        metrics.count_in('nodes', 3)
+        metrics.count_out('edges', 1)
+        self.assertEqual(metrics.to_dict()['counts'], {'in': {'nodes': 5}, 'out': {'edges': 1}})
+
+    def test_to_dict_totals(self):
+        metrics = Metrics()
+        with metrics.stage('a'):
+            pass
+        with metrics.stage('b'):
+            pass
+        result = metrics.to_dict()
+        self.assertEqual(list(result['stages']), ['a', 'b'])
+        self.assertAlmostEqual(result['wall'], sum(stage['wall'] for stage in result['stages'].values()))
+        self.assertGreaterEqual(result['peak_rss'], result['stages']['b']['peak_rss'])
+
+    def test_stage_of_none(self):
+        with Metrics.stage_of(None, 'ignored'):
+            pass
+        metrics = Metrics()
+        with Metrics.stage_of(metrics, 'used'):
+            pass
+        self.assertIn('used', metrics.stages)
+
+    def test_peak_rss(self):
+        self.assertGreater(peak_rss(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
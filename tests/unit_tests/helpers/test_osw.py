@@ -5,6 +5,7 @@ import asyncio
 import unittest
 from pathlib import Path
 from src.osm_osw_reformatter.helpers.osw import OSWHelper
+from src.osm_osw_reformatter.helpers.metrics import Metrics
 from src.osm_osw_reformatter.serializer.osm.osm_graph import OSMGraph
 from src.osm_osw_reformatter.serializer.counters import WayCounter, PointCounter, NodeCounter
 
@@ -118,6 +119,25 @@ class TestOSWHelper(unittest.TestCase):
 
         asyncio.run(run_test())
 
+    def test_count_all_entities(self):
+        osm_file_path = self.osm_file_path
+
+        async def run_test():
+            result = await OSWHelper.count_all_entities(osm_file_path)
+            self.assertEqual(result.raw['edges'], 4630)
+            self.assertEqual(result.raw['lines'], 4630)
+            self.assertEqual(result.raw['nodes'], 17502)
+            self.assertEqual(result.raw['points'], 17502)
+            # Closed ways and multipolygons, a close upper bound of assembled areas
+            self.assertGreaterEqual(result.raw['zones'], 956)
+            self.assertEqual(result.raw['zones'], result.raw['polygons'])
+            for entity_type, count in result.osw.items():
+                self.assertLessEqual(count, result.raw[entity_type])
+            self.assertGreater(result.osw['edges'], 0)
+            self.assertGreater(result.osw['polygons'], 0)
+
+        asyncio.run(run_test())
+
     def test_count_entities_with_ways_counter(self):
         osm_file_path = self.osm_file_path
 
@@ -207,12 +227,54 @@ class TestOSWHelper(unittest.TestCase):
         os.remove(f'{OUTPUT_DIR}/other_file.txt')
         os.remove(zip_file_path)
 
+    def test_read_zip(self):
+        zip_file_path = f'{OUTPUT_DIR}/test_read_zip.zip'
+        with zipfile.ZipFile(zip_file_path, 'w') as zf:
+            for filename, data in self.geojson_files.items():
+                zf.writestr(f'region.{os.path.basename(filename).replace("file1", "nodes").replace("file2", "edges")}',
+                            json.dumps(data))
+            zf.writestr('__MACOSX/region.points.geojson', '')
+
+        with open(zip_file_path, 'rb') as f:
+            data = f.read()
+        collections = OSWHelper.read_zip(data)
+        self.assertEqual(set(collections), {'nodes', 'edges'})
+        self.assertEqual(collections['nodes']['features'][0]['geometry']['coordinates'], [1, 2])
+        with open(zip_file_path, 'rb') as f:
+            self.assertEqual(OSWHelper.read_zip(f), collections)
+        self.assertFalse(os.path.exists(os.path.join(OUTPUT_DIR, 'region.nodes.geojson')))
+        os.remove(zip_file_path)
+
+    def test_merge_collections(self):
+        metrics = Metrics()
+        fc = OSWHelper.merge_collections({'nodes': self.geojson_files[f'{OUTPUT_DIR}/file1.geojson'],
+                                          'edges': self.geojson_files[f'{OUTPUT_DIR}/file2.geojson']}, metrics)
+        self.assertEqual([f['geometry']['coordinates'] for f in fc['features']], [[1, 2], [3, 4]])
+        self.assertEqual(metrics.counts_in, {'nodes': 1, 'edges': 1})
+
+    def test_select_entity_types(self):
+        self.assertEqual(OSWHelper.select_entity_types(), ('edges', 'nodes', 'points', 'lines'))
+        self.assertEqual(OSWHelper.select_entity_types(['polygons', 'zones', 'edges']),
+                         ('edges', 'zones', 'polygons'))
+        self.assertEqual(OSWHelper.select_entity_types(['points', 'edges']), ('edges', 'points'))
+        self.assertEqual(OSWHelper.select_entity_types('nodes'), ('nodes',))
+        with self.assertRaises(ValueError):
+            OSWHelper.select_entity_types(['edges', 'crossings'])
+        with self.assertRaises(ValueError):
+            OSWHelper.select_entity_types([])
+
     def test_merge(self):
         osm_files = {file: file for file in self.geojson_files.keys()}
         output_path = OSWHelper.merge(osm_files=osm_files, output=OUTPUT_DIR, prefix='test')
         self.assertTrue(os.path.exists(output_path))
         self.assertTrue(Path(output_path).is_file())
 
+    def test_merge_counts_features(self):
+        osm_files = {file: file for file in self.geojson_files.keys()}
+        metrics = Metrics()
+        OSWHelper.merge(osm_files=osm_files, output=OUTPUT_DIR, prefix='test', metrics=metrics)
+        self.assertEqual(set(metrics.counts_in), set(osm_files))
+
     def test_cleanup_of_temp_files(self):
         osm_files = {file: file for file in self.geojson_files.keys()}
         output_path = OSWHelper.merge(osm_files=osm_files, output=OUTPUT_DIR, prefix='test')
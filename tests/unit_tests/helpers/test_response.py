@@ -9,6 +9,7 @@ class TestResponseClass(unittest.TestCase):
         self.assertTrue(response.status)
         self.assertIsNone(response.generated_files)
         self.assertIsNone(response.error)
+        self.assertIsNone(response.metrics)
 
     def test_custom_values(self):
         files = ['file1.txt', 'file2.txt']
@@ -30,6 +31,11 @@ class TestResponseClass(unittest.TestCase):
         response = Response(status=False, error='An error message')
         self.assertEqual(response.error, 'An error message')
 
+    def test_metrics(self):
+        metrics = {'stages': {}, 'counts': {'in': {}, 'out': {}}}
+        response = Response(status=True, metrics=metrics)
+        self.assertEqual(response.metrics, metrics)
+
     def test_error_none(self):
         response = Response(status=True, error=None)
         self.assertIsNone(response.error)
@@ -0,0 +1,25 @@
+import unittest
+import src.osm_osw_reformatter as package
+from benchmarks.import_time import measure
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_imports_do_not_load_heavy_dependencies(self):
+        report = measure(['package', 'normalizers', 'osm2osw', 'osw2osm'], repeat=1)
+        for name, result in report['results'].items():
+            self.assertEqual(result['loaded'], [], name)
+            self.assertGreater(result['import_seconds'], 0)
+
+    def test_converters_resolve_lazily(self):
+        from src.osm_osw_reformatter.osm2osw.osm2osw import OSM2OSW
+        from src.osm_osw_reformatter.osw2osm.osw2osm import OSW2OSM
+        self.assertIs(package.OSM2OSW, OSM2OSW)
+        self.assertIs(package.OSW2OSM, OSW2OSM)
+
+    def test_unknown_attribute(self):
+        with self.assertRaises(AttributeError):
+            package.Missing
+
+
+if __name__ == '__main__':
+    unittest.main()
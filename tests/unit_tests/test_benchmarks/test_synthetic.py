@@ -0,0 +1,125 @@
+import os
+import json
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+import osmium
+from benchmarks.synthetic import SyntheticGrid, generate
+from benchmarks.run import run, compare, StageTimer, _osw2osm
+from src.osm_osw_reformatter.helpers.response import Response
+from src.osm_osw_reformatter.helpers.osw import OSWHelper
+
+
+class LocationCounter(osmium.SimpleHandler):
+    def __init__(self):
+        super().__init__()
+        self.nodes = 0
+        self.ways = 0
+        self.invalid = 0
+
+    def node(self, n):
+        self.nodes += 1
+
+    def way(self, w):
+        self.ways += 1
+        self.invalid += sum(1 for node in w.nodes if not node.location.valid())
+
+
+class TestSyntheticGrid(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.osm_file = os.path.join(self.tmp_dir, 'grid.osm.pbf')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_for_nodes_scales(self):
+        for nodes in [10_000, 1_000_000, 10_000_000]:
+            grid = SyntheticGrid.for_nodes(nodes)
+            self.assertAlmostEqual(grid.n_nodes, nodes, delta=nodes * 0.05)
+
+    def test_generate_counts(self):
+        grid = generate(self.osm_file, 10_000)
+        counter = LocationCounter()
+        counter.apply_file(self.osm_file, locations=True)
+        self.assertEqual(counter.nodes, grid.n_nodes)
+        self.assertEqual(counter.ways, grid.n_ways)
+        self.assertEqual(counter.invalid, 0)
+
+    def test_generate_is_deterministic(self):
+        other_file = os.path.join(self.tmp_dir, 'other.osm.pbf')
+        generate(self.osm_file, 5_000, seed=1)
+        generate(other_file, 5_000, seed=1)
+        with open(self.osm_file, 'rb') as a, open(other_file, 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_generate_osw_entities(self):
+        generate(self.osm_file, 10_000)
+        counts = asyncio.run(OSWHelper.count_all_entities(self.osm_file))
+        self.assertGreater(counts.osw['edges'], 0)
+        self.assertGreater(counts.osw['nodes'], 0)
+        self.assertGreater(counts.osw['points'], 0)
+        self.assertGreater(counts.osw['lines'], 0)
+
+    def test_generate_buildings(self):
+        grid = generate(self.osm_file, 10_000, buildings=3)
+        self.assertEqual(grid.n_buildings, grid.n_blocks * 3)
+        self.assertAlmostEqual(grid.n_nodes, 10_000, delta=10_000 * 0.15)
+        counter = LocationCounter()
+        counter.apply_file(self.osm_file, locations=True)
+        self.assertEqual(counter.nodes, grid.n_nodes)
+        self.assertEqual(counter.ways, grid.n_ways)
+        self.assertEqual(counter.invalid, 0)
+
+        counts = asyncio.run(OSWHelper.count_all_entities(self.osm_file))
+        self.assertEqual(counts.osw['polygons'], grid.n_buildings)
+
+    def test_run_writes_results(self):
+        output = os.path.join(self.tmp_dir, 'bench.json')
+        run([2_000], output, workdir=os.path.join(self.tmp_dir, 'work'), directions=['osm2osw'])
+        with open(output) as f:
+            report = json.load(f)
+
+        self.assertEqual(len(report['results']), 1)
+        result = report['results'][0]
+        self.assertTrue(result['status'])
+        self.assertEqual(result['direction'], 'osm2osw')
+        self.assertEqual(list(result['stages']), ['parse', 'simplify', 'construct_geometries', 'to_geojson'])
+        self.assertGreater(result['throughput'], 0)
+        self.assertGreater(result['peak_rss'], 0)
+
+        rows = compare(output, output)
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(all(row['wall'] == 1 for row in rows))
+
+    def test_compare_without_baseline_measurement(self):
+        stages = {'parse': {'wall': 1.0, 'cpu': 1.0, 'peak_rss': 100}}
+        baseline = {'size': 2_000, 'direction': 'osm2osw', 'stages': {'parse': {'wall': 0, 'cpu': 0, 'peak_rss': None}}}
+        current = {'size': 2_000, 'direction': 'osm2osw', 'stages': stages}
+        files = []
+        for name, result in [('baseline', baseline), ('current', current)]:
+            files.append(os.path.join(self.tmp_dir, f'{name}.json'))
+            with open(files[-1], 'w') as f:
+                json.dump({'results': [result]}, f)
+
+        rows = compare(*files)
+        self.assertEqual(len(rows), 1)
+        self.assertIsNone(rows[0]['wall'])
+        self.assertIsNone(rows[0]['peak_rss'])
+        self.assertEqual(compare(files[1], files[1])[0]['wall'], 1)
+
+    @patch('src.osm_osw_reformatter.osw2osm.osw2osm.OSW2OSM.convert')
+    def test_osw2osm_stages(self, mock_convert):
+        stages = {stage: {'wall': 1.0, 'cpu': 1.0, 'peak_rss': 100}
+                  for stage in ['unzip', 'merge', 'ogr2osm_process', 'write']}
+        mock_convert.return_value = Response(status=True, generated_files='bench.graph.osm.xml',
+                                             metrics={'stages': stages})
+        timer = StageTimer()
+        _osw2osm('grid.zip', self.tmp_dir, timer)
+        self.assertEqual(timer.stages, stages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,9 @@
 import os
 import shutil
 import asyncio
+import threading
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, PropertyMock
 from src.osm_osw_reformatter import Formatter
 from src.osm_osw_reformatter.helpers.response import Response
 
@@ -103,6 +104,124 @@ class TestFormatter(unittest.TestCase):
         self.assertTrue(result.status)
         self.assertEqual(formatter.generated_files, [mock_response.generated_files])
 
+    def test_osm2osw_cache_hit(self):
+        osm_file = self.osm_file_path
+        cache_dir = os.path.join(TEST_DIR, 'cache')
+
+        async def run_test():
+            formatter = Formatter(file_path=osm_file, workdir=OUTPUT_DIR, cache_dir=cache_dir)
+            put = formatter.cache.put
+
+            def put_off_loop(*args):
+                # The event loop runs in the main thread
+                self.assertIsNot(threading.current_thread(), threading.main_thread())
+                put(*args)
+
+            with patch.object(formatter.cache, 'put', side_effect=put_off_loop):
+                first = await formatter.osm2osw()
+            self.assertNotIn('cache_hit', first.metrics)
+            formatter.cleanup()
+
+            with patch('src.osm_osw_reformatter.OSM2OSW.convert') as mock_convert:
+                formatter = Formatter(file_path=osm_file, workdir=OUTPUT_DIR, cache_dir=cache_dir)
+                second = await formatter.osm2osw()
+                mock_convert.assert_not_called()
+
+            self.assertTrue(second.status)
+            self.assertEqual(second.generated_files, first.generated_files)
+            self.assertTrue(second.metrics['cache_hit'])
+            self.assertEqual(second.metrics['stages'], {})
+            self.assertTrue(all(os.path.exists(file) for file in second.generated_files))
+            formatter.cleanup()
+
+        asyncio.run(run_test())
+
+    def test_osm2osw_cache_keyed_by_entity_types(self):
+        osm_file = self.osm_file_path
+        cache_dir = os.path.join(TEST_DIR, 'cache')
+
+        async def run_test():
+            formatter = Formatter(file_path=osm_file, workdir=OUTPUT_DIR, cache_dir=cache_dir)
+            await formatter.osm2osw()
+            formatter.cleanup()
+
+            formatter = Formatter(file_path=osm_file, workdir=OUTPUT_DIR, cache_dir=cache_dir, entity_types=['edges'])
+            result = await formatter.osm2osw()
+            self.assertTrue(result.status)
+            self.assertEqual(len(result.generated_files), 1)
+            self.assertTrue(result.generated_files[0].endswith('.graph.edges.geojson'))
+            formatter.cleanup()
+
+        asyncio.run(run_test())
+
+    def test_osm2osw_cache_entry_survives_later_runs(self):
+        osm_file = self.osm_file_path
+        cache_dir = os.path.join(TEST_DIR, 'cache')
+
+        def read_outputs(files):
+            outputs = {}
+            for file in files:
+                with open(file) as f:
+                    outputs[os.path.basename(file)] = f.read()
+            return outputs
+
+        async def run_test():
+            formatter = Formatter(file_path=osm_file, workdir=OUTPUT_DIR, cache_dir=cache_dir)
+            first = await formatter.osm2osw()
+            expected = read_outputs(first.generated_files)
+
+            # A cache miss writing to the same paths as the cached entry
+            formatter = Formatter(file_path=osm_file, workdir=OUTPUT_DIR, cache_dir=cache_dir, precision=3)
+            other = await formatter.osm2osw()
+            self.assertNotIn('cache_hit', other.metrics)
+            self.assertEqual(other.generated_files, first.generated_files)
+
+            formatter = Formatter(file_path=osm_file, workdir=OUTPUT_DIR, cache_dir=cache_dir)
+            third = await formatter.osm2osw()
+            self.assertTrue(third.metrics['cache_hit'])
+            self.assertEqual(read_outputs(third.generated_files), expected)
+            formatter.cleanup()
+
+        asyncio.run(run_test())
+
+    @patch("src.osm_osw_reformatter.OSW2OSM.convert")
+    def test_osw2osm_cache_hit(self, mock_convert):
+        cache_dir = os.path.join(TEST_DIR, 'cache')
+        output_file = os.path.join(OUTPUT_DIR, 'final.graph.osm.xml')
+        with open(output_file, 'w') as f:
+            f.write('<osm/>')
+        mock_convert.return_value = Response(status=True, generated_files=output_file)
+
+        formatter = Formatter(file_path=self.osw_file_path, workdir=OUTPUT_DIR, cache_dir=cache_dir)
+        formatter.osw2osm()
+        formatter.cleanup()
+        result = formatter.osw2osm()
+
+        mock_convert.assert_called_once()
+        self.assertTrue(result.status)
+        self.assertEqual(result.generated_files, output_file)
+        self.assertTrue(result.metrics['cache_hit'])
+        self.assertTrue(os.path.exists(output_file))
+        formatter.cleanup()
+
+    @patch("src.osm_osw_reformatter.OSW2OSM.options", new_callable=PropertyMock)
+    @patch("src.osm_osw_reformatter.OSW2OSM.convert")
+    def test_osw2osm_cache_keyed_by_options(self, mock_convert, mock_options):
+        cache_dir = os.path.join(TEST_DIR, 'cache')
+        output_file = os.path.join(OUTPUT_DIR, 'final.graph.osm.xml')
+        with open(output_file, 'w') as f:
+            f.write('<osm/>')
+        mock_convert.return_value = Response(status=True, generated_files=output_file)
+
+        mock_options.return_value = {}
+        formatter = Formatter(file_path=self.osw_file_path, workdir=OUTPUT_DIR, cache_dir=cache_dir)
+        formatter.osw2osm()
+        mock_options.return_value = {'option': 'other'}
+        formatter.osw2osm()
+
+        self.assertEqual(mock_convert.call_count, 2)
+        formatter.cleanup()
+
 
 
 
@@ -0,0 +1,184 @@
+import os
+import json
+import shutil
+import asyncio
+import zipfile
+import tempfile
+import threading
+import unittest
+import tracemalloc
+from benchmarks.synthetic import generate
+from src.osm_osw_reformatter.helpers.hooks import PipelineHook, TracemallocHook
+from src.osm_osw_reformatter.osm2osw.osm2osw import OSM2OSW
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+BUDGET_FILE = os.path.join(ROOT_DIR, 'memory_budget.json')
+# Set to record the measured usage plus headroom as the new budget
+UPDATE_BUDGET = os.environ.get('UPDATE_MEMORY_BUDGET') == '1'
+HEADROOM = 1.5
+
+
+def _rss() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class RssSamplerHook(PipelineHook):
+    '''Samples the RSS of the process every `interval` seconds while a
+    stage runs and keeps the maximum per stage.
+
+    '''
+
+    def __init__(self, interval: float = 0.005) -> None:
+        super().__init__()
+        self.interval = interval
+        self.peaks = {}
+        self._stop = None
+        self._thread = None
+
+    def stage_start(self, metrics, stage):
+        self.peaks[stage] = _rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, args=(stage, self._stop), daemon=True)
+        self._thread.start()
+
+    def stage_end(self, metrics, stage, record):
+        self._stop.set()
+        self._thread.join()
+        self.peaks[stage] = max(self.peaks[stage], _rss())
+
+    def _sample(self, stage, stop):
+        while not stop.wait(self.interval):
+            self.peaks[stage] = max(self.peaks[stage], _rss())
+
+
+@unittest.skipUnless(os.path.exists('/proc/self/statm'), 'RSS sampling needs /proc')
+class TestMemoryBudget(unittest.TestCase):
+    '''Runs the conversions on synthetic grids under tracemalloc and RSS
+    sampling, and checks the peak memory per input element (nodes plus
+    ways) against memory_budget.json.
+
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        # Modules the conversion imports at first use would otherwise count
+        # towards the first test measured
+        import src.osm_osw_reformatter.serializer.osm.osm_graph  # noqa: F401
+        with open(BUDGET_FILE) as f:
+            cls.budget = json.load(f)
+        cls.measured = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if UPDATE_BUDGET and cls.measured:
+            for direction, usage in cls.measured.items():
+                cls.budget[direction] = {key: int(value * HEADROOM) for key, value in usage.items()}
+            with open(BUDGET_FILE, 'w') as f:
+                json.dump(cls.budget, f, indent=2)
+                f.write('\n')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _measure(self, direction: str, convert) -> None:
+        tracemalloc_hook = TracemallocHook(top=5)
+        rss_hook = RssSamplerHook()
+        baseline_rss = _rss()
+        tracemalloc.start()
+        try:
+            result = convert([tracemalloc_hook, rss_hook])
+        finally:
+            tracemalloc.stop()
+        self.assertTrue(result.status, result.error)
+
+        counts_in = result.metrics['counts']['in']
+        if direction == 'osm2osw':
+            # Points and lines are made from some of the nodes and ways read
+            counts_in = {key: counts_in[key] for key in ('edges', 'nodes')}
+        elements = sum(counts_in.values())
+        stages = {}
+        for stage, record in result.metrics['stages'].items():
+            stages[stage] = {
+                'wall': record['wall'],
+                'tracemalloc_peak': tracemalloc_hook.results[stage]['peak'],
+                'rss_growth': max(rss_hook.peaks[stage] - baseline_rss, 0),
+                'top': tracemalloc_hook.results[stage]['top']
+            }
+        usage = {
+            'tracemalloc_peak_per_element': max(s['tracemalloc_peak'] for s in stages.values()) / elements,
+            'rss_growth_per_element': max(s['rss_growth'] for s in stages.values()) / elements
+        }
+        measured = self.measured.setdefault(direction, {})
+        for key, value in usage.items():
+            measured[key] = max(measured.get(key, 0), value)
+
+        budget = self.budget.get(direction)
+        if UPDATE_BUDGET:
+            return
+        if budget is None:
+            self.fail(f'No memory budget recorded for {direction}, run with UPDATE_MEMORY_BUDGET=1')
+
+        exceeded = [key for key, value in usage.items() if value > budget[key]]
+        if exceeded:
+            self.fail(self._report(direction, elements, usage, budget, stages))
+
+    @staticmethod
+    def _report(direction: str, elements: int, usage: dict, budget: dict, stages: dict) -> str:
+        lines = [f'{direction} exceeded its memory budget on {elements} input elements:']
+        for key, value in usage.items():
+            lines.append(f'  {key}: {value:.0f} bytes (budget {budget[key]})')
+        lines.append(f'  {"stage":<22} {"wall s":>8} {"traced peak":>12} {"/element":>9} {"rss growth":>12} {"/element":>9}')
+        for stage, s in stages.items():
+            lines.append(
+                f'  {stage:<22} {s["wall"]:>8.2f} {s["tracemalloc_peak"]:>12} {s["tracemalloc_peak"] / elements:>9.0f}'
+                f' {s["rss_growth"]:>12} {s["rss_growth"] / elements:>9.0f}'
+            )
+        for stage, s in stages.items():
+            lines.append(f'  top allocations in {stage}:')
+            lines.extend(f'    {line}' for line in s['top'])
+        return '\n'.join(lines)
+
+    def _osm2osw(self, nodes: int, hooks):
+        osm_file = os.path.join(self.tmp_dir, f'grid-{nodes}.osm.pbf')
+        generate(osm_file, nodes)
+        osm2osw = OSM2OSW(osm_file=osm_file, workdir=self.tmp_dir, prefix='memory', hooks=hooks)
+        return asyncio.run(osm2osw.convert())
+
+    def test_osm2osw_small(self):
+        self._measure('osm2osw', lambda hooks: self._osm2osw(4_000, hooks))
+
+    def test_osm2osw_large(self):
+        self._measure('osm2osw', lambda hooks: self._osm2osw(10_000, hooks))
+
+    def test_osw2osm(self):
+        try:
+            import ogr2osm  # noqa: F401
+        except ImportError:
+            self.skipTest('osw2osm needs ogr2osm and GDAL')
+        if 'osw2osm' not in self.budget and not UPDATE_BUDGET:
+            # Not recorded yet, it needs a machine with GDAL
+            self.skipTest('No memory budget recorded for osw2osm, run with UPDATE_MEMORY_BUDGET=1 where GDAL is '
+                          'installed and commit memory_budget.json')
+        from src.osm_osw_reformatter.osw2osm.osw2osm import OSW2OSM
+
+        result = self._osm2osw(10_000, [])
+        zip_file = os.path.join(self.tmp_dir, 'grid.zip')
+        with zipfile.ZipFile(zip_file, 'w') as zf:
+            for file in result.generated_files:
+                zf.write(file, os.path.basename(file))
+                os.remove(file)
+
+        workdir = os.path.join(self.tmp_dir, 'osw2osm')
+        os.makedirs(workdir)
+        self._measure(
+            'osw2osm',
+            lambda hooks: OSW2OSM(zip_file_path=zip_file, workdir=workdir, prefix='memory', hooks=hooks).convert()
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,57 @@
 import os
 import re
+import json
 import asyncio
+import shutil
+import tempfile
+import threading
 import unittest
+from unittest.mock import patch
+import osmium
+import networkx as nx
 from src.osm_osw_reformatter.osm2osw.osm2osw import OSM2OSW
+from src.osm_osw_reformatter.serializer.osm.osm_graph import OSMGraph
 
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(ROOT_DIR)), 'output')
 TEST_FILE = os.path.join(ROOT_DIR, 'test_files/wa.microsoft.osm.pbf')
 
 
+class CopyHandler(osmium.SimpleHandler):
+    def __init__(self, writer):
+        osmium.SimpleHandler.__init__(self)
+        self.writer = writer
+
+    def node(self, n):
+        self.writer.add_node(n)
+
+    def way(self, w):
+        self.writer.add_way(w)
+
+    def relation(self, r):
+        self.writer.add_relation(r)
+
+
+def output_features(files) -> dict:
+    '''Features of the generated files by entity type, as sorted JSON, so
+    that outputs in different orders compare equal. Removes the files.
+
+    '''
+    collections = {}
+    for file in files:
+        with open(file) as f:
+            fc = json.load(f)
+        os.remove(file)
+        # Edges are numbered in the order they are written
+        for feature in fc['features']:
+            if re.search(r'graph\.edges\.', file):
+                feature['properties'].pop('_id')
+        collections[re.search(r'graph\.(\w+)\.geojson', file).group(1)] = sorted(
+            json.dumps(feature, sort_keys=True) for feature in fc['features']
+        )
+    return collections
+
+
 class TestOSM2OSW(unittest.IsolatedAsyncioTestCase):
     def test_convert_successful(self):
         osm_file_path = TEST_FILE
@@ -22,6 +65,39 @@ class TestOSM2OSW(unittest.IsolatedAsyncioTestCase):
 
         asyncio.run(run_test())
 
+    def test_convert_metrics(self):
+        osm_file_path = TEST_FILE
+
+        async def run_test():
+            osm2osw = OSM2OSW(osm_file=osm_file_path, workdir=OUTPUT_DIR, prefix='test')
+            result = await osm2osw.convert()
+            metrics = result.metrics
+            self.assertEqual(
+                list(metrics['stages']),
+                ['parse_ways', 'parse_nodes', 'parse_points', 'parse_lines', 'simplify', 'construct_geometries',
+                 'write']
+            )
+            for stage in metrics['stages'].values():
+                self.assertGreaterEqual(stage['wall'], 0)
+                self.assertGreaterEqual(stage['cpu'], 0)
+            self.assertGreater(metrics['peak_rss'], 0)
+            self.assertEqual(metrics['counts']['in'], {'edges': 4630, 'nodes': 17502, 'points': 179, 'lines': 5})
+            self.assertEqual(set(metrics['counts']['out']), {'edges', 'nodes', 'points', 'lines'})
+            self.assertGreater(metrics['counts']['out']['edges'], 0)
+            for file in result.generated_files:
+                os.remove(file)
+
+        asyncio.run(run_test())
+
+    def test_convert_error_has_metrics(self):
+        async def run_test():
+            osm2osw = OSM2OSW(osm_file='test.pbf', workdir=OUTPUT_DIR, prefix='test')
+            result = await osm2osw.convert()
+            self.assertFalse(result.status)
+            self.assertIn('parse_ways', result.metrics['stages'])
+
+        asyncio.run(run_test())
+
     def test_generated_3_files(self):
         osm_file_path = TEST_FILE
 
@@ -60,6 +136,401 @@ class TestOSM2OSW(unittest.IsolatedAsyncioTestCase):
 
         asyncio.run(run_test())
 
+    def test_convert_entity_types(self):
+        async def run_test():
+            osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', entity_types=['edges'])
+            result = await osm2osw.convert()
+            self.assertTrue(result.status)
+            self.assertEqual([os.path.basename(file) for file in result.generated_files],
+                             ['test.wa.microsoft.graph.edges.geojson'])
+            self.assertEqual(list(result.metrics['stages']),
+                             ['parse_ways', 'parse_nodes', 'simplify', 'construct_geometries', 'write'])
+            self.assertEqual(list(result.metrics['counts']['out']), ['edges'])
+            for file in result.generated_files:
+                os.remove(file)
+
+            osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', entity_types=['points'])
+            result = await osm2osw.convert()
+            self.assertEqual([os.path.basename(file) for file in result.generated_files],
+                             ['test.wa.microsoft.graph.points.geojson'])
+            self.assertEqual(list(result.metrics['stages']),
+                             ['parse_points', 'simplify', 'construct_geometries', 'write'])
+            self.assertEqual(result.metrics['counts']['in'], {'points': 179})
+            for file in result.generated_files:
+                os.remove(file)
+
+        asyncio.run(run_test())
+
+    def test_convert_ignores_files_of_earlier_runs(self):
+        async def run_test():
+            result = await OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test').convert()
+            earlier = result.generated_files
+            self.assertEqual(len(earlier), 4)
+            osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', entity_types=['edges'])
+            result = await osm2osw.convert()
+            self.assertEqual([os.path.basename(file) for file in result.generated_files],
+                             ['test.wa.microsoft.graph.edges.geojson'])
+            for file in earlier:
+                self.assertTrue(os.path.exists(file))
+                os.remove(file)
+
+        asyncio.run(run_test())
+
+    def test_convert_bytes_areas(self):
+        async def run_test():
+            with open(TEST_FILE, 'rb') as f:
+                data = f.read()
+            lines = await OSM2OSW.convert_bytes(data, entity_types=['lines'])
+            result = await OSM2OSW.convert_bytes(data, entity_types=['lines', 'zones', 'polygons'])
+            self.assertTrue(result.status)
+            self.assertEqual(list(result.metrics['stages'])[0], 'parse_areas')
+            self.assertEqual(result.output['lines'], lines.output['lines'])
+            self.assertGreater(len(result.output['polygons']['features']), 0)
+            self.assertGreater(len(result.output['zones']['features']), 0)
+            for feature in result.output['polygons']['features']:
+                self.assertEqual(feature['geometry']['type'], 'Polygon')
+                self.assertIn('building', feature['properties'])
+            for feature in result.output['zones']['features']:
+                self.assertEqual(feature['geometry']['type'], 'Polygon')
+                self.assertTrue(feature['properties']['_w_id'])
+
+        asyncio.run(run_test())
+
+    def test_convert_areas_with_node_cache(self):
+        node_cache_dir = tempfile.mkdtemp()
+
+        async def run_test():
+            osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', node_cache=True,
+                              node_cache_dir=node_cache_dir, entity_types=['edges', 'polygons'])
+            result = await osm2osw.convert()
+            self.assertTrue(result.status)
+            self.assertEqual([os.path.basename(file) for file in result.generated_files],
+                             ['test.wa.microsoft.graph.edges.geojson', 'test.wa.microsoft.graph.polygons.geojson'])
+            for file in result.generated_files:
+                os.remove(file)
+
+        asyncio.run(run_test())
+        shutil.rmtree(node_cache_dir)
+
+    def test_convert_unknown_entity_type(self):
+        with self.assertRaises(ValueError):
+            OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', entity_types=['sidewalks'])
+
+    def test_entity_types_change_checkpoint_key(self):
+        osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', checkpoint_dir=OUTPUT_DIR)
+        self.assertEqual(osm2osw.options, {})
+        osm2osw._latest_checkpoint()
+        edges_only = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', checkpoint_dir=OUTPUT_DIR,
+                             entity_types=['edges'])
+        self.assertEqual(edges_only.options, {'entity_types': ['edges']})
+        edges_only._latest_checkpoint()
+        self.assertNotEqual(edges_only._checkpoint_key, osm2osw._checkpoint_key)
+
+    def test_convert_bytes_entity_types(self):
+        async def run_test():
+            with open(TEST_FILE, 'rb') as f:
+                data = f.read()
+            full = await OSM2OSW.convert_bytes(data)
+            result = await OSM2OSW.convert_bytes(data, entity_types=['nodes', 'lines'])
+            self.assertEqual(list(result.output), ['nodes', 'lines'])
+            self.assertEqual(result.output['nodes'], full.output['nodes'])
+            self.assertEqual(result.output['lines'], full.output['lines'])
+
+        asyncio.run(run_test())
+
+    def test_convert_writes_checkpoints(self):
+        checkpoint_dir = tempfile.mkdtemp()
+
+        async def run_test():
+            osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', checkpoint_dir=checkpoint_dir)
+            result = await osm2osw.convert()
+            self.assertTrue(result.status)
+            self.assertTrue(osm2osw.checkpoint_path('parse').exists())
+            self.assertTrue(osm2osw.checkpoint_path('simplify').exists())
+            for file in result.generated_files:
+                os.remove(file)
+
+        asyncio.run(run_test())
+        shutil.rmtree(checkpoint_dir)
+
+    def test_convert_resumes_from_checkpoint(self):
+        checkpoint_dir = tempfile.mkdtemp()
+
+        async def run_test():
+            osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', checkpoint_dir=checkpoint_dir)
+            result = await osm2osw.convert()
+            expected = {}
+            for file in result.generated_files:
+                with open(file) as f:
+                    expected[file] = f.read()
+                os.remove(file)
+
+            with patch('src.osm_osw_reformatter.helpers.osw.OSWHelper.get_osm_graph') as mock_get_osm_graph, \
+                    patch('src.osm_osw_reformatter.helpers.osw.OSWHelper.simplify_og') as mock_simplify_og:
+                osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test',
+                                  checkpoint_dir=checkpoint_dir)
+                result = await osm2osw.convert()
+                mock_get_osm_graph.assert_not_called()
+                mock_simplify_og.assert_not_called()
+
+            self.assertTrue(result.status)
+            for file in result.generated_files:
+                with open(file) as f:
+                    self.assertEqual(f.read(), expected[file])
+                os.remove(file)
+
+        asyncio.run(run_test())
+        shutil.rmtree(checkpoint_dir)
+
+    def test_convert_with_node_cache(self):
+        node_cache_dir = tempfile.mkdtemp()
+
+        async def run_test():
+            osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', node_cache=True,
+                              node_cache_dir=node_cache_dir)
+            result = await osm2osw.convert()
+            self.assertTrue(result.status)
+            self.assertEqual(len(os.listdir(node_cache_dir)), 1)
+            for file in result.generated_files:
+                os.remove(file)
+
+        asyncio.run(run_test())
+        shutil.rmtree(node_cache_dir)
+
+    def test_convert_ignores_checkpoint_of_other_input(self):
+        checkpoint_dir = tempfile.mkdtemp()
+        osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', checkpoint_dir=checkpoint_dir)
+        OSMGraph(nx.MultiDiGraph()).to_checkpoint(osm2osw.checkpoint_path('simplify'), 'simplify', key='other')
+
+        self.assertEqual(osm2osw._latest_checkpoint(), (None, None))
+        shutil.rmtree(checkpoint_dir)
+
+    def test_convert_bytes_matches_files(self):
+        async def run_test():
+            osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test')
+            result = await osm2osw.convert()
+            expected = {}
+            for file in result.generated_files:
+                with open(file) as f:
+                    expected[re.search(r'graph\.(\w+)\.geojson', file).group(1)] = json.load(f)
+                os.remove(file)
+
+            with open(TEST_FILE, 'rb') as f:
+                result = await OSM2OSW.convert_bytes(f.read())
+            self.assertTrue(result.status)
+            self.assertIsNone(result.generated_files)
+            self.assertEqual(json.loads(json.dumps(result.output)), expected)
+            self.assertEqual(result.metrics['counts']['in'], {'edges': 4630, 'nodes': 17502, 'points': 179, 'lines': 5})
+
+        asyncio.run(run_test())
+
+    def test_convert_bytes_file_like_and_xml(self):
+        xml_file = os.path.join(tempfile.mkdtemp(), 'test.osm')
+        writer = osmium.SimpleWriter(xml_file)
+        CopyHandler(writer).apply_file(TEST_FILE)
+        writer.close()
+
+        async def run_test():
+            with open(TEST_FILE, 'rb') as f:
+                pbf_result = await OSM2OSW.convert_bytes(f)
+            with open(xml_file, 'rb') as f:
+                xml_result = await OSM2OSW.convert_bytes(f.read())
+            self.assertTrue(xml_result.status)
+            self.assertEqual(xml_result.output, pbf_result.output)
+
+        asyncio.run(run_test())
+        shutil.rmtree(os.path.dirname(xml_file))
+
+    def test_convert_bytes_concurrent_threads(self):
+        with open(TEST_FILE, 'rb') as f:
+            data = f.read()
+        results = [None] * 4
+
+        def run(i):
+            results[i] = asyncio.run(OSM2OSW.convert_bytes(data))
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(results))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(all(result.status for result in results))
+        for result in results[1:]:
+            self.assertEqual(result.output, results[0].output)
+
+    def test_convert_tiled_matches_whole_file(self):
+        async def run_test():
+            result = await OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test').convert()
+            expected = output_features(result.generated_files)
+            osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', tiles=6, processes=2)
+            result = await osm2osw.convert()
+            self.assertTrue(result.status, result.error)
+            self.assertIn('stitch', result.metrics['stages'])
+            self.assertNotIn('simplify', result.metrics['stages'])
+            self.assertEqual(result.metrics['counts']['in'], {'edges': 4630, 'nodes': 17502, 'points': 179, 'lines': 5})
+            self.assertEqual(output_features(result.generated_files), expected)
+            # Tile files are removed
+            self.assertFalse([name for name in os.listdir(OUTPUT_DIR) if name.startswith('tiles-')])
+
+        asyncio.run(run_test())
+
+    def test_convert_tiled_clip_matches_whole_file(self):
+        # A fence and a footway crossing from one tile into the next, cut
+        # by the boundary in the second tile
+        osm_dir = tempfile.mkdtemp()
+        osm_file = os.path.join(osm_dir, 'crossing.osm')
+        with open(osm_file, 'w') as f:
+            f.write(
+                "<?xml version='1.0' encoding='UTF-8'?>\n<osm version='0.6'>\n"
+                "<node id='1' version='1' lat='0.005' lon='0.005'/>\n"
+                "<node id='2' version='1' lat='0.005' lon='0.015'/>\n"
+                "<node id='3' version='1' lat='0.006' lon='0.005'/>\n"
+                "<node id='4' version='1' lat='0.006' lon='0.015'/>\n"
+                "<way id='10' version='1'><nd ref='1'/><nd ref='2'/><tag k='barrier' v='fence'/></way>\n"
+                "<way id='11' version='1'><nd ref='3'/><nd ref='4'/><tag k='highway' v='footway'/></way>\n"
+                "</osm>\n"
+            )
+
+        async def run_test():
+            options = {'boundary': (0.012, 0, 0.02, 0.01), 'clip': True}
+            result = await OSM2OSW(osm_file=osm_file, workdir=OUTPUT_DIR, prefix='test', **options).convert()
+            expected = output_features(result.generated_files)
+            self.assertEqual(len(expected['lines']), 1)
+            result = await OSM2OSW(osm_file=osm_file, workdir=OUTPUT_DIR, prefix='test', tiles=2, processes=1,
+                                   **options).convert()
+            self.assertTrue(result.status, result.error)
+            self.assertEqual(output_features(result.generated_files), expected)
+
+        asyncio.run(run_test())
+        shutil.rmtree(osm_dir)
+
+    def test_convert_tiled_rejects_areas(self):
+        with self.assertRaises(ValueError):
+            OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', tiles=4, entity_types=['edges', 'zones'])
+        with self.assertRaises(ValueError):
+            OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', tiles=4, checkpoint_dir=OUTPUT_DIR)
+        with self.assertRaises(ValueError):
+            OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', tiles=0)
+
+    def test_convert_bytes_boundary(self):
+        with open(TEST_FILE, 'rb') as f:
+            data = f.read()
+        bbox = (-122.1483, 47.6318, -122.134, 47.6589)
+
+        def inside(coordinates):
+            return all(bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3] for lon, lat in coordinates)
+
+        async def run_test():
+            everything = await OSM2OSW.convert_bytes(data)
+            kept = await OSM2OSW.convert_bytes(data, boundary=bbox)
+            clipped = await OSM2OSW.convert_bytes(data, boundary=bbox, clip=True)
+            self.assertTrue(kept.status, kept.error)
+            self.assertTrue(clipped.status, clipped.error)
+
+            for entity_type in ('edges', 'nodes', 'points'):
+                self.assertLess(len(kept.output[entity_type]['features']),
+                                len(everything.output[entity_type]['features']))
+            # Edges crossing the boundary are kept whole, or cut at it
+            self.assertFalse(all(inside(feature['geometry']['coordinates'])
+                                 for feature in kept.output['edges']['features']))
+            self.assertTrue(all(inside(feature['geometry']['coordinates'])
+                                for feature in clipped.output['edges']['features']))
+            self.assertTrue(all(inside([feature['geometry']['coordinates']])
+                                for feature in clipped.output['points']['features']))
+
+        asyncio.run(run_test())
+
+    def test_convert_bytes_precision_defaults_to_files(self):
+        with open(TEST_FILE, 'rb') as f:
+            data = f.read()
+
+        async def run_test():
+            with patch.object(OSMGraph, 'to_feature_collections', autospec=True,
+                              side_effect=OSMGraph.to_feature_collections) as to_feature_collections:
+                await OSM2OSW.convert_bytes(data, entity_types=['points'])
+                await OSM2OSW.convert_bytes(data, entity_types=['points'], precision=None)
+            precisions = [call.args[2] for call in to_feature_collections.call_args_list]
+            self.assertEqual(precisions, [OSM2OSW(osm_file=TEST_FILE, prefix='test').precision, None])
+
+        asyncio.run(run_test())
+
+    def test_boundary_changes_options(self):
+        bbox = (-122.1483, 47.6318, -122.134, 47.6589)
+        plain = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test')
+        kept = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', boundary=bbox)
+        clipped = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', boundary=bbox, clip=True)
+        self.assertEqual(len({json.dumps(o.options, sort_keys=True) for o in (plain, kept, clipped)}), 3)
+        with self.assertRaises(ValueError):
+            OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', boundary=(1, 1, 0, 0))
+
+    def test_precision_changes_options_not_checkpoint_key(self):
+        plain = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', checkpoint_dir=OUTPUT_DIR)
+        rounded = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', checkpoint_dir=OUTPUT_DIR,
+                          precision=5)
+        self.assertEqual(plain.options, {})
+        self.assertEqual(rounded.options, {'precision': 5})
+        plain._latest_checkpoint()
+        rounded._latest_checkpoint()
+        self.assertEqual(rounded._checkpoint_key, plain._checkpoint_key)
+
+    def test_spatial_order_changes_options(self):
+        ordered = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', spatial_order='hilbert')
+        self.assertEqual(ordered.options, {'spatial_order': 'hilbert'})
+        self.assertEqual(ordered.graph_options, {})
+        with self.assertRaises(ValueError):
+            OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', spatial_order='random')
+
+    def test_convert_bytes_spatial_order(self):
+        async def run_test():
+            with open(TEST_FILE, 'rb') as f:
+                data = f.read()
+            unordered = await OSM2OSW.convert_bytes(data)
+            for order in ('hilbert', 'z'):
+                result = await OSM2OSW.convert_bytes(data, spatial_order=order)
+                self.assertTrue(result.status)
+                self.assertEqual(list(result.output), list(unordered.output))
+                for name, fc in result.output.items():
+                    key = lambda feature: json.dumps(feature['geometry'])
+                    features = fc['features']
+                    self.assertEqual(sorted(map(key, features)), sorted(map(key, unordered.output[name]['features'])))
+                    if name == 'edges':
+                        self.assertEqual([f['properties']['_id'] for f in features],
+                                         [str(i) for i in range(1, len(features) + 1)])
+                # Neighboring nodes in the file are close by
+                nodes = result.output['nodes']['features']
+                steps = [abs(a['geometry']['coordinates'][0] - b['geometry']['coordinates'][0])
+                         for a, b in zip(nodes, nodes[1:])]
+                unordered_nodes = unordered.output['nodes']['features']
+                unordered_steps = [abs(a['geometry']['coordinates'][0] - b['geometry']['coordinates'][0])
+                                   for a, b in zip(unordered_nodes, unordered_nodes[1:])]
+                self.assertLess(sum(steps), sum(unordered_steps) / 2)
+
+        asyncio.run(run_test())
+
+    def test_convert_precision(self):
+        async def run_test():
+            osm2osw = OSM2OSW(osm_file=TEST_FILE, workdir=OUTPUT_DIR, prefix='test', precision=5)
+            result = await osm2osw.convert()
+            self.assertTrue(result.status)
+            with open(TEST_FILE, 'rb') as f:
+                full = await OSM2OSW.convert_bytes(f.read())
+            for file in result.generated_files:
+                with open(file) as f:
+                    features = json.load(f)['features']
+                os.remove(file)
+                entity_type = re.search(r'graph\.(\w+)\.geojson', file).group(1)
+                self.assertEqual(len(features), len(full.output[entity_type]['features']))
+                coordinates = json.dumps([feature['geometry']['coordinates'] for feature in features])
+                self.assertIsNone(re.search(r'\.\d{6}', coordinates))
+
+        asyncio.run(run_test())
+
+    async def test_convert_bytes_error(self):
+        result = await OSM2OSW.convert_bytes(b'not osm data', file_format='pbf')
+        self.assertFalse(result.status)
+        self.assertIsNone(result.output)
+
     async def test_convert_error(self):
         async def mock_count_entities_error(osm_file_path, counter_cls):
             raise Exception("Error in counting entities")
@@ -1,4 +1,5 @@
 import os
+import threading
 import unittest
 from src.osm_osw_reformatter.osw2osm.osw2osm import OSW2OSM
 
@@ -41,6 +42,56 @@ class TestOSW2OSM(unittest.IsolatedAsyncioTestCase):
         result = osw2osm.convert()
         self.assertFalse(result.status)
 
+    def test_convert_metrics(self):
+        osw2osm = OSW2OSM(zip_file_path=TEST_ZIP_FILE, workdir=OUTPUT_DIR, prefix='test')
+        result = osw2osm.convert()
+        metrics = result.metrics
+        self.assertEqual(list(metrics['stages']), ['unzip', 'merge', 'ogr2osm_process', 'write'])
+        self.assertGreater(sum(metrics['counts']['in'].values()), 0)
+        self.assertGreater(metrics['counts']['out']['nodes'], 0)
+        os.remove(result.generated_files)
+
+    def test_convert_error_has_metrics(self):
+        osw2osm = OSW2OSM(zip_file_path='test.zip', workdir=OUTPUT_DIR, prefix='test')
+        result = osw2osm.convert()
+        self.assertIn('unzip', result.metrics['stages'])
+
+    def test_convert_bytes_matches_file(self):
+        osw2osm = OSW2OSM(zip_file_path=TEST_ZIP_FILE, workdir=OUTPUT_DIR, prefix='test')
+        result = osw2osm.convert()
+        with open(result.generated_files, 'rb') as f:
+            expected = f.read()
+        os.remove(result.generated_files)
+
+        with open(TEST_ZIP_FILE, 'rb') as f:
+            result = OSW2OSM.convert_bytes(f.read())
+        self.assertTrue(result.status)
+        self.assertIsNone(result.generated_files)
+        self.assertEqual(result.output, expected)
+        self.assertEqual(list(result.metrics['stages']), ['unzip', 'merge', 'ogr2osm_process', 'write'])
+
+    def test_convert_bytes_concurrent_threads(self):
+        results = [None] * 4
+
+        def run(i):
+            with open(TEST_ZIP_FILE, 'rb') as f:
+                results[i] = OSW2OSM.convert_bytes(f)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(results))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(all(result.status for result in results))
+        for result in results[1:]:
+            self.assertEqual(result.output, results[0].output)
+
+    def test_convert_bytes_error(self):
+        result = OSW2OSM.convert_bytes(b'not a zip')
+        self.assertFalse(result.status)
+        self.assertIsNone(result.output)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,79 @@
+import os
+import json
+import pickle
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from shapely.geometry import Point, Polygon
+from src.osm_osw_reformatter.serializer.osm.osm_boundary import Boundary
+
+# Concave, so the grid has cells inside, outside and crossed by the outline
+L_SHAPE = {'type': 'Polygon', 'coordinates': [[[0, 0], [4, 0], [4, 1], [1, 1], [1, 4], [0, 4], [0, 0]]]}
+
+
+class TestBoundary(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_from_bbox(self):
+        boundary = Boundary.from_input((0, 0, 2, 1))
+        self.assertTrue(boundary.is_box)
+        self.assertTrue(boundary.contains(1, 0.5))
+        # The outline counts as inside
+        self.assertTrue(boundary.contains(2, 1))
+        self.assertFalse(boundary.contains(2.1, 0.5))
+
+    def test_from_geojson(self):
+        feature = {'type': 'Feature', 'properties': {}, 'geometry': L_SHAPE}
+        path = os.path.join(self.tmp_dir, 'boundary.geojson')
+        with open(path, 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': [feature]}, f)
+
+        for boundary in (L_SHAPE, feature, path):
+            boundary = Boundary.from_input(boundary)
+            self.assertFalse(boundary.is_box)
+            self.assertTrue(boundary.contains(0.5, 3))
+            self.assertFalse(boundary.contains(3, 3))
+
+    def test_invalid_boundaries(self):
+        for boundary in ((0, 0, 0, 1), 42, (1, 2), {'type': 'Point', 'coordinates': [0, 0]}):
+            with self.assertRaises(ValueError):
+                Boundary.from_input(boundary)
+
+    def test_grid_matches_geometry(self):
+        boundary = Boundary.from_input(L_SHAPE)
+        polygon = Polygon(L_SHAPE['coordinates'][0])
+        rng = np.random.default_rng(0)
+        for lon, lat in rng.uniform(-0.5, 4.5, size=(2000, 2)):
+            self.assertEqual(boundary.contains(lon, lat), polygon.intersects(Point(lon, lat)), (lon, lat))
+
+    def test_clip_line(self):
+        line = np.array([[0.5, 2.0], [0.5, 0.5], [3.0, 0.5], [3.0, 3.0]])
+        self.assertEqual(len(Boundary.from_input(L_SHAPE).clip_line(line)), 1)
+        self.assertIs(Boundary.from_input(L_SHAPE).clip_line(line)[0], line)
+
+        parts = Boundary.from_input(L_SHAPE, clip=True).clip_line(line)
+        self.assertEqual(len(parts), 1)
+        np.testing.assert_allclose(parts[0], [[0.5, 2.0], [0.5, 0.5], [3.0, 0.5], [3.0, 1.0]])
+        self.assertEqual(Boundary.from_input(L_SHAPE, clip=True).clip_line(np.array([[2, 2], [3, 3]])), [])
+
+    def test_clip_polygon(self):
+        square = np.array([[0.5, 0.5], [2.0, 0.5], [2.0, 2.0], [0.5, 2.0], [0.5, 0.5]])
+        (exterior, interiors), = Boundary.from_input(L_SHAPE, clip=True).clip_polygon(square, [])
+        self.assertAlmostEqual(Polygon(exterior).area, 2.25 - 1.0)
+        self.assertEqual(interiors, [])
+        self.assertIs(Boundary.from_input(L_SHAPE).clip_polygon(square, [])[0][0], square)
+
+    def test_pickle(self):
+        boundary = pickle.loads(pickle.dumps(Boundary.from_input(L_SHAPE, clip=True)))
+        self.assertTrue(boundary.clip)
+        self.assertTrue(boundary.contains(0.5, 3))
+        self.assertEqual(boundary.to_option(), Boundary.from_input(L_SHAPE, clip=True).to_option())
+
+
+if __name__ == '__main__':
+    unittest.main()
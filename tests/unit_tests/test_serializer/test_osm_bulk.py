@@ -0,0 +1,55 @@
+import unittest
+import networkx as nx
+from src.osm_osw_reformatter.serializer.osm.osm_bulk import add_edges_in_bulk, remove_edges_in_bulk, merge_chains
+
+
+class TestBulkEdges(unittest.TestCase):
+    def test_add_edges_in_bulk(self):
+        edges = [(5, 6), (6, 5), (5, 6), (7, 7), (2, 5), (5, 6)]
+        expected = nx.MultiDiGraph()
+        expected.add_edges_from((u, v, {'i': i}) for i, (u, v) in enumerate(edges))
+
+        G = nx.MultiDiGraph()
+        add_edges_in_bulk(G, [u for u, _ in edges], [v for _, v in edges], [{'i': i} for i in range(len(edges))])
+        self.assertEqual(list(G.nodes), list(expected.nodes))
+        self.assertEqual(list(G.edges(keys=True, data=True)), list(expected.edges(keys=True, data=True)))
+        self.assertEqual(list(G.in_edges(5, keys=True)), list(expected.in_edges(5, keys=True)))
+
+    def test_remove_edges_in_bulk(self):
+        edges = [(1, 2, 'a'), (1, 2, 'b'), (2, 3, 'c'), (3, 3, 'd')]
+        removed = [(1, 2), (3, 3), (2, 1), (9, 9)]
+        expected = nx.MultiDiGraph()
+        expected.add_edges_from((u, v, {'name': name}) for u, v, name in edges)
+        expected.remove_edges_from(removed)
+
+        G = nx.MultiDiGraph()
+        G.add_edges_from((u, v, {'name': name}) for u, v, name in edges)
+        remove_edges_in_bulk(G, removed)
+        self.assertEqual(list(G.edges(keys=True, data=True)), list(expected.edges(keys=True, data=True)))
+        self.assertEqual(list(G.in_edges(3)), list(expected.in_edges(3)))
+
+        # New keys skip the keys in use, as with add_edges_from
+        for graph in (G, expected):
+            graph.add_edge(1, 2)
+            graph.remove_edge(1, 2, key=0)
+        expected.add_edges_from([(1, 2, {}), (1, 2, {})])
+        add_edges_in_bulk(G, [1, 1], [2, 2], [{}, {}])
+        self.assertEqual(list(G[1][2]), list(expected[1][2]))
+
+    def test_merge_chains(self):
+        # Way 1 has removable nodes 2, 3 and 5. Way 2 is the closed way
+        # 10 -> 11 -> 12 -> 13 -> 10 where only 12 is kept, so the chain
+        # from 12 goes on through the first segment.
+        ways = [
+            [(4, 5, 6, 3), (1, 2, 3, 0), (2, 3, 4, 1)],
+            [(13, 10, 11, 3), (10, 11, 12, 0), (12, 13, 10, 2)],
+        ]
+        self.assertEqual(merge_chains(ways), [
+            (1, 2, [2, 3], [3, 4]),
+            (4, 5, [5], [6]),
+            (12, 13, [13, 10, 11], [10, 11, 12]),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import networkx as nx
+from src.osm_osw_reformatter.serializer.osm.osm_graph import OSMGraph
+from src.osm_osw_reformatter.serializer.osm.osm_features import feature_stores
+from src.osm_osw_reformatter.serializer.osm.osm_coordinates import NodeCoordinates
+from src.osm_osw_reformatter.serializer.osm.osm_checkpoint import CHECKPOINT_FORMAT, write_checkpoint, \
+    read_checkpoint, read_checkpoint_meta
+from src.osm_osw_reformatter.helpers.osw import OSWHelper
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_FILE = os.path.join(ROOT_DIR, 'test_files/wa.microsoft.osm.pbf')
+
+
+def plain_nodes(G) -> dict:
+    '''Node attributes with coordinate arrays as lists, for comparisons.'''
+    return {
+        n: {key: value.tolist() if isinstance(value, np.ndarray) else
+            [ring.tolist() for ring in value] if key == 'indref' else value for key, value in d.items()}
+        for n, d in G.nodes(data=True)
+    }
+
+
+def plain_features(features) -> dict:
+    '''Feature store columns with coordinate arrays as lists.'''
+    def plain(value):
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        if isinstance(value, list):
+            return [plain(item) for item in value]
+        return value
+
+    return {
+        name: {'ids': store.ids, 'tags': store.tags, 'x': list(store.x), 'y': list(store.y),
+               'ndref': plain(store.ndref), 'indref': plain(store.indref)}
+        for name, store in features.items()
+    }
+
+
+class TestOSMCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'graph.ckpt.npz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        G = nx.MultiDiGraph()
+        G.add_node(1, lon=1.5, lat=2.5)
+        G.add_node(2, lon=3.5, lat=4.5, barrier='kerb', kerb='lowered', _kind=1)
+        G.add_node('custom', value=1)
+        G.add_edge(1, 2, osm_id=10, highway='footway', segment=0, ndref=[1, 2])
+        G.add_edge(1, 2, osm_id=11, highway='footway', segment=3, ndref=[1, 5, 2])
+        G.add_edge(2, 1, custom='value')
+
+        write_checkpoint(G, self.path, {'stage': 'parse'}, None,
+                         NodeCoordinates.from_arrays([5, -3], [-1221234567, 10], [476543210, 20]))
+        result, features, coordinates = read_checkpoint(self.path)
+
+        self.assertEqual(list(result.nodes(data=True)), list(G.nodes(data=True)))
+        self.assertEqual(plain_features(features), plain_features(feature_stores()))
+        self.assertEqual(coordinates.degrees([5, -3]).tolist(), [[-122.1234567, 47.654321], [1e-06, 2e-06]])
+        self.assertEqual(
+            sorted(result.edges(keys=True, data=True), key=str),
+            sorted(G.edges(keys=True, data=True), key=str)
+        )
+        self.assertEqual(read_checkpoint_meta(self.path)['stage'], 'parse')
+
+    def test_feature_stores(self):
+        square = np.array([[0, 0], [10, 0], [10, 10], [0, 0]], dtype=np.int32)
+        hole = np.array([[2, 2], [4, 2], [4, 4], [2, 2]], dtype=np.int32)
+        features = feature_stores()
+        features['points'].add('3', {'power': 'pole'}, x=50, y=60)
+        features['lines'].add('1', {'barrier': 'fence'}, ndref=np.array([[10, 20], [30, 40]], dtype=np.int32))
+        features['lines'].add('11', {}, ndref=np.array([[30, 40], [50, 60], [70, 80]], dtype=np.int32))
+        features['zones'].add('4', {'highway': 'pedestrian'}, ndref=['1', '2', '1'], indref=[hole])
+        features['polygons'].add('2', {'building': 'yes'}, ndref=square, indref=[hole, hole])
+        features['polygons'].add('21', {'building': 'yes'}, ndref=square, indref=[])
+
+        write_checkpoint(nx.MultiDiGraph(), self.path, {'stage': 'parse'}, features)
+        G, result, coordinates = read_checkpoint(self.path)
+
+        self.assertEqual(plain_features(result), plain_features(features))
+        self.assertEqual(result['lines'].ndref[0].dtype, np.int32)
+        self.assertIsInstance(result['polygons'].indref[0][0], np.ndarray)
+
+    def test_other_formats_are_ignored(self):
+        write_checkpoint(nx.MultiDiGraph(), self.path, {'stage': 'parse', 'format': 1})
+        self.assertEqual(read_checkpoint_meta(self.path)['stage'], 'parse')
+
+        with np.load(self.path) as data:
+            arrays = dict(data)
+        arrays['meta'] = np.frombuffer(b'{"stage": "parse", "format": 1}', dtype=np.uint8)
+        np.savez(self.path, **arrays)
+        self.assertEqual(read_checkpoint_meta(self.path), {})
+
+    def test_other_versions_are_ignored(self):
+        write_checkpoint(nx.MultiDiGraph(), self.path, {'stage': 'parse', 'version': '0.0.0'})
+        self.assertEqual(read_checkpoint_meta(self.path)['stage'], 'parse')
+
+        with np.load(self.path) as data:
+            arrays = dict(data)
+        arrays['meta'] = np.frombuffer(b'{"stage": "parse", "format": %d, "version": "0.0.0"}' % CHECKPOINT_FORMAT,
+                                       dtype=np.uint8)
+        np.savez(self.path, **arrays)
+        self.assertEqual(read_checkpoint_meta(self.path), {})
+        with self.assertRaises(ValueError):
+            read_checkpoint(self.path)
+
+    def test_no_temporary_files_left(self):
+        write_checkpoint(nx.MultiDiGraph(), self.path, {})
+        self.assertEqual(os.listdir(self.tmp_dir), ['graph.ckpt.npz'])
+
+    def test_osm_graph_round_trip(self):
+        OG = OSMGraph.from_osm_file(
+            TEST_FILE,
+            OSWHelper.osw_way_filter,
+            OSWHelper.osw_node_filter,
+            OSWHelper.osw_point_filter,
+            OSWHelper.osw_line_filter
+        )
+        OG.to_checkpoint(self.path, 'parse', key='abc')
+        loaded = OSMGraph.from_checkpoint(self.path)
+
+        self.assertEqual(OSMGraph.checkpoint_meta(self.path)['key'], 'abc')
+        self.assertEqual(plain_nodes(loaded.G), plain_nodes(OG.G))
+        self.assertEqual(plain_features(loaded.features), plain_features(OG.features))
+        for expected, actual in zip(OG.coordinates.arrays(), loaded.coordinates.arrays()):
+            np.testing.assert_array_equal(actual, expected)
+        self.assertEqual(len(loaded.coordinates), OG.G.number_of_nodes())
+        self.assertGreater(len(loaded.features['points']), 0)
+        self.assertEqual(
+            sorted(loaded.G.edges(keys=True, data=True), key=str),
+            sorted(OG.G.edges(keys=True, data=True), key=str)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import pickle
+import unittest
+import numpy as np
+from src.osm_osw_reformatter.serializer.osm.osm_coordinates import NodeCoordinates, to_degrees, to_fixed
+
+
+class TestFixedPoint(unittest.TestCase):
+    def test_round_trip(self):
+        fixed = np.array([[-1221234567, 476543210], [1800000000, -900000000]], dtype=np.int32)
+        self.assertEqual(to_degrees(fixed).tolist(), [[-122.1234567, 47.654321], [180.0, -90.0]])
+        np.testing.assert_array_equal(to_fixed(to_degrees(fixed)), fixed)
+        self.assertEqual(to_fixed([0.12345674, 0.12345676]).tolist(), [1234567, 1234568])
+
+
+class TestNodeCoordinates(unittest.TestCase):
+    def test_lookup(self):
+        coordinates = NodeCoordinates()
+        coordinates.add(30, 300, -300)
+        coordinates.add(-10, 100, -100)
+        coordinates.add(20, 200, -200)
+        # Repeated nodes are stored once
+        coordinates.add(20, 200, -200)
+
+        self.assertEqual(len(coordinates), 3)
+        self.assertEqual(coordinates.arrays()[0].tolist(), [-10, 20, 30])
+        coords = coordinates.degrees([20, 99, -10])
+        self.assertEqual(coords[0].tolist(), [2e-05, -2e-05])
+        self.assertTrue(np.isnan(coords[1]).all())
+        self.assertEqual(coords[2].tolist(), [1e-05, -1e-05])
+
+    def test_unknown_ids(self):
+        coordinates = NodeCoordinates.from_arrays([1], [10], [20])
+        self.assertTrue(np.isnan(coordinates.degrees(['a', 'b'])).all())
+        self.assertTrue(np.isnan(NodeCoordinates().degrees([1])).all())
+        self.assertEqual(coordinates.degrees([]).shape, (0, 2))
+
+    def test_subset_and_extend(self):
+        coordinates = NodeCoordinates.from_arrays([1, 2, 3], [10, 20, 30], [-10, -20, -30])
+        subset = coordinates.subset([3, 1, 7])
+        self.assertEqual([array.tolist() for array in subset.arrays()], [[1, 3], [10, 30], [-10, -30]])
+
+        subset.extend(NodeCoordinates.from_arrays([2], [20], [-20]))
+        subset = pickle.loads(pickle.dumps(subset))
+        self.assertEqual(subset.arrays()[0].tolist(), [1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import numpy as np
+from src.osm_osw_reformatter.serializer.osm.osm_features import FeatureStore, feature_stores, FEATURE_ENTITY_TYPES
+
+
+class TestFeatureStore(unittest.TestCase):
+    def test_points(self):
+        store = FeatureStore('points')
+        store.add('1', {'power': 'pole'}, x=10000000, y=20000000)
+        store.add('2', {'emergency': 'fire_hydrant'}, x=-1221234567, y=476543210)
+
+        self.assertEqual(len(store), 2)
+        self.assertEqual(list(store.x), [10000000, -1221234567])
+        self.assertEqual(store.location(1), (-122.1234567, 47.654321))
+        self.assertEqual(store.ndref, [])
+
+    def test_location_of_line(self):
+        store = FeatureStore('lines')
+        store.add('1', {'barrier': 'fence'}, ndref=np.array([[10000000, 20000000], [30000000, 40000000]]))
+        self.assertEqual(store.location(0), (1.0, 2.0))
+
+    def test_select_and_extend(self):
+        store = FeatureStore('polygons')
+        for i in range(3):
+            store.add(str(i), {'building': 'yes'}, ndref=np.zeros((4, 2), dtype=np.int32) + i, indref=[])
+
+        selected = store.select([True, False, True])
+        self.assertEqual(selected.ids, ['0', '2'])
+        self.assertEqual([ndref[0, 0] for ndref in selected.ndref], [0.0, 2.0])
+        self.assertEqual(selected.indref, [[], []])
+        self.assertEqual(len(store), 3)
+
+        selected.extend(store.select([False, True, False]))
+        self.assertEqual(selected.ids, ['0', '2', '1'])
+        self.assertEqual(len(selected.ndref), 3)
+
+    def test_feature_stores(self):
+        stores = feature_stores()
+        self.assertEqual(tuple(stores), FEATURE_ENTITY_TYPES)
+        self.assertEqual([store.entity_type for store in stores.values()], list(FEATURE_ENTITY_TYPES))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import io
+import json
+import unittest
+from src.osm_osw_reformatter.serializer.osm.osm_geojson import dump_feature_collection
+
+
+class TestDumpFeatureCollection(unittest.TestCase):
+    def test_same_text_as_json_dump(self):
+        features = [
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [i * 0.1, -i / 3]},
+             'properties': {'_id': str(i), 'name': 'café "A"', 'length': i * 1.5, 'empty': None}}
+            for i in range(25)
+        ]
+        for fc in (
+            {'$schema': 'schema', 'type': 'FeatureCollection', 'features': features},
+            {'type': 'FeatureCollection', 'features': []},
+            {'features': features[:1], 'type': 'FeatureCollection'},
+        ):
+            expected = io.StringIO()
+            json.dump(fc, expected)
+            for chunk_size in (1, 7, 1000):
+                f = io.StringIO()
+                dump_feature_collection(fc, f, chunk_size)
+                self.assertEqual(f.getvalue(), expected.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
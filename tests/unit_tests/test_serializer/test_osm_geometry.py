@@ -0,0 +1,50 @@
+import json
+import pickle
+import unittest
+import numpy as np
+from shapely.geometry import LineString, Point, Polygon, mapping, shape
+from src.osm_osw_reformatter.serializer.osm.osm_geometry import LazyGeometry, round_coordinates
+
+
+class TestLazyGeometry(unittest.TestCase):
+    def test_matches_shapely(self):
+        ring = np.array([[0.0, 0.0], [2.0, 0.0], [2.0, 2.0], [0.0, 2.0], [0.0, 0.0]])
+        hole = np.array([[0.5, 0.5], [1.0, 0.5], [1.0, 1.0]])
+        cases = [
+            (LazyGeometry.point(1.5, 2.5), Point(1.5, 2.5)),
+            (LazyGeometry.line_string(ring[:3]), LineString(ring[:3])),
+            (LazyGeometry.polygon(ring, [hole]), Polygon(ring, [hole])),
+        ]
+        for geometry, expected in cases:
+            self.assertEqual(geometry.to_shape(), expected)
+            self.assertTrue(shape(geometry).equals(expected))
+            # Same GeoJSON as from shapely's mapping
+            self.assertEqual(json.dumps(mapping(geometry)), json.dumps(mapping(expected)))
+
+    def test_polygon_rings_are_closed(self):
+        geometry = LazyGeometry.polygon(np.array([[0, 0], [1, 0], [1, 1]]))
+        self.assertEqual(mapping(geometry)['coordinates'], [[[0, 0], [1, 0], [1, 1], [0, 0]]])
+
+    def test_geojson_precision(self):
+        geometry = LazyGeometry.line_string(np.array([[-122.12345678, 47.00000049], [0.25, -0.35]]))
+        self.assertEqual(geometry.geojson(2)['coordinates'], [[-122.12, 47.0], [0.25, -0.35]])
+        self.assertEqual(geometry.geojson(), mapping(geometry))
+        point = LazyGeometry.point(-122.12345678, 47.00000049)
+        self.assertEqual(point.geojson(5), {'type': 'Point', 'coordinates': [-122.12346, 47.0]})
+
+    def test_round_coordinates_arrays_and_numbers_agree(self):
+        values = np.random.default_rng(0).uniform(-180, 180, 10000)
+        for precision in (0, 3, 7):
+            self.assertEqual(round_coordinates(values, precision).tolist(),
+                             round_coordinates(values.tolist(), precision))
+        self.assertEqual(round_coordinates(((1.26, 2.0), (3.0, 4.0)), 1), [[1.3, 2.0], [3.0, 4.0]])
+        self.assertIs(round_coordinates(values, None), values)
+
+    def test_pickle(self):
+        geometry = pickle.loads(pickle.dumps(LazyGeometry.line_string(np.array([[0.0, 1.0], [2.0, 3.0]]))))
+        self.assertEqual(geometry.type, 'LineString')
+        self.assertEqual(geometry.coordinates.tolist(), [[0.0, 1.0], [2.0, 3.0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,11 +2,15 @@ import os
 import json
 import unittest
 from unittest.mock import MagicMock, patch
+import osmium
+import numpy as np
 import networkx as nx
 from shapely.geometry import LineString, Point, Polygon, mapping
 import json
 from src.osm_osw_reformatter.serializer.osm.osm_graph import OSMGraph, OSMWayParser, OSMNodeParser, OSMPointParser, \
-    OSMLineParser, OSMZoneParser, OSMPolygonParser
+    OSMLineParser, OSMZoneParser, OSMPolygonParser, OSMAreaParser, coordinate_array, osm_buffer_format, KIND, \
+    KIND_KERB
+from src.osm_osw_reformatter.serializer.osm.osm_geometry import LazyGeometry
 
 
 class TestOSMGraph(unittest.TestCase):
@@ -188,12 +192,13 @@ class TestOSMGraph(unittest.TestCase):
             mock_normalize.return_value = {"normalized_point": "mock_value"}
 
             parser = OSMPointParser(self.mock_graph, progressbar=mock_progressbar)
+            store = parser.store
 
             # Provide valid tags
             valid_tags = {"place": "city"}
 
             # Mock the node
-            node_mock = MagicMock(tags=valid_tags, id=1, location=MagicMock(lon=10, lat=20))
+            node_mock = MagicMock(tags=valid_tags, id=1, location=MagicMock(x=100000000, y=200000000))
 
             # Call the node method
             parser.node(node_mock)
@@ -201,11 +206,11 @@ class TestOSMGraph(unittest.TestCase):
             # Assert progress bar update was called
             mock_progressbar.update.assert_called_once()
 
-            # Verify the point was added to the graph
-            added_nodes = list(self.mock_graph.nodes(data=True))
-            self.assertEqual(len(added_nodes), 1)
-            self.assertEqual(added_nodes[0][1]["lon"], 10)
-            self.assertEqual(added_nodes[0][1]["lat"], 20)
+            # Verify the point was added to the store, not the graph
+            self.assertEqual(len(self.mock_graph.nodes), 0)
+            self.assertEqual(store.ids, ["1"])
+            self.assertEqual(store.tags, [{"normalized_point": "mock_value"}])
+            self.assertEqual(store.location(0), (10.0, 20.0))
 
     def test_zone_parser(self):
         mock_progressbar = MagicMock()
@@ -216,12 +221,13 @@ class TestOSMGraph(unittest.TestCase):
             mock_normalize.return_value = {"normalized_zone": "mock_value"}
 
             parser = OSMZoneParser(self.mock_graph, progressbar=mock_progressbar)
+            store = parser.store
 
             # Provide valid tags
             valid_tags = {"landuse": "residential"}
 
             # Mock outer ring with valid node data
-            mock_node = MagicMock(ref=1, lon=10, lat=20)
+            mock_node = MagicMock(ref=1, x=100000000, y=200000000)
             area_mock = MagicMock(
                 tags=valid_tags,
                 id=1,
@@ -235,11 +241,12 @@ class TestOSMGraph(unittest.TestCase):
             # Assert progress bar update was called
             mock_progressbar.update.assert_called_once()
 
-            # Verify the zone node was added to the graph
-            added_nodes = list(self.mock_graph.nodes(data=True))
-            self.assertEqual(len(added_nodes), 2)
-            self.assertEqual(added_nodes[0][1]["lon"], 10)
-            self.assertEqual(added_nodes[0][1]["lat"], 20)
+            # Verify the outline node was added to the graph and the zone
+            # to the store
+            self.assertEqual(list(self.mock_graph.nodes), [1])
+            self.assertEqual(parser.coordinates.degrees([1]).tolist(), [[10.0, 20.0]])
+            self.assertEqual(store.ids, ["1"])
+            self.assertEqual(store.ndref, [["1"]])
 
     def test_polygon_parser(self):
         mock_progressbar = MagicMock()
@@ -276,6 +283,22 @@ class TestOSMGraph(unittest.TestCase):
         # Verify no edges were added for the invalid way
         self.assertEqual(len(self.mock_graph.edges), 0)
 
+    def test_way_parser_builds_graph_at_end(self):
+        def node(ref, x):
+            return MagicMock(ref=ref, x=x, y=0, location=MagicMock(valid=lambda: True))
+
+        parser = OSMWayParser(None)
+        parser.way(MagicMock(tags={"highway": "footway", "footway": "sidewalk"}, id=7,
+                             nodes=[node(3, 10), node(1, 20), node(2, 30)]))
+        self.assertEqual(len(parser.G), 0)
+
+        G = parser.build_graph()
+        self.assertIs(G, parser.G)
+        self.assertEqual(list(G.nodes), [3, 1, 2])
+        self.assertEqual([(u, v, d['segment'], d['ndref']) for u, v, d in G.edges(data=True)],
+                         [(3, 1, 0, [3, 1]), (1, 2, 1, [1, 2])])
+        self.assertEqual(parser.coordinates.degrees([1, 2, 3])[:, 0].tolist(), [2e-6, 3e-6, 1e-6])
+
     def test_node_parser_missing_node(self):
         mock_progressbar = MagicMock()
         parser = OSMNodeParser(self.mock_graph, progressbar=mock_progressbar)
@@ -298,6 +321,7 @@ class TestOSMGraph(unittest.TestCase):
 
             # Create a parser
             parser = OSMLineParser(self.mock_graph, progressbar=mock_progressbar)
+            store = parser.store
 
             # Pass a way with no nodes
             parser.way(MagicMock(tags={"railway": "light_rail"}, id=1, nodes=[]))
@@ -305,9 +329,9 @@ class TestOSMGraph(unittest.TestCase):
             # Assert progress bar was updated once
             mock_progressbar.update.assert_called_once()
 
-            # Assert no nodes or edges were added
-            self.assertEqual(len(self.mock_graph.nodes), 1)
-            self.assertEqual(len(self.mock_graph.edges), 0)
+            # Assert the line went to the store, without coordinates
+            self.assertEqual(len(store), 1)
+            self.assertEqual(store.ndref[0].shape, (0, 2))
 
     def test_construct_geometries_missing_node_attributes(self):
         # Add edge with references to missing nodes
@@ -331,6 +355,18 @@ class TestOSMGraph(unittest.TestCase):
         edges = list(self.osm_graph.get_graph().edges(data=True))
         self.assertEqual(len(edges), 1)
 
+    def test_removable_nodes(self):
+        # 1 -> 2 -> 3 -> 4 -> 5 on way 1, 6 -> 3 on way 2, 5 -> 7 on way "1"
+        for u, v, osm_id, segment in [(1, 2, 1, 0), (2, 3, 1, 1), (3, 4, 1, 2), (4, 5, 1, 3), (6, 3, 2, 0),
+                                      (5, 7, "1", 0), (7, 8, "1", 1)]:
+            self.mock_graph.add_edge(u, v, osm_id=osm_id, segment=segment, ndref=[u, v])
+
+        self.assertEqual(self.osm_graph.removable_nodes(set()), [(1, 2, 3, 0), (3, 4, 5, 2), (5, 7, 8, 0)])
+
+        self.mock_graph.nodes[2][KIND] = KIND_KERB
+        self.assertEqual(self.osm_graph.removable_nodes({"4"}, keep={7}), [])
+        self.assertEqual(OSMGraph(nx.MultiDiGraph()).removable_nodes(set()), [])
+
     def test_to_geojson_empty_graph(self):
         # Paths for test files
         edges_path = "test_edges_empty.geojson"
@@ -341,9 +377,10 @@ class TestOSMGraph(unittest.TestCase):
         polygons_path = "test_polygons_empty.geojson"
 
         # Call the method under test
-        self.osm_graph.to_geojson(
+        counts = self.osm_graph.to_geojson(
             nodes_path, edges_path, points_path, lines_path, zones_path, polygons_path
         )
+        self.assertEqual(set(counts.values()), {0})
 
         # Verify the files do not exist since the graph is empty
         for path in [edges_path, nodes_path, points_path, lines_path, zones_path, polygons_path]:
@@ -354,14 +391,117 @@ class TestOSMGraph(unittest.TestCase):
             if os.path.exists(path):
                 os.remove(path)
 
+    def test_to_geojson_precision(self):
+        self.mock_graph.add_node(1, geometry=LazyGeometry.point(-122.123456789, 47.1))
+        self.mock_graph.add_node(2, geometry=Point(-122.2, 47.987654321))
+        self.mock_graph.add_edge(1, 2, geometry=LazyGeometry.line_string(
+            np.array([[-122.123456789, 47.1], [-122.2, 47.987654321]])))
+        paths = [f"test_{name}_precision.geojson" for name in ("nodes", "edges", "points", "lines", "zones",
+                                                                "polygons")]
+
+        for precision, expected in ((None, [-122.123456789, 47.987654321]), (7, [-122.1234568, 47.9876543]),
+                                    (3, [-122.123, 47.988])):
+            self.osm_graph.to_geojson(*paths, precision=precision)
+            with open(paths[0]) as f:
+                nodes = [feature["geometry"]["coordinates"] for feature in json.load(f)["features"]]
+            with open(paths[1]) as f:
+                coordinates = json.load(f)["features"][0]["geometry"]["coordinates"]
+            self.assertEqual([coordinates[0][0], coordinates[1][1]], expected)
+            # Edge ends stay equal to their nodes
+            self.assertEqual([coordinates[0], coordinates[-1]], nodes)
+
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_to_feature_collections_spatial_order(self):
+        # Nodes on a line, added out of order
+        xs = [5, 0, 9, 2, 7, 1, 8, 3, 6, 4]
+        for x in xs:
+            self.mock_graph.add_node(x, geometry=LazyGeometry.point(float(x), 0.0))
+        for a, b in zip(xs, xs[1:]):
+            self.mock_graph.add_edge(a, b, geometry=LazyGeometry.line_string(np.array([[a, 0.0], [b, 0.0]])))
+        self.osm_graph.features['points'].add('p1', {}, 0, 0)
+        self.osm_graph.features['points'].geometry.append(LazyGeometry.point(0.0, 0.0))
+
+        unordered = self.osm_graph.to_feature_collections(['edges', 'nodes', 'points'])
+        for order in ('hilbert', 'z'):
+            collections = self.osm_graph.to_feature_collections(['edges', 'nodes', 'points'], order=order)
+            nodes = [feature['properties']['_id'] for feature in collections['nodes']['features']]
+            self.assertIn(nodes, [[str(x) for x in range(10)], [str(x) for x in reversed(range(10))]])
+            edges = collections['edges']['features']
+            self.assertEqual([edge['properties']['_id'] for edge in edges], [str(i) for i in range(1, 10)])
+            self.assertEqual(
+                sorted((edge['properties']['_u_id'], edge['properties']['_v_id']) for edge in edges),
+                sorted((edge['properties']['_u_id'], edge['properties']['_v_id'])
+                       for edge in unordered['edges']['features'])
+            )
+            self.assertEqual(collections['points'], unordered['points'])
+
+        with self.assertRaises(ValueError):
+            self.osm_graph.to_feature_collections(order='random')
+
+    def test_to_feature_collections_empty_graph(self):
+        collections = self.osm_graph.to_feature_collections()
+        self.assertEqual(set(collections), {'edges', 'nodes', 'points', 'lines', 'zones', 'polygons'})
+        for fc in collections.values():
+            self.assertEqual(fc['type'], 'FeatureCollection')
+            self.assertEqual(fc['features'], [])
+
+    def test_to_feature_collections_entity_types(self):
+        self.mock_graph.add_node(1, lon=0.0, lat=0.0, geometry=Point(0, 0))
+        self.mock_graph.add_node(2, lon=1.0, lat=1.0, geometry=Point(1, 1))
+        self.mock_graph.add_edge(1, 2, geometry=LineString([(0, 0), (1, 1)]), highway='footway')
+
+        collections = self.osm_graph.to_feature_collections(['edges'])
+        self.assertEqual(list(collections), ['edges'])
+        self.assertEqual(len(collections['edges']['features']), 1)
+
+        collections = self.osm_graph.to_feature_collections(['nodes', 'points'])
+        self.assertEqual(list(collections), ['nodes', 'points'])
+        self.assertEqual(len(collections['nodes']['features']), 2)
+
+    def test_coordinate_array(self):
+        coords = coordinate_array([MagicMock(x=10000000, y=20000000), MagicMock(x=-30000000, y=40000000)])
+        self.assertEqual(coords.shape, (2, 2))
+        self.assertEqual(coords.dtype, np.int32)
+        self.assertEqual(coords.tolist(), [[10000000, 20000000], [-30000000, 40000000]])
+        self.assertEqual(coordinate_array([]).shape, (0, 2))
+        # Undefined locations
+        with self.assertRaises(osmium.InvalidLocationError):
+            coordinate_array([MagicMock(x=2147483647, y=2147483647)])
+
+    def test_area_parser_delegates(self):
+        zone_parser = MagicMock()
+        polygon_parser = MagicMock()
+        line_parser = MagicMock()
+        parser = OSMAreaParser([zone_parser, polygon_parser], line_parser)
+        way, area = MagicMock(), MagicMock()
+
+        parser.way(way)
+        parser.area(area)
+
+        line_parser.way.assert_called_once_with(way)
+        zone_parser.area.assert_called_once_with(area)
+        polygon_parser.area.assert_called_once_with(area)
+        OSMAreaParser([zone_parser]).way(way)
+
+    def test_osm_buffer_format(self):
+        self.assertEqual(osm_buffer_format(b'<?xml version="1.0"?><osm/>'), 'osm')
+        self.assertEqual(osm_buffer_format(b'\n  <osm version="0.6"/>'), 'osm')
+        self.assertEqual(osm_buffer_format(b'\x1f\x8b\x08\x00'), 'osm.gz')
+        self.assertEqual(osm_buffer_format(b'BZh91AY'), 'osm.bz2')
+        self.assertEqual(osm_buffer_format(b'\x00\x00\x00\x0d\x0a\x09OSMHeader'), 'pbf')
+
     def test_polygon_parser_with_inner_rings(self):
         mock_progressbar = MagicMock()
 
         # Mock polygon data
-        outer_mock = [MagicMock(ref=1, lon=10, lat=20)]
-        inner_mock = [[MagicMock(lon=5, lat=5)]]
+        outer_mock = [MagicMock(ref=1, x=10, y=20)]
+        inner_mock = [[MagicMock(x=5, y=5)]]
 
         parser = OSMPolygonParser(self.mock_graph, progressbar=mock_progressbar)
+        store = parser.store
 
         # Call the `area` method with mocked data
         parser.area(
@@ -376,14 +516,10 @@ class TestOSMGraph(unittest.TestCase):
         # Assert progress bar update was called
         mock_progressbar.update.assert_called_once()
 
-        # Verify that the outer and inner rings are added to the graph
-        added_nodes = list(self.mock_graph.nodes(data=True))
-        self.assertEqual(len(added_nodes), 1)
-
-        # Verify the outer and inner ring data
-        added_node_data = added_nodes[0][1]
-        self.assertIn("ndref", added_node_data)
-        self.assertIn("indref", added_node_data)
+        # Verify that the outer and inner rings are added to the store
+        self.assertEqual(len(store), 1)
+        self.assertEqual(len(store.ndref), 1)
+        self.assertEqual([ring.tolist() for ring in store.indref[0]], [[[5, 5]]])
 
     def test_construct_geometries_point_node(self):
         # Mock a point node
@@ -400,32 +536,69 @@ class TestOSMGraph(unittest.TestCase):
         ):
             self.osm_graph.construct_geometries()
 
-        # Verify the geometry was added to the node
-        node_data = self.mock_graph.nodes[1]
-        self.assertIn("geometry", node_data)
+        # Verify the geometry was added to the node, as coordinates until
+        # get_graph makes it a shapely geometry
+        self.assertEqual(mapping(self.mock_graph.nodes[1]["geometry"]), {"type": "Point", "coordinates": [10.0, 20.0]})
+        node_data = self.osm_graph.get_graph().nodes[1]
         self.assertIsInstance(node_data["geometry"], Point)
         self.assertEqual(node_data["geometry"].x, 10.0)
         self.assertEqual(node_data["geometry"].y, 20.0)
 
     def test_construct_geometries_line_node(self):
-        # Mock a line node
-        self.mock_graph.add_node(
-            1,
-            ndref=[[1.0, 1.0], [2.0, 2.0], [3.0, 3.0]],
-        )
+        # Mock a line
+        lines = self.osm_graph.features['lines']
+        lines.add("1", {"barrier": "fence"}, ndref=np.array([[1, 1], [2, 2], [3, 3]]) * 10000000)
 
-        # Mock OSWLineNormalizer.osw_line_filter to always return True
-        with unittest.mock.patch(
-                "src.osm_osw_reformatter.serializer.osw.osw_normalizer.OSWLineNormalizer.osw_line_filter",
-                return_value=True,
-        ):
+        self.osm_graph.construct_geometries()
+
+        # Verify the geometry was added to the line
+        self.assertIsInstance(lines.geometry[0].to_shape(), LineString)
+        self.assertEqual(len(lines.geometry[0].to_shape().coords), 3)
+        self.assertGreater(lines.tags[0]["length"], 0)
+        self.assertEqual(lines.ndref, [])
+
+    def test_parsers_record_kind(self):
+        self.mock_graph.add_node(1, lon=0.0, lat=0.0)
+        self.mock_graph.add_node(2, lon=1.0, lat=0.0)
+        OSMNodeParser(self.mock_graph).node(MagicMock(tags={"barrier": "kerb", "kerb": "lowered"}, id=1))
+
+        kinds = {n: d.get(KIND) for n, d in self.mock_graph.nodes(data=True)}
+        self.assertEqual(kinds, {1: KIND_KERB, 2: None})
+
+    def test_stages_skip_classification(self):
+        self.mock_graph.add_node(1, lon=0.0, lat=0.0, _kind=KIND_KERB)
+        self.mock_graph.add_node(2, lon=1.0, lat=0.0)
+        self.mock_graph.add_node(3, lon=2.0, lat=0.0)
+        features = self.osm_graph.features
+        features['points'].add('4', {'emergency': 'fire_hydrant'}, x=30000000, y=0)
+        features['lines'].add('5', {'barrier': 'fence'}, ndref=np.array([[0, 10000000], [10000000, 10000000]]))
+        features['zones'].add('6', {'highway': 'pedestrian'}, ndref=['1', '2', '3', '1'], indref=[])
+        self.mock_graph.add_edge(1, 2, osm_id=7, segment=0, ndref=[1, 2])
+        self.mock_graph.add_edge(2, 3, osm_id=7, segment=1, ndref=[2, 3])
+
+        # No stage classifies tags again
+        normalizer = 'src.osm_osw_reformatter.serializer.osm.osm_graph.'
+        with patch(normalizer + 'OSWNodeNormalizer') as node_normalizer, \
+                patch(normalizer + 'OSWPointNormalizer') as point_normalizer, \
+                patch(normalizer + 'OSWLineNormalizer') as line_normalizer, \
+                patch(normalizer + 'OSWZoneNormalizer') as zone_normalizer, \
+                patch(normalizer + 'OSWPolygonNormalizer') as polygon_normalizer:
+            self.osm_graph.simplify()
             self.osm_graph.construct_geometries()
+            collections = self.osm_graph.to_feature_collections()
+        for mock in (node_normalizer, point_normalizer, line_normalizer, zone_normalizer, polygon_normalizer):
+            self.assertEqual(mock.mock_calls, [])
 
-        # Verify the geometry was added to the node
-        node_data = self.mock_graph.nodes[1]
-        self.assertIn("geometry", node_data)
-        self.assertIsInstance(node_data["geometry"], LineString)
-        self.assertEqual(len(node_data["geometry"].coords), 3)
+        # Node 2 is shared with the zone, so the way is not merged
+        self.assertEqual(len(collections['edges']['features']), 2)
+        counts = {name: len(fc['features']) for name, fc in collections.items()}
+        self.assertEqual(counts, {'edges': 2, 'nodes': 3, 'points': 1, 'lines': 1, 'zones': 1, 'polygons': 0})
+        for fc in collections.values():
+            for feature in fc['features']:
+                self.assertNotIn(KIND, feature['properties'])
+        self.assertEqual(collections['zones']['features'][0]['properties'],
+                         {'highway': 'pedestrian', '_w_id': ['1', '2', '3', '1'], '_id': '6'})
+        self.assertEqual([f['properties']['_id'] for f in collections['nodes']['features']], ['1', '2', '3'])
 
 
 
@@ -491,6 +664,35 @@ class TestFromGeoJSON(unittest.TestCase):
         self.assertEqual(len(osm_graph.get_graph().nodes), 1)
         self.assertEqual(len(osm_graph.get_graph().edges), 1)
 
+    def test_simplify_keeps_kerbs(self):
+        def write(kerb_tags):
+            nodes = [
+                {"type": "Feature", "geometry": {"type": "Point", "coordinates": [i, i]},
+                 "properties": {"_id": str(i), **(kerb_tags if i == 2 else {})}}
+                for i in (1, 2, 3)
+            ]
+            edges = [
+                {"type": "Feature", "geometry": {"type": "LineString", "coordinates": [[u, u], [u + 1, u + 1]]},
+                 "properties": {"_u_id": str(u), "_v_id": str(u + 1), "osm_id": 1, "segment": u,
+                                "ndref": [str(u), str(u + 1)]}}
+                for u in (1, 2)
+            ]
+            with open(self.nodes_path, "w") as f:
+                json.dump({"type": "FeatureCollection", "features": nodes}, f)
+            with open(self.edges_path, "w") as f:
+                json.dump({"type": "FeatureCollection", "features": edges}, f)
+
+        write({"barrier": "kerb", "kerb": "lowered"})
+        osm_graph = OSMGraph.from_geojson(self.nodes_path, self.edges_path)
+        self.assertEqual(osm_graph.G.nodes["2"][KIND], KIND_KERB)
+        osm_graph.simplify()
+        self.assertEqual(sorted(osm_graph.G.edges()), [("1", "2"), ("2", "3")])
+
+        write({"highway": "street_lamp"})
+        osm_graph = OSMGraph.from_geojson(self.nodes_path, self.edges_path)
+        self.assertNotIn(KIND, osm_graph.G.nodes["2"])
+        osm_graph.simplify()
+        self.assertEqual(list(osm_graph.G.edges(data="ndref")), [("1", "3", ["1", "2", "3"])])
 
 
 if __name__ == "__main__":
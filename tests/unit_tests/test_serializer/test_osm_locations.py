@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+import osmium
+import numpy as np
+from src.osm_osw_reformatter.serializer.osm.osm_graph import OSMGraph
+from src.osm_osw_reformatter.serializer.osm.osm_locations import NodeLocationCache
+from src.osm_osw_reformatter.helpers.osw import OSWHelper
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_FILE = os.path.join(ROOT_DIR, 'test_files/wa.microsoft.osm.pbf')
+
+
+def plain_nodes(G) -> dict:
+    '''Node attributes with coordinate arrays as lists, for comparisons.'''
+    return {
+        n: {key: value.tolist() if isinstance(value, np.ndarray) else
+            [ring.tolist() for ring in value] if key == 'indref' else value for key, value in d.items()}
+        for n, d in G.nodes(data=True)
+    }
+
+
+class WayLocationCounter(osmium.SimpleHandler):
+    def __init__(self):
+        super().__init__()
+        self.ways = 0
+        self.invalid = 0
+
+    def way(self, w):
+        self.ways += 1
+        for n in w.nodes:
+            if not n.location.valid():
+                self.invalid += 1
+
+
+class TestNodeLocationCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_path_is_keyed_by_input(self):
+        cache = NodeLocationCache(TEST_FILE, self.cache_dir)
+        self.assertTrue(cache.path.name.startswith('wa.microsoft.osm.pbf.'))
+        self.assertTrue(cache.path.name.endswith('.nodes.idx'))
+        self.assertEqual(cache.path, NodeLocationCache(TEST_FILE, self.cache_dir).path)
+
+    def test_defaults_to_input_directory(self):
+        cache = NodeLocationCache(TEST_FILE)
+        self.assertEqual(str(cache.path.parent), os.path.dirname(TEST_FILE))
+
+    def test_build_then_reuse(self):
+        cache = NodeLocationCache(TEST_FILE, self.cache_dir)
+        self.assertFalse(cache.exists())
+
+        first = WayLocationCounter()
+        cache.apply(first)
+        self.assertTrue(cache.exists())
+        self.assertEqual(os.listdir(self.cache_dir), [cache.path.name])
+        mtime = os.path.getmtime(cache.path)
+
+        second = WayLocationCounter()
+        NodeLocationCache(TEST_FILE, self.cache_dir).apply(second)
+
+        self.assertEqual(first.ways, 4630)
+        self.assertEqual(second.ways, first.ways)
+        self.assertEqual(second.invalid, first.invalid)
+        self.assertEqual(os.path.getmtime(cache.path), mtime)
+
+    def test_from_osm_file_matches_uncached(self):
+        filters = (
+            OSWHelper.osw_way_filter,
+            OSWHelper.osw_node_filter,
+            OSWHelper.osw_point_filter,
+            OSWHelper.osw_line_filter
+        )
+        expected = OSMGraph.from_osm_file(TEST_FILE, *filters)
+        for _ in range(2):
+            OG = OSMGraph.from_osm_file(TEST_FILE, *filters, node_cache_dir=self.cache_dir)
+            self.assertEqual(plain_nodes(OG.G), plain_nodes(expected.G))
+            self.assertEqual(list(OG.G.edges(data=True)), list(expected.G.edges(data=True)))
+            for actual, wanted in zip(OG.coordinates.arrays(), expected.coordinates.arrays()):
+                np.testing.assert_array_equal(actual, wanted)
+
+
+if __name__ == '__main__':
+    unittest.main()
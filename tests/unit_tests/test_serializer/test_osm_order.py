@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+from shapely.geometry import LineString, Point
+from src.osm_osw_reformatter.serializer.osm.osm_geometry import LazyGeometry
+from src.osm_osw_reformatter.serializer.osm.osm_order import geometry_centers, hilbert_index, spatial_order, z_index
+
+
+class TestCurves(unittest.TestCase):
+    def test_hilbert_index_visits_neighbors(self):
+        x, y = (a.ravel() for a in np.meshgrid(np.arange(16), np.arange(16)))
+        index = hilbert_index(x, y, bits=4)
+        self.assertEqual(sorted(index.tolist()), list(range(256)))
+        path = np.argsort(index)
+        steps = np.abs(np.diff(x[path])) + np.abs(np.diff(y[path]))
+        self.assertTrue((steps == 1).all())
+        self.assertEqual((x[path[0]], y[path[0]]), (0, 0))
+        self.assertEqual((x[path[-1]], y[path[-1]]), (15, 0))
+
+    def test_z_index_interleaves_bits(self):
+        self.assertEqual(z_index(np.array([0, 1, 0, 1, 2, 3, 0]), np.array([0, 0, 1, 1, 0, 0, 2])).tolist(),
+                         [0, 1, 2, 3, 4, 5, 8])
+        self.assertEqual(z_index(np.array([0xFFFFFFFF]), np.array([0xFFFFFFFF])).tolist(), [2 ** 64 - 1])
+
+
+class TestSpatialOrder(unittest.TestCase):
+    def test_geometry_centers(self):
+        geometries = [
+            LazyGeometry.point(1.0, 2.0),
+            LazyGeometry.line_string(np.array([[0.0, 0.0], [4.0, 1.0], [2.0, 3.0]])),
+            LazyGeometry.polygon(np.array([[10.0, 10.0], [12.0, 10.0], [12.0, 14.0]])),
+            LineString([(-1, -1), (1, 3)]),
+            Point(),
+        ]
+        centers = geometry_centers(geometries)
+        self.assertEqual(centers[:4].tolist(), [[1.0, 2.0], [2.0, 1.5], [11.0, 12.0], [0.0, 1.0]])
+        self.assertTrue(np.isnan(centers[4]).all())
+
+    def test_spatial_order(self):
+        # Two far apart clusters, interleaved
+        geometries = [LazyGeometry.point(i % 2 * 10 + i / 100, i % 2 * 10) for i in range(10)]
+        for order in ('hilbert', 'z'):
+            indices = spatial_order(geometries, order).tolist()
+            self.assertEqual(sorted(indices), list(range(10)))
+            self.assertEqual({i % 2 for i in indices[:5]}, {indices[0] % 2})
+        # Ties keep their order
+        same = [LazyGeometry.point(1.0, 1.0)] * 3 + [Point()]
+        self.assertEqual(spatial_order(same, 'hilbert').tolist(), [0, 1, 2, 3])
+        self.assertEqual(spatial_order([], 'z').tolist(), [])
+
+    def test_unknown_order(self):
+        with self.assertRaises(ValueError):
+            spatial_order([LazyGeometry.point(1.0, 1.0)], 'peano')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+import unittest
+import networkx as nx
+import numpy as np
+from src.osm_osw_reformatter.serializer.osm.osm_tiles import TileGrid, split_tiles, stitch_tiles
+from src.osm_osw_reformatter.serializer.osm.osm_features import FeatureStore
+from src.osm_osw_reformatter.serializer.osm.osm_geometry import LazyGeometry
+from src.osm_osw_reformatter.helpers.osw import OSWHelper
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_FILE = os.path.join(ROOT_DIR, 'test_files/wa.microsoft.osm.pbf')
+
+
+def chain(*xs, osm_id=1, segment=0):
+    return {'osm_id': osm_id, 'segment': segment, 'geometry': LazyGeometry.line_string(np.array([(x, 0.0) for x in xs]))}
+
+
+def node(x):
+    return {'lon': x, 'lat': 0.0, 'geometry': LazyGeometry.point(x, 0.0)}
+
+
+class TestTileGrid(unittest.TestCase):
+    def test_partition_balances_weights(self):
+        weights = {(x, y): 1 for x in range(8) for y in range(8)}
+        grid = TileGrid.partition(weights, 4)
+
+        self.assertEqual(set(grid.cell_tiles), set(weights))
+        sizes = [list(grid.cell_tiles.values()).count(tile) for tile in range(4)]
+        self.assertEqual(sizes, [16, 16, 16, 16])
+        # Z-order runs of a square grid are its quadrants
+        self.assertEqual({grid.cell_tiles[(x, y)] for x in range(4) for y in range(4)}, {0})
+
+    def test_partition_never_exceeds_tiles(self):
+        weights = {(0, 0): 100, (0, 1): 1, (5, -3): 1}
+        grid = TileGrid.partition(weights, 8)
+        self.assertLessEqual(len(set(grid.cell_tiles.values())), 3)
+        self.assertEqual(TileGrid.partition({}, 4).cell_tiles, {})
+
+    def test_tile_of_location(self):
+        grid = TileGrid({(-12215, 4763): 3}, 0.01)
+        self.assertEqual(grid.tile(-122.141, 47.635), 3)
+        # Cells without way nodes belong to tile 0
+        self.assertEqual(grid.tile(10.0, 10.0), 0)
+
+
+class TestSplitTiles(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_split_tiles(self):
+        grid, paths = split_tiles(TEST_FILE, self.tmp_dir, 4, OSWHelper.osw_way_filter, OSWHelper.osw_point_filter,
+                                  OSWHelper.osw_line_filter)
+        self.assertEqual(set(grid.cell_tiles.values()), {0, 1, 2, 3})
+        self.assertEqual(sorted(paths), [0, 1, 2, 3])
+        self.assertTrue(all(os.path.getsize(path) > 0 for path in paths.values()))
+
+    def test_split_tiles_with_node_cache(self):
+        # A footway in each of four cells and poles in the first one, which
+        # weigh as much as all the ways
+        osm_file = os.path.join(self.tmp_dir, 'poles.osm')
+        with open(osm_file, 'w') as f:
+            f.write("<?xml version='1.0' encoding='UTF-8'?>\n<osm version='0.6'>\n")
+            for cell in range(4):
+                for i in range(2):
+                    lon = cell / 100 + 0.002 + i / 200
+                    f.write(f"<node id='{cell * 2 + i + 1}' version='1' lat='0.005' lon='{lon}'/>\n")
+            for i in range(8):
+                f.write(f"<node id='{i + 100}' version='1' lat='0.001' lon='0.001'><tag k='power' v='pole'/></node>\n")
+            for cell in range(4):
+                f.write(f"<way id='{cell + 10}' version='1'><nd ref='{cell * 2 + 1}'/><nd ref='{cell * 2 + 2}'/>"
+                        "<tag k='highway' v='footway'/></way>\n")
+            f.write("</osm>\n")
+
+        filters = (OSWHelper.osw_way_filter, OSWHelper.osw_point_filter, OSWHelper.osw_line_filter)
+        grid, _ = split_tiles(osm_file, self.tmp_dir, 2, *filters)
+        self.assertEqual(grid.cell_tiles, {(0, 0): 0, (1, 0): 1, (2, 0): 1, (3, 0): 1})
+        cache_dir = os.path.join(self.tmp_dir, 'cache')
+        # The first run builds the node cache, the second one maps it
+        for run in ('cold', 'warm'):
+            tile_dir = os.path.join(self.tmp_dir, run)
+            os.makedirs(tile_dir)
+            cached_grid, _ = split_tiles(osm_file, tile_dir, 2, *filters, node_cache_dir=cache_dir)
+            self.assertEqual(cached_grid.cell_tiles, grid.cell_tiles, run)
+
+
+class TestStitchTiles(unittest.TestCase):
+    def test_merges_chains_at_seams(self):
+        # Way 1 runs 1 - 2 | 3 - 4 | 5 across three tiles; 3 and 5 are seams
+        results = [
+            {'tile': 0, 'nodes': [(1, node(1)), (2, node(2))], 'edges': [(1, 3, chain(1, 2, 3))], 'seams': set()},
+            {'tile': 1, 'nodes': [(3, node(3)), (4, node(4))], 'edges': [(3, 5, chain(3, 4, 5, segment=2))],
+             'seams': {3}},
+            {'tile': 2, 'nodes': [(5, node(5)), (6, node(6))], 'edges': [(5, 6, chain(5, 6, segment=4))],
+             'seams': {5}},
+        ]
+        G = stitch_tiles(results).G
+
+        self.assertEqual(sorted(G.nodes), [1, 2, 4, 6])
+        (u, v, d), = G.edges(data=True)
+        self.assertEqual((u, v, d['segment']), (1, 6, 0))
+        self.assertEqual(d['geometry'].coordinates.tolist(), [[float(x), 0.0] for x in range(1, 7)])
+        self.assertGreater(d['length'], 0)
+
+    def test_keeps_chains_without_seams(self):
+        results = [{'tile': 0, 'nodes': [(1, node(1)), (2, node(2))], 'edges': [(1, 2, chain(1, 2))],
+                    'seams': set()}]
+        G = stitch_tiles(results).G
+        self.assertEqual(list(G.edges(data=True)), [(1, 2, results[0]['edges'][0][2])])
+
+    def test_joins_feature_stores(self):
+        results = []
+        for tile in range(2):
+            points = FeatureStore('points')
+            points.add(str(tile), {'power': 'pole'}, x=tile * 10000000, y=0)
+            results.append({'tile': tile, 'nodes': [], 'edges': [], 'features': {'points': points}, 'seams': set()})
+
+        OG = stitch_tiles(results)
+        self.assertEqual(OG.features['points'].ids, ['0', '1'])
+        self.assertEqual(OG.features['points'].location(1), (1.0, 0.0))
+        self.assertEqual(len(OG.features['lines']), 0)
+
+    def test_drops_closed_ways_of_seams(self):
+        # A closed way of removable nodes only, like simplify drops them
+        results = [
+            {'tile': 0, 'nodes': [(1, node(1))], 'edges': [(1, 2, chain(1, 2))], 'seams': {1}},
+            {'tile': 1, 'nodes': [(2, node(2))], 'edges': [(2, 1, chain(2, 1))], 'seams': {2}},
+        ]
+        G = stitch_tiles(results).G
+        self.assertEqual(nx.number_of_edges(G), 0)
+        self.assertEqual(nx.number_of_nodes(G), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
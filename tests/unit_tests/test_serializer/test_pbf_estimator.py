@@ -0,0 +1,44 @@
+import os
+import unittest
+from src.osm_osw_reformatter.serializer.pbf_estimator import estimate_pbf, PbfEstimate
+from src.osm_osw_reformatter.helpers.osw import OSWHelper
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_FILE = os.path.join(ROOT_DIR, 'test_files/wa.microsoft.osm.pbf')
+ZIP_FILE = os.path.join(ROOT_DIR, 'test_files/osw.zip')
+
+# Actual number of entities in the test file
+NODES = 17502
+WAYS = 4630
+
+
+class TestPbfEstimator(unittest.TestCase):
+    def test_estimate_counts(self):
+        estimate = estimate_pbf(TEST_FILE)
+        self.assertIsInstance(estimate, PbfEstimate)
+        self.assertEqual(estimate.blocks, 3)
+        self.assertAlmostEqual(estimate.nodes, NODES, delta=NODES * 0.1)
+        self.assertAlmostEqual(estimate.ways, WAYS, delta=WAYS * 0.1)
+        self.assertEqual(estimate.relations, 0)
+
+    def test_estimate_bbox(self):
+        min_lon, min_lat, max_lon, max_lat = estimate_pbf(TEST_FILE).bbox
+        self.assertAlmostEqual(min_lon, -122.143, places=3)
+        self.assertAlmostEqual(min_lat, 47.637, places=3)
+        self.assertAlmostEqual(max_lon, -122.132, places=3)
+        self.assertAlmostEqual(max_lat, 47.650, places=3)
+
+    def test_progress_total(self):
+        estimate = estimate_pbf(TEST_FILE)
+        self.assertEqual(estimate.progress_total, 2 * estimate.nodes + 2 * estimate.ways)
+
+    def test_not_a_pbf_file(self):
+        with self.assertRaises(ValueError):
+            estimate_pbf(ZIP_FILE)
+
+    def test_osw_helper_estimate_size(self):
+        self.assertEqual(OSWHelper.estimate_size(TEST_FILE), estimate_pbf(TEST_FILE))
+
+
+if __name__ == '__main__':
+    unittest.main()
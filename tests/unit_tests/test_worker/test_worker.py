@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import unittest
+from src.osm_osw_reformatter.worker.worker import JobQueue, WorkerService, run_job
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_FILE = os.path.join(ROOT_DIR, 'test_files/wa.microsoft.osm.pbf')
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.queue = JobQueue(os.path.join(self.tmp_dir, 'queue'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_submit_and_claim_in_order(self):
+        first = self.queue.submit('osm2osw', TEST_FILE, self.tmp_dir, prefix='first')
+        second = self.queue.submit('osm2osw', TEST_FILE, self.tmp_dir, prefix='second')
+        self.assertEqual(self.queue.pending(), 2)
+        self.assertEqual(self.queue.claim()['id'], first)
+        self.assertEqual(self.queue.claim()['id'], second)
+        self.assertIsNone(self.queue.claim())
+
+    def test_submit_rejects_unknown_direction(self):
+        with self.assertRaises(ValueError):
+            self.queue.submit('osm2geojson', TEST_FILE, self.tmp_dir)
+
+    def test_finish_writes_result(self):
+        job_id = self.queue.submit('osm2osw', TEST_FILE, self.tmp_dir)
+        job = self.queue.claim()
+        self.queue.finish(job, {'status': False, 'error': 'broken'})
+        result = self.queue.result(job_id)
+        self.assertEqual(result['error'], 'broken')
+        self.assertEqual(result['job']['id'], job_id)
+        self.assertEqual(os.listdir(os.path.join(self.queue.queue_dir, 'running')), [])
+
+    def test_fail_claimed(self):
+        job_id = self.queue.submit('osm2osw', TEST_FILE, self.tmp_dir)
+        self.queue.claim()
+        self.queue.fail_claimed(os.getpid(), 'crashed')
+        self.assertEqual(self.queue.result(job_id)['error'], 'crashed')
+
+    def test_run_job(self):
+        job_id = self.queue.submit('osm2osw', TEST_FILE, self.tmp_dir, prefix='job')
+        result = run_job(self.queue.claim())
+        self.assertTrue(result['status'])
+        self.assertEqual(result['worker'], os.getpid())
+        self.assertIn('stages', result['metrics'])
+        self.assertTrue(all(os.path.exists(file) for file in result['generated_files']))
+        self.assertIsNone(self.queue.result(job_id))
+
+    def test_run_job_missing_file(self):
+        self.queue.submit('osm2osw', 'missing.pbf', self.tmp_dir)
+        self.assertFalse(run_job(self.queue.claim())['status'])
+
+
+class TestWorkerService(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.queue_dir = os.path.join(self.tmp_dir, 'queue')
+        self.queue = JobQueue(self.queue_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _submit(self, n):
+        job_ids = []
+        for i in range(n):
+            workdir = os.path.join(self.tmp_dir, f'work{i}')
+            job_ids.append(self.queue.submit('osm2osw', TEST_FILE, workdir, prefix=f'job{i}'))
+        return job_ids
+
+    def test_runs_jobs_and_recycles_after_max_jobs(self):
+        job_ids = self._submit(3)
+        service = WorkerService(self.queue_dir, concurrency=2, max_jobs=1, poll_interval=0.05)
+        service.run(until_idle=True)
+
+        workers = set()
+        for job_id in job_ids:
+            result = self.queue.result(job_id)
+            self.assertTrue(result['status'], result.get('error'))
+            workers.add(result['worker'])
+        # Every worker ran a single job
+        self.assertEqual(len(workers), 3)
+        self.assertGreaterEqual(service.started_workers, 3)
+
+    def test_recycles_on_memory_threshold(self):
+        job_ids = self._submit(2)
+        service = WorkerService(self.queue_dir, concurrency=1, max_jobs=0, max_rss=1, poll_interval=0.05)
+        service.run(until_idle=True)
+        workers = {self.queue.result(job_id)['worker'] for job_id in job_ids}
+        self.assertEqual(len(workers), 2)
+
+    def test_runs_tiled_jobs(self):
+        workdir = os.path.join(self.tmp_dir, 'work')
+        job_id = self.queue.submit('osm2osw', TEST_FILE, workdir, prefix='tiled', tiles=2, processes=2)
+        WorkerService(self.queue_dir, concurrency=1, poll_interval=0.05).run(until_idle=True)
+        result = self.queue.result(job_id)
+        self.assertTrue(result['status'], result.get('error'))
+        self.assertIn('stitch', result['metrics']['stages'])
+
+
+if __name__ == '__main__':
+    unittest.main()